@@ -0,0 +1,160 @@
+"""Synthetic data and timing helpers shared by the benchmark commands."""
+
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from cities_light.models import Country, Region, SubRegion
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from farmers.models import Farmer, FarmersMarketTransaction
+from market.models import ContactPerson, Market, Produce
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run a block inside a database transaction that is always rolled back"""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+def timed(func, *args, **kwargs):
+    """Call `func` and return its result, the elapsed seconds and the query count"""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, elapsed, len(queries.captured_queries)
+
+
+def percentile(samples, pct):
+    """Return the `pct` percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def seed_location(state="Kano", lga="Kano Municipal"):
+    country, _ = Country.objects.get_or_create(code2="NG", defaults={"name": "Nigeria"})
+    region, _ = Region.objects.get_or_create(
+        name=state, country=country, defaults={"slug": f"bench-{state}"}
+    )
+    subregion, _ = SubRegion.objects.get_or_create(
+        name=lga, region=region, country=country, defaults={"slug": f"bench-{lga}"}
+    )
+    return country, region, subregion
+
+
+def seed_markets(count, produce_count=5):
+    """Create `count` markets that all sell `produce_count` new produce items"""
+    run = uuid.uuid4().hex[:8]
+    produce_items = Produce.objects.bulk_create(
+        Produce(name=f"bench-{run}-{i}", slug=f"bench-{run}-{i}")
+        for i in range(produce_count)
+    )
+    markets = []
+    for i in range(count):
+        contact_person = ContactPerson.objects.create(
+            first_name="Bench",
+            last_name=f"{run}-{i}",
+            phone_number=f"+2347{random.randrange(10**9):09d}",
+        )
+        market = Market.objects.create(
+            name=f"bench-{run}-{i}",
+            slug=f"bench-{run}-{i}",
+            contact_person=contact_person,
+        )
+        market.produce_items.set(produce_items)
+        markets.append(market)
+    return markets, produce_items
+
+
+def seed_farmers(count, batch_size=5000, locations=None):
+    """Bulk create `count` farmers spread over `locations`, return their ids"""
+    locations = locations or [seed_location()]
+    run = uuid.uuid4().hex[:8]
+    prefix = random.randrange(100)
+    first_id = (
+        Farmer.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+    ) + 1
+    farmers = (
+        Farmer(
+            first_name=random.choice(FIRST_NAMES),
+            last_name=random.choice(LAST_NAMES),
+            gender=random.choice("MF"),
+            date_of_birth=date(1960, 1, 1) + timedelta(days=random.randrange(16000)),
+            education=1,
+            country=country,
+            state=region,
+            state_of_origin=region,
+            lga=subregion,
+            phone_number=f"+2348{prefix:02d}{i:07d}",
+            identification_number=f"{run}{i:08d}",
+            slug=f"bench-{run}-{i}",
+        )
+        for i, (country, region, subregion) in (
+            (i, random.choice(locations)) for i in range(count)
+        )
+    )
+    for i in range(0, count, batch_size):
+        Farmer.objects.bulk_create(
+            [next(farmers) for _ in range(min(batch_size, count - i))]
+        )
+    return list(
+        Farmer.objects.filter(pk__gte=first_id, slug__startswith=f"bench-{run}-")
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def seed_market_transactions(farmer_ids, markets, produce_items, per_farmer, days=730):
+    """Bulk create `per_farmer` market transactions for every farmer"""
+    start = date.today() - timedelta(days=days)
+    transactions = []
+    for farmer_id in farmer_ids:
+        seen = set()
+        for _ in range(per_farmer):
+            key = (
+                random.choice(produce_items).pk,
+                random.choice(markets).pk,
+                start + timedelta(days=random.randrange(days)),
+            )
+            if key in seen:
+                continue
+            seen.add(key)
+            quantity = random.randint(1, 50)
+            transactions.append(
+                FarmersMarketTransaction(
+                    farmer_id=farmer_id,
+                    produce_id=key[0],
+                    market_id=key[1],
+                    transaction_date=key[2],
+                    quantity=quantity,
+                    points_earned=quantity,
+                )
+            )
+        if len(transactions) >= 5000:
+            FarmersMarketTransaction.objects.bulk_create(transactions)
+            transactions = []
+    FarmersMarketTransaction.objects.bulk_create(transactions)
+
+
+FIRST_NAMES = [
+    "Aisha", "Abdullahi", "Adebayo", "Amina", "Chinedu", "Fatima", "Ibrahim",
+    "Ngozi", "Oluwaseun", "Musa", "Halima", "Emeka", "Zainab", "Yusuf", "Kemi",
+]  # fmt: skip
+LAST_NAMES = [
+    "Abubakar", "Adeyemi", "Bello", "Eze", "Garba", "Ibrahim", "Mohammed",
+    "Nwosu", "Okafor", "Olawale", "Suleiman", "Usman", "Yakubu", "Danjuma",
+]  # fmt: skip
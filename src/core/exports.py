@@ -0,0 +1,173 @@
+"""
+Streaming CSV and JSON Lines exports of farmers, transactions and prices.
+
+Rows are read as tuples of the exported columns through a server-side cursor
+on PostgreSQL (fetched a chunk at a time elsewhere) and written out a batch
+of lines at a time, so memory stays the same however many rows are exported.
+"""
+
+import csv
+import json
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.functions import Cast
+
+from farmers.filters import FarmerFilter, InputTransactionFilter, TransactionFilter
+from farmers.models import (
+    ArchivedMarketTransaction,
+    Farmer,
+    FarmersInputTransaction,
+    FarmersMarketTransaction,
+)
+from market.filters import ProducePriceFilter
+from market.models import ProducePrice
+
+# Rows fetched from the cursor, and lines written out, at a time
+CHUNK_SIZE = 2000
+
+Export = namedtuple("Export", ["model", "filterset", "ordering", "columns"])
+
+# The stored text; parsing every number into a PhoneNumber is slow
+PHONE_NUMBER = Cast("phone_number", models.CharField())
+
+EXPORTS = {
+    "farmers": Export(
+        Farmer,
+        FarmerFilter,
+        ("pk",),
+        {
+            "id": "pk",
+            "slug": "slug",
+            "first_name": "first_name",
+            "last_name": "last_name",
+            "gender": "gender",
+            "date_of_birth": "date_of_birth",
+            "phone_number": PHONE_NUMBER,
+            "email": "email",
+            "identification_number": "identification_number",
+            "state": "state__name",
+            "lga": "lga__name",
+            "category_type": "category_type",
+            "farmsize": "farmsize",
+            "field_extension_officer": "field_extension_officer__slug",
+            "earned_points": "earned_points",
+            "is_verified": "is_verified",
+        },
+    ),
+    "market-transactions": Export(
+        FarmersMarketTransaction,
+        TransactionFilter,
+        ("transaction_date", "pk"),
+        {
+            "id": "pk",
+            "farmer": "farmer__slug",
+            "market": "market__name",
+            "produce": "produce__name",
+            "quantity": "quantity",
+            "transaction_date": "transaction_date",
+            "points_earned": "points_earned",
+        },
+    ),
+    "archived-market-transactions": Export(
+        ArchivedMarketTransaction,
+        TransactionFilter,
+        ("transaction_date", "pk"),
+        {
+            "id": "pk",
+            "farmer": "farmer__slug",
+            "market": "market__name",
+            "produce": "produce__name",
+            "quantity": "quantity",
+            "transaction_date": "transaction_date",
+            "points_earned": "points_earned",
+        },
+    ),
+    "input-transactions": Export(
+        FarmersInputTransaction,
+        InputTransactionFilter,
+        ("pk",),
+        {
+            "id": "pk",
+            "farmer": "farmer__slug",
+            "market": "market__name",
+            "vendor": "vendor__name",
+            "amount": "amount",
+            "receipt_number": "receipt_number",
+            "receipt_verification_date": "receipt_verification_date",
+            "points_earned": "points_earned",
+        },
+    ),
+    "produce-prices": Export(
+        ProducePrice,
+        ProducePriceFilter,
+        ("pk",),
+        {
+            "id": "pk",
+            "produce": "produce__name",
+            "market": "market_day__market__name",
+            "date": "market_day__date",
+            "price_type": "price_type",
+            "price": "price",
+        },
+    ),
+}
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/jsonl"}
+
+
+def rows(name, data=None, chunk_size=CHUNK_SIZE):
+    """
+    Return the headers of an export and an iterator over its rows, filtered by
+    `data` as its filterset would be. Raise ValidationError for invalid filters.
+    """
+    export = EXPORTS[name]
+    filterset = export.filterset(data or {}, queryset=export.model.objects.all())
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    queryset = filterset.qs.order_by(*export.ordering).values_list(
+        *export.columns.values()
+    )
+    return list(export.columns), queryset.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """A file-like object that returns what is written instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def _batched(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield "".join(batch)
+            batch = []
+    if batch:
+        yield "".join(batch)
+
+
+def to_csv(headers, rows, chunk_size=CHUNK_SIZE):
+    """Yield the CSV text of `rows` a batch of lines at a time"""
+    writer = csv.writer(_Echo())
+    lines = (writer.writerow(row) for row in rows)
+    yield writer.writerow(headers)
+    yield from _batched(lines, chunk_size)
+
+
+def to_jsonl(headers, rows, chunk_size=CHUNK_SIZE):
+    """Yield `rows` as JSON objects, one per line, a batch of lines at a time"""
+    lines = (json.dumps(dict(zip(headers, row)), default=str) + "\n" for row in rows)
+    yield from _batched(lines, chunk_size)
+
+
+RENDERERS = {"csv": to_csv, "jsonl": to_jsonl}
+
+
+def render(name, format, data=None, chunk_size=CHUNK_SIZE):
+    """Yield an export in `format` ("csv" or "jsonl") as chunks of text"""
+    headers, iterator = rows(name, data, chunk_size)
+    return RENDERERS[format](headers, iterator, chunk_size)
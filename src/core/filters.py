@@ -0,0 +1,93 @@
+"""
+Admin list filters that stay cheap however large the related table is.
+
+Django's RelatedFieldListFilter renders every related row as a sidebar
+option, so filtering transactions by farmer loads the whole farmer table on
+every page. AutocompleteFilter renders a select2 box instead, which searches
+the related model admin's autocomplete view a page at a time, and only the
+selected row is ever loaded when the changelist renders.
+"""
+
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.utils.translation import gettext_lazy as _
+
+# Searching from the second character keeps every lookup a prefix search
+MINIMUM_INPUT_LENGTH = 2
+
+
+class AutocompleteFilterForm(forms.Form):
+    def __init__(self, field, admin_site, name, label, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields[name] = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            to_field_name=field.target_field.attname,
+            label=label,
+            required=False,
+            widget=AutocompleteSelect(
+                field,
+                admin_site,
+                attrs={
+                    "data-minimum-input-length": MINIMUM_INPUT_LENGTH,
+                    "data-placeholder": _("All"),
+                    # select2 triggers the change on the underlying select
+                    "onchange": "this.form.submit()",
+                },
+            ),
+        )
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Filter by a foreign key, e.g. `list_filter = [("farmer", AutocompleteFilter)]`.
+    The related model admin needs search_fields, and the model admin using the
+    filter AutocompleteFilterMixin for the select2 scripts.
+    """
+
+    template = "admin/autocomplete_filter.html"
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.name}__exact"
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.admin_site = model_admin.admin_site
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def has_output(self):
+        return True
+
+    def value(self):
+        return self.lookup_val[-1] if self.lookup_val else None
+
+    def choices(self, changelist):
+        form = AutocompleteFilterForm(
+            self.field,
+            self.admin_site,
+            name=self.lookup_kwarg,
+            label=_("By {}").format(self.title),
+            data={self.lookup_kwarg: self.value()},
+        )
+        yield {
+            "field": form[self.lookup_kwarg],
+            # Submitting the filter keeps the other filters, search and sort
+            "hidden": [
+                (name, value)
+                for name, value in changelist.params.items()
+                if name != self.lookup_kwarg
+            ],
+            "clear_query_string": changelist.get_query_string(
+                remove=[self.lookup_kwarg]
+            ),
+            "selected": self.value() is not None,
+        }
+
+
+class AutocompleteFilterMixin:
+    """Load the select2 scripts that AutocompleteFilter needs"""
+
+    @property
+    def media(self):
+        return super().media + AutocompleteSelect(None, self.admin_site).media
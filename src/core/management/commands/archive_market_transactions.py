@@ -0,0 +1,51 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from farmers import archive
+from farmers.models import FarmersMarketTransaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Move the market transactions of closed years to the archive, leaving "
+        "only the current season in the transactions table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--before-year",
+            type=int,
+            default=date.today().year,
+            help="Archive the years before this one (default: the current year)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many transactions would be moved",
+        )
+
+    def handle(self, *args, **options):
+        year = options["before_year"]
+        if year > date.today().year:
+            raise CommandError("The current season cannot be archived")
+        before = date(year, 1, 1)
+
+        if options["dry_run"]:
+            count = FarmersMarketTransaction.objects.filter(
+                transaction_date__lt=before
+            ).count()
+            self.stdout.write(f"{count} transactions dated before {before}.")
+            return
+
+        start = time.perf_counter()
+        moved = archive.archive(before, chunk_size=options["chunk_size"])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {moved} transactions dated before {before} in "
+                f"{elapsed:.1f}s ({moved / max(elapsed, 1e-9):,.0f} rows/s)."
+            )
+        )
@@ -0,0 +1,72 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from farmers import assignment
+
+
+def _spread(caseloads):
+    if not caseloads:
+        return "no officers"
+    return (
+        f"min {min(caseloads)}, median {statistics.median(caseloads):g}, "
+        f"max {max(caseloads)}"
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Assign every farmer without a field extension officer to the officer "
+        "with the smallest caseload in their LGA, or else in their state"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the assignments without saving them",
+        )
+        parser.add_argument(
+            "--capacity",
+            type=int,
+            help="Do not give officers more than this many farmers",
+        )
+        parser.add_argument(
+            "--distance-weight",
+            type=float,
+            default=0,
+            help="Caseload, in farmers, that each kilometre to the officer counts as",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = assignment.plan(
+            capacity=options["capacity"], distance_weight=options["distance_weight"]
+        )
+        planned = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{len(result.assignments)} farmers assigned "
+            f"({result.scopes['lga']} in their LGA, {result.scopes['state']} "
+            f"in their state), {result.unassigned} without an officer to take them, "
+            f"planned in {planned:.1f}s."
+        )
+        officers = list(result.after)
+        self.stdout.write(
+            "Caseloads before: "
+            + _spread([result.before.get(pk, 0) for pk in officers])
+        )
+        self.stdout.write("Caseloads after: " + _spread(list(result.after.values())))
+        if options["dry_run"]:
+            self.stdout.write("Dry run, nothing was saved.")
+            return
+
+        start = time.perf_counter()
+        updated = assignment.apply(result.assignments, options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Saved {updated} assignments in {time.perf_counter() - start:.1f}s."
+            )
+        )
@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from farmers import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily market and produce rollup from the raw transactions. "
+        "Without --end the rollup is marked complete from --start (or the "
+        "beginning) onward, and points queries start reading from it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat)
+        parser.add_argument("--end", type=date.fromisoformat)
+        parser.add_argument(
+            "--window", type=int, default=31, help="Days rebuilt per transaction"
+        )
+
+    def handle(self, *args, **options):
+        written = rollups.backfill(
+            options["start"], options["end"], window=options["window"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} rollup rows, complete from {rollups.covered_from()}."
+            )
+        )
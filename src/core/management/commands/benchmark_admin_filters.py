@@ -0,0 +1,63 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from core.benchmarks import percentile, rolled_back, seed_farmers, timed
+from farmers.models import Farmer, FarmersMarketTransaction
+
+# The sidebar filters the autocomplete filters replaced
+SIDEBAR_FILTERS = ("market__name", "farmer")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how long the market transaction changelist takes to render "
+        "as the number of farmers grows, with the autocomplete filters and "
+        "with the sidebar filters listing every farmer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[1000, 10000, 50000],
+            help="Render with at least this many farmers (seeded, rolled back)",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def handle(self, *args, **options):
+        model_admin = admin.site.get_model_admin(FarmersMarketTransaction)
+        sidebar_admin = type(model_admin)(FarmersMarketTransaction, admin.site)
+        sidebar_admin.list_filter = SIDEBAR_FILTERS
+
+        request = RequestFactory().get(
+            f"/{FarmersMarketTransaction._meta.app_label}/"
+            f"{FarmersMarketTransaction._meta.model_name}/"
+        )
+        request.user = get_user_model()(
+            is_active=True, is_staff=True, is_superuser=True
+        )
+        with rolled_back():
+            for size in sorted(options["sizes"]):
+                if (missing := size - Farmer.objects.count()) > 0:
+                    seed_farmers(missing)
+                farmers = Farmer.objects.count()
+                for label, each in (
+                    ("autocomplete filters", model_admin),
+                    ("sidebar filters", sidebar_admin),
+                ):
+                    self.report(farmers, label, request, each, options["repeat"])
+
+    def report(self, farmers, label, request, model_admin, repeat):
+        timings = []
+        for _ in range(repeat):
+            _, elapsed, queries = timed(
+                lambda: model_admin.changelist_view(request).render()
+            )
+            timings.append(elapsed * 1000)
+        self.stdout.write(
+            f"{farmers} farmers, {label}: p50 {percentile(timings, 50):.0f}ms, "
+            f"max {max(timings):.0f}ms, {queries} queries"
+        )
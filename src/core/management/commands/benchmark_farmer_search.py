@@ -0,0 +1,81 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import percentile, rolled_back, seed_farmers, timed
+from farmers import search
+from farmers.models import Farmer
+
+TARGET_P95_MS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure farmer lookup latency by phone number, identification number, "
+        "name prefix and misspelt name"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Create this many synthetic farmers (rolled back afterwards)",
+        )
+        parser.add_argument("--queries", type=int, default=500)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            if options["seed"]:
+                seed_farmers(options["seed"])
+            self.run_benchmarks(options["queries"])
+
+    def run_benchmarks(self, count):
+        farmers = list(
+            Farmer.objects.order_by("?").values_list(
+                "first_name", "last_name", "phone_number", "identification_number"
+            )[:count]
+        )
+        if not farmers:
+            self.stderr.write("There are no farmers to look up, use --seed.")
+            return
+
+        queries = {
+            # As typed at the market gate: local format with spaces
+            "phone": [
+                f"0{phone.national_number // 10**7} {phone.national_number % 10**7:07d}"
+                for *_, phone, _ in farmers
+                if phone
+            ],
+            "identification number": [
+                f" {number.lower()} " for *_, number in farmers if number
+            ],
+            "name prefix": [f"{first[:3]} {last[:4]}" for first, last, *_ in farmers],
+            "misspelt name": [
+                f"{first[0]}{first[2]}{first[1]}{first[3:]} {last}"
+                for first, last, *_ in farmers
+            ],
+        }
+        samples = []
+        for label, terms in queries.items():
+            timings, misses = [], 0
+            for term in terms:
+                found, elapsed, _ = timed(search.search, term)
+                timings.append(elapsed * 1000)
+                misses += not found
+            samples += timings
+            self.report(label, timings, misses)
+        self.report("all lookups", samples, None)
+
+    def report(self, label, timings, misses):
+        if not timings:
+            return
+        p95 = percentile(timings, 95)
+        line = (
+            f"{label}: {len(timings)} lookups, p50 {percentile(timings, 50):.2f}ms, "
+            f"p95 {p95:.2f}ms, max {max(timings):.2f}ms"
+        )
+        if misses:
+            line += f", {misses} without results"
+        style = self.style.SUCCESS if p95 < TARGET_P95_MS else self.style.ERROR
+        self.stdout.write(style(line))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.benchmarks import (
+    rolled_back,
+    seed_farmers,
+    seed_market_transactions,
+    seed_markets,
+    timed,
+)
+from farmers.models import Farmer, FarmersMarketTransaction
+from market.models import Market
+
+
+class Command(BaseCommand):
+    help = "Compare the batch points aggregation API with a per-object loop"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Create this many synthetic farmers (rolled back afterwards)",
+        )
+        parser.add_argument("--transactions-per-farmer", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            if options["seed"]:
+                markets, produce_items = seed_markets(10)
+                farmer_ids = seed_farmers(options["seed"])
+                seed_market_transactions(
+                    farmer_ids,
+                    markets,
+                    produce_items,
+                    options["transactions_per_farmer"],
+                )
+            self.run_benchmarks(options["limit"])
+
+    def run_benchmarks(self, limit):
+        transactions = FarmersMarketTransaction.objects
+        farmers = list(Farmer.objects.order_by("pk")[:limit])
+        markets = list(Market.objects.order_by("pk")[:limit])
+        year = max(transactions.dates("transaction_date", "year"), default=None)
+        if year is None:
+            raise CommandError("no transactions to benchmark")
+        year = year.year
+
+        self.compare(
+            f"total points of {len(farmers)} farmers",
+            lambda: {f.pk: transactions.calculate_total_points(f) for f in farmers},
+            lambda: transactions.points_by_farmer(farmers),
+        )
+        self.compare(
+            f"{year} points of {len(farmers)} farmers",
+            lambda: {
+                f.pk: transactions.calculate_annual_points(f, year) for f in farmers
+            },
+            lambda: transactions.points_by_farmer(farmers, years=[year]),
+        )
+        self.compare(
+            f"total points of {len(markets)} markets",
+            lambda: {m.pk: transactions.calculate_market_points(m) for m in markets},
+            lambda: transactions.points_by_market(markets),
+        )
+
+    def compare(self, label, loop, batch):
+        expected, loop_time, loop_queries = timed(loop)
+        result, batch_time, batch_queries = timed(batch)
+        # The batch API omits objects without any transactions
+        mismatches = sum(
+            1 for pk, total in expected.items() if result.get(pk, 0) != total
+        )
+        self.stdout.write(
+            f"{label}:\n"
+            f"  per-object loop: {loop_time:.3f}s, {loop_queries} queries\n"
+            f"  batch:           {batch_time:.3f}s, {batch_queries} queries"
+            f" ({loop_time / max(batch_time, 1e-9):.1f}x faster)"
+        )
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"  {mismatches} totals differ"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import sync
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the sync changes of rows changed again since, keeping the last "
+        "change of every row"
+    )
+
+    def handle(self, *args, **options):
+        deleted = sync.compact()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} sync changes."))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market import baskets
+from market.models import FoodBasket
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the food basket price indexes per market and state from the "
+        "latest stored period onward, for every basket or the ones given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--basket",
+            action="append",
+            dest="basket",
+            metavar="SLUG",
+            help="Only compute the index of this basket (repeatable)",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute every period instead",
+        )
+
+    def handle(self, *args, **options):
+        queryset = FoodBasket.objects.all()
+        if options["basket"]:
+            queryset = queryset.filter(slug__in=options["basket"])
+            missing = set(options["basket"]) - set(
+                queryset.values_list("slug", flat=True)
+            )
+            if missing:
+                raise CommandError(f"Unknown baskets: {', '.join(sorted(missing))}")
+        for basket in queryset:
+            start = time.perf_counter()
+            written = baskets.compute(basket, full=options["full"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Wrote {written} {basket} index values "
+                    f"in {time.perf_counter() - start:.1f}s."
+                )
+            )
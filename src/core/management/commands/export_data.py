@@ -0,0 +1,69 @@
+import resource
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from core import exports
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream farmers, market or input transactions, or produce prices to a "
+        "CSV or JSON Lines file, and report the export throughput"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=exports.EXPORTS)
+        parser.add_argument("--format", choices=exports.FORMATS, default="csv")
+        parser.add_argument(
+            "--output", help="Write to this file instead of standard output"
+        )
+        parser.add_argument("--start-date", help="Only rows from this date")
+        parser.add_argument("--end-date", help="Only rows up to this date")
+        parser.add_argument("--produce", type=int, help="Only rows of this produce")
+        parser.add_argument("--chunk-size", type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        data = {
+            name: options[name]
+            for name in ("start_date", "end_date", "produce")
+            if options[name] is not None
+        }
+        try:
+            headers, rows = exports.rows(options["name"], data, options["chunk_size"])
+        except ValidationError as error:
+            raise CommandError("; ".join(error.messages))
+
+        output = (
+            open(options["output"], "w", newline="", encoding="utf-8")
+            if options["output"]
+            else sys.stdout
+        )
+        count = 0
+
+        def counted():
+            nonlocal count
+            for count, row in enumerate(rows, 1):
+                yield row
+
+        render = exports.RENDERERS[options["format"]]
+        start = time.perf_counter()
+        try:
+            for chunk in render(headers, counted(), options["chunk_size"]):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        elapsed = time.perf_counter() - start
+
+        # ru_maxrss is in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stderr.write(
+            self.style.SUCCESS(
+                f"Exported {count} rows in {elapsed:.1f}s "
+                f"({count / max(elapsed, 1e-9):,.0f} rows/s), "
+                f"peak memory {peak:.0f} MB."
+            )
+        )
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from farmers import dedup
+
+KINDS = {"farmer": dedup.Kind.FARMER, "officer": dedup.Kind.OFFICER}
+
+
+class Command(BaseCommand):
+    help = (
+        "Find likely duplicate farmer and field extension officer records and "
+        "store them as merge candidates for review"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kind",
+            action="append",
+            dest="kinds",
+            choices=KINDS,
+            help="Only look for duplicates of this kind of record (repeatable)",
+        )
+        parser.add_argument("--threshold", type=float, default=dedup.THRESHOLD)
+
+    def handle(self, *args, **options):
+        for name in options["kinds"] or KINDS:
+            start = time.perf_counter()
+            scored, stored, skipped = dedup.find(
+                KINDS[name], threshold=options["threshold"]
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{name}: scored {scored} pairs, stored {stored} candidates "
+                    f"in {time.perf_counter() - start:.1f}s."
+                )
+            )
+            if skipped:
+                self.stderr.write(
+                    f"{name}: skipped {skipped} blocks with more than "
+                    f"{dedup.MAX_BLOCK_SIZE} records."
+                )
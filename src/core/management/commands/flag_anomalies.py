@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from farmers import anomalies
+
+SOURCES = {
+    "market": anomalies.Source.MARKET,
+    "input": anomalies.Source.INPUT,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Flag market transactions and input purchases whose quantity or amount "
+        "is far above others of the same market, produce and week for review"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            action="append",
+            dest="sources",
+            choices=SOURCES,
+            help="Only flag transactions of this kind (repeatable)",
+        )
+        parser.add_argument("--threshold", type=float, default=anomalies.THRESHOLD)
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rescore every week instead of the weeks since the last run",
+        )
+
+    def handle(self, *args, **options):
+        for name in options["sources"] or SOURCES:
+            start = time.perf_counter()
+            scored, flagged = anomalies.flag(
+                SOURCES[name], threshold=options["threshold"], full=options["full"]
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{name}: scored {scored} transactions, flagged {flagged} "
+                    f"in {time.perf_counter() - start:.1f}s."
+                )
+            )
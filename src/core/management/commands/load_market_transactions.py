@@ -0,0 +1,150 @@
+import csv
+import json
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from phonenumber_field.phonenumber import to_python
+
+from core.utils import chunked
+from farmers import ingest
+from farmers.models import Farmer, FarmersMarketTransaction
+from market.models import Market, Produce
+
+MAX_QUANTITY = 32767
+# Farmers resolved by previous batches that are kept around for reuse
+FARMER_CACHE_SIZE = 100_000
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream market transactions from a CSV or JSONL file into the database. "
+        "Each row needs farmer, market, produce, quantity and transaction_date; "
+        "farmers are matched on --farmer-field, markets and produce on their slug."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file, or - for stdin")
+        parser.add_argument("--format", choices=["csv", "jsonl"])
+        parser.add_argument(
+            "--farmer-field",
+            default="slug",
+            choices=["slug", "phone_number", "identification_number"],
+        )
+        parser.add_argument(
+            "--on-conflict",
+            default="update",
+            choices=["update", "ignore"],
+            help="What to do with rows that already exist for the same "
+            "produce, farmer, market and date",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or (
+            "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+        )
+        self.farmer_field = options["farmer_field"]
+        self.markets = dict(Market.objects.values_list("slug", "pk"))
+        self.produce = dict(Produce.objects.values_list("slug", "pk"))
+        self.farmers = {}
+        self.skipped = 0
+        affected_farmers = set()
+        rollup_keys = set()
+        loaded = 0
+
+        start = time.perf_counter()
+        with self.open(path) as stream:
+            rows = self.read(stream, file_format)
+            for batch in chunked(rows, options["batch_size"]):
+                transactions = self.build(batch)
+                ingest.write(transactions, on_conflict=options["on_conflict"])
+                affected_farmers.update(txn.farmer_id for txn in transactions)
+                rollup_keys.update(
+                    (txn.market_id, txn.produce_id, txn.transaction_date)
+                    for txn in transactions
+                )
+                loaded += len(transactions)
+                self.progress(loaded, start)
+
+        ingest.finish(affected_farmers, rollup_keys)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Processed {loaded} transactions for {len(affected_farmers)} farmers "
+                f"in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):.0f} rows/sec), "
+                f"skipped {self.skipped} rows."
+            )
+        )
+
+    def open(self, path):
+        if path == "-":
+            return open(sys.stdin.fileno(), encoding="utf-8", closefd=False)
+        if not Path(path).exists():
+            raise CommandError(f"{path} does not exist")
+        return open(path, encoding="utf-8", newline="")
+
+    def read(self, stream, file_format):
+        if file_format == "csv":
+            yield from csv.DictReader(stream)
+            return
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+    def farmer_key(self, value):
+        if self.farmer_field == "phone_number":
+            return str(to_python(value))
+        return str(value)
+
+    def resolve_farmers(self, keys):
+        if len(self.farmers) > FARMER_CACHE_SIZE:
+            self.farmers.clear()
+        missing = {key for key in keys if key not in self.farmers}
+        if missing:
+            self.farmers.update(
+                (str(key), pk)
+                for key, pk in Farmer.objects.filter(
+                    **{f"{self.farmer_field}__in": missing}
+                ).values_list(self.farmer_field, "pk")
+            )
+        return self.farmers
+
+    def build(self, rows):
+        """Turn a batch of raw rows into unsaved transactions, last row wins"""
+        for row in rows:
+            row["farmer"] = self.farmer_key(row.get("farmer"))
+        farmers = self.resolve_farmers({row["farmer"] for row in rows})
+        transactions = {}
+        for row in rows:
+            try:
+                txn = FarmersMarketTransaction(
+                    farmer_id=farmers[row["farmer"]],
+                    market_id=self.markets[row["market"]],
+                    produce_id=self.produce[row["produce"]],
+                    quantity=int(row["quantity"]),
+                    transaction_date=date.fromisoformat(row["transaction_date"]),
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                self.skip(row, f"invalid value {e}")
+                continue
+            if not 0 <= txn.quantity <= MAX_QUANTITY:
+                self.skip(row, "quantity out of range")
+                continue
+            key = (txn.produce_id, txn.farmer_id, txn.market_id, txn.transaction_date)
+            transactions[key] = txn
+        return list(transactions.values())
+
+    def skip(self, row, reason):
+        self.skipped += 1
+        if self.skipped <= 10:
+            self.stderr.write(f"Skipping {row}: {reason}")
+
+    def progress(self, loaded, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{loaded} rows in {elapsed:.1f}s ({loaded / max(elapsed, 1e-9):.0f} rows/sec)"
+        )
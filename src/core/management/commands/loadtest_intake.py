@@ -0,0 +1,163 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.benchmarks import seed_farmers, seed_markets
+from core.utils import chunked
+from farmers import intake
+from farmers.models import Farmer, FarmersMarketTransaction
+from market.models import ContactPerson, Market, Produce
+
+
+class Command(BaseCommand):
+    help = (
+        "Record the same number of market transactions one row at a time with "
+        "FarmersMarketTransaction.save(), and through the intake endpoint from "
+        "concurrent clients with and without the write-behind buffer, and "
+        "report the throughput of each. Each client has its own database "
+        "connection, so the seeded rows are committed, then deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transactions", type=int, default=2000)
+        parser.add_argument(
+            "--concurrency", type=int, default=50, help="Concurrent clients"
+        )
+        parser.add_argument(
+            "--batch", type=int, default=1, help="Transactions per request"
+        )
+
+    def handle(self, *args, **options):
+        count = options["transactions"]
+        markets, produce_items = seed_markets(5)
+        # Every transaction is for a different farmer, so none clash
+        farmers = list(
+            Farmer.objects.filter(pk__in=seed_farmers(3 * count)).values_list(
+                "pk", "slug"
+            )
+        )
+        user = get_user_model().objects.create_superuser(
+            f"loadtest-{markets[0].slug}", "loadtest@example.com", None
+        )
+        try:
+            self.run(options, markets, produce_items, farmers, user)
+        finally:
+            self.remove(markets, produce_items, farmers, user)
+
+    def run(self, options, markets, produce_items, farmers, user):
+        count = options["transactions"]
+        intake._catalogue.load()
+
+        def sample(farmers):
+            return [
+                (pk, slug, random.choice(markets), random.choice(produce_items))
+                for pk, slug in farmers
+            ]
+
+        start = time.perf_counter()
+        for farmer_id, _, market, produce in sample(farmers[:count]):
+            FarmersMarketTransaction(
+                farmer_id=farmer_id,
+                market=market,
+                produce=produce,
+                quantity=random.randint(1, 50),
+                transaction_date=date.today(),
+            ).save()
+        self.report("per-row save()", count, start)
+
+        for label, sampled, flush_rows in (
+            # A buffer that flushes every request on its own is the endpoint
+            # without write-behind
+            ("intake, unbuffered", sample(farmers[count : 2 * count]), 1),
+            (
+                "intake, write-behind buffer",
+                sample(farmers[2 * count :]),
+                intake.FLUSH_ROWS,
+            ),
+        ):
+            items = [
+                {
+                    "farmer": slug,
+                    "market": market.slug,
+                    "produce": produce.slug,
+                    "quantity": random.randint(1, 50),
+                }
+                for _, slug, market, produce in sampled
+            ]
+            buffer = intake._buffer
+            intake._buffer = intake.WriteBehindBuffer(flush_rows=flush_rows)
+            start = time.perf_counter()
+            # The test client sends requests for the "testserver" host, and
+            # the debug toolbar would time itself rather than the endpoint
+            try:
+                with override_settings(
+                    ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                    MIDDLEWARE=[
+                        each
+                        for each in settings.MIDDLEWARE
+                        if not each.startswith("debug_toolbar.")
+                    ],
+                ):
+                    saved = self.submit(
+                        user, list(chunked(items, options["batch"])), options
+                    )
+            finally:
+                intake._buffer = buffer
+            self.report(label, saved, start)
+
+    def submit(self, user, requests, options):
+        """Send the requests from concurrent clients, return the number saved"""
+        url = reverse("transaction_intake")
+
+        def agent(client, bodies):
+            # Each client thread opens its own connection, as a threaded
+            # worker does
+            saved = 0
+            try:
+                for body in bodies:
+                    response = client.post(url, body, content_type="application/json")
+                    results = response.json()["results"]
+                    saved += sum(result["status"] == "saved" for result in results)
+            finally:
+                connections.close_all()
+            return saved
+
+        concurrency = options["concurrency"]
+        clients = [Client() for _ in range(concurrency)]
+        for client in clients:
+            client.force_login(user)
+        with ThreadPoolExecutor(concurrency) as executor:
+            return sum(
+                executor.map(
+                    agent,
+                    clients,
+                    [requests[i::concurrency] for i in range(concurrency)],
+                )
+            )
+
+    def remove(self, markets, produce_items, farmers, user):
+        """Delete the seeded rows and everything recorded for them"""
+        Farmer.objects.filter(pk__in=[pk for pk, _ in farmers]).delete()
+        Market.objects.filter(pk__in=[market.pk for market in markets]).delete()
+        ContactPerson.objects.filter(
+            pk__in=[market.contact_person_id for market in markets]
+        ).delete()
+        Produce.objects.filter(
+            pk__in=[produce.pk for produce in produce_items]
+        ).delete()
+        user.delete()
+
+    def report(self, label, count, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label}: {count} transactions in {elapsed:.1f}s "
+            f"({count / max(elapsed, 1e-9):,.0f}/s)"
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from farmers import leaderboards
+
+
+class Command(BaseCommand):
+    help = "Rebuild every market, LGA and state leaderboard from the points ledger"
+
+    def handle(self, *args, **options):
+        written = leaderboards.rebuild()
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt the leaderboards with {written} entries.")
+        )
@@ -0,0 +1,35 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from market import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the weekly and monthly produce price rollups per state and "
+        "LGA, for every period or the periods from --start. With --incremental "
+        "only the periods from the last market day rolled up are recomputed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", type=date.fromisoformat)
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Recompute the periods since the last run instead",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options["incremental"]:
+            written = rollups.refresh()
+        else:
+            written = rollups.rebuild(options["start"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} price rollups, up to {rollups.last_processed()} "
+                f"in {time.perf_counter() - start:.1f}s."
+            )
+        )
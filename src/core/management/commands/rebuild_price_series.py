@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market import timeseries
+from market.models import Produce
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite the packed produce price series from the recorded prices, for "
+        "every produce or the ones given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--produce",
+            action="append",
+            dest="produce",
+            metavar="SLUG",
+            help="Only rebuild the series of this produce (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        produce_ids = None
+        if options["produce"]:
+            found = dict(
+                Produce.objects.filter(slug__in=options["produce"]).values_list(
+                    "slug", "pk"
+                )
+            )
+            missing = set(options["produce"]) - set(found)
+            if missing:
+                raise CommandError(f"Unknown produce: {', '.join(sorted(missing))}")
+            produce_ids = list(found.values())
+        start = time.perf_counter()
+        written = timeseries.rebuild(produce_ids)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {written} prices in {time.perf_counter() - start:.1f}s."
+            )
+        )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from farmers import ledger
+from farmers.models import Farmer
+
+
+class Command(BaseCommand):
+    help = "Rebuild the farmers points ledger and balances from the raw transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--farmer",
+            action="append",
+            dest="farmers",
+            metavar="SLUG",
+            help="Only reconcile the farmer with this slug (repeatable)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        farmer_ids = None
+        if options["farmers"]:
+            farmer_ids = list(
+                Farmer.objects.filter(slug__in=options["farmers"]).values_list(
+                    "pk", flat=True
+                )
+            )
+
+        appended, corrected = ledger.reconcile(
+            farmer_ids, chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Appended {appended} ledger entries and corrected the balances of {corrected} farmers."
+            )
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from farmers.models import Farmer
+
+
+class Command(BaseCommand):
+    help = "Recompute the transaction and verification flags of farmers"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--farmer",
+            action="append",
+            dest="farmers",
+            metavar="SLUG",
+            help="Only refresh the farmer with this slug (repeatable)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        farmers = Farmer.objects.all()
+        if options["farmers"]:
+            farmers = farmers.filter(slug__in=options["farmers"])
+
+        updated = farmers.refresh_transaction_flags(options["chunk_size"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Refreshed the flags of {updated} farmers.")
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from market import schedule
+
+
+class Command(BaseCommand):
+    help = (
+        f"Bring the market schedule up to date for the next "
+        f"{schedule.HORIZON_DAYS} days: drop the days that have passed and add "
+        f"the ones that came within the horizon (run daily)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Rebuild every day of the schedule from the markets",
+        )
+
+    def handle(self, *args, **options):
+        deleted, added = schedule.extend(rebuild=options["rebuild"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {deleted} and added {added} market schedule days."
+            )
+        )
@@ -0,0 +1,174 @@
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, models, transaction
+
+from core.utils import chunked
+from farmers import ledger, rollups, rules
+from farmers.models import (
+    FarmersInputTransaction,
+    FarmersMarketTransaction,
+    PointsRuleSet,
+)
+
+Source = rules.Source
+
+# Model, measure and date fields of each source, and whether it has produce
+SOURCES = {
+    Source.MARKET: (
+        FarmersMarketTransaction,
+        "quantity",
+        "transaction_date",
+        True,
+    ),
+    Source.INPUT: (
+        FarmersInputTransaction,
+        "amount",
+        "receipt_verification_date",
+        False,
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-score historical transactions under a points rule set version. "
+        "Chunks of transactions are scored across a pool of worker processes "
+        "and the points ledger, balances and daily rollups are then reconciled."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("version", type=int)
+        parser.add_argument(
+            "--activate",
+            action="store_true",
+            help="Make the rule set active first, so new transactions use it too",
+        )
+        parser.add_argument(
+            "--source",
+            action="append",
+            dest="sources",
+            choices=Source.values,
+            help="Only re-score transactions of this source (repeatable)",
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count())
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        try:
+            rule_set = PointsRuleSet.objects.get(version=options["version"])
+        except PointsRuleSet.DoesNotExist:
+            raise CommandError(f"Points rule set v{options['version']} does not exist")
+
+        if options["activate"]:
+            with transaction.atomic():
+                PointsRuleSet.objects.filter(is_active=True).update(is_active=False)
+                rule_set.is_active = True
+                rule_set.save(update_fields=["is_active"])
+        elif not rule_set.is_active:
+            self.stderr.write(
+                f"{rule_set} is not active, new transactions are still scored "
+                "by the active rule set."
+            )
+
+        self.workers = options["workers"]
+        self.farmer_ids = set()
+        self.rollup_keys = set()
+        start = time.perf_counter()
+        # Workers only compute points; the parent does all the database work,
+        # so forked children must not inherit its connections
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+        ) as pool:
+            for source in options["sources"] or Source.values:
+                # Archived transactions are scored like the others, so that
+                # the balances they count towards follow the rule set too
+                for model in [
+                    SOURCES[source][0],
+                    *ledger.ARCHIVE_MODELS.get(source, []),
+                ]:
+                    scored, changed = self.rescore(
+                        pool, source, model, rule_set, options["chunk_size"]
+                    )
+                    self.stdout.write(
+                        f"{model._meta.verbose_name_plural.capitalize()}: "
+                        f"re-scored {scored} transactions, {changed} changed."
+                    )
+
+        appended, _ = ledger.reconcile(sorted(self.farmer_ids))
+        rollups.refresh(self.rollup_keys)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Appended {appended} ledger entries for {len(self.farmer_ids)} "
+                f"farmers in {time.perf_counter() - start:.1f}s."
+            )
+        )
+
+    def chunks(self, source, model, chunk_size):
+        """
+        Yield chunks of (pk, farmer id, produce id, points, *rule row) tuples,
+        the rule row being what `rules.score_rows()` expects.
+        """
+        _, measure, day, has_produce = SOURCES[source]
+        produce = ("produce_id", "produce__category")
+        if not has_produce:
+            produce = (models.Value(None, models.IntegerField()), models.Value(""))
+        queryset = model.objects.order_by("pk").values_list(
+            "pk",
+            "farmer_id",
+            produce[0],
+            "points_earned",
+            measure,
+            day,
+            "market_id",
+            produce[1],
+            "farmer__category_type",
+        )
+        chunk = list(queryset[:chunk_size])
+        while chunk:
+            yield chunk
+            chunk = list(queryset.filter(pk__gt=chunk[-1][0])[:chunk_size])
+
+    def rescore(self, pool, source, model, rule_set, chunk_size):
+        compiled = rules.load(source, rule_set)
+        scored = changed = 0
+        pending = deque()
+
+        def apply(chunk, future):
+            # One UPDATE per distinct new points value is far cheaper than a
+            # CASE expression with a branch per row
+            updates = defaultdict(list)
+            for (pk, farmer_id, produce_id, old, _, day, market_id, *_), points in zip(
+                chunk, future.result()
+            ):
+                if points == old:
+                    continue
+                updates[points].append(pk)
+                self.farmer_ids.add(farmer_id)
+                if produce_id is not None:
+                    self.rollup_keys.add((market_id, produce_id, day))
+            with transaction.atomic():
+                for points, pks in updates.items():
+                    for batch in chunked(pks, 1000):
+                        model.objects.filter(pk__in=batch).update(points_earned=points)
+            return len(chunk), sum(len(pks) for pks in updates.values())
+
+        for chunk in self.chunks(source, model, chunk_size):
+            rows = [row[4:] for row in chunk]
+            pending.append((chunk, pool.submit(rules.score_rows, compiled, rows)))
+            # Keep every worker busy without reading the whole table into memory
+            while len(pending) > 2 * self.workers:
+                done, updated = apply(*pending.popleft())
+                scored += done
+                changed += updated
+        while pending:
+            done, updated = apply(*pending.popleft())
+            scored += done
+            changed += updated
+        return scored, changed
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:00
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# Existing rows are recorded as changed once, so the first sync downloads them
+SYNCED = {
+    "farmers": ("farmers", "Farmer"),
+    "markets": ("market", "Market"),
+    "produce": ("market", "Produce"),
+    "prices": ("market", "ProducePrice"),
+}
+
+
+def record_existing_rows(apps, schema_editor):
+    SyncChange = apps.get_model("core", "SyncChange")
+    quote = schema_editor.connection.ops.quote_name
+    now = timezone.now()
+    with schema_editor.connection.cursor() as cursor:
+        for table, (app_label, model_name) in SYNCED.items():
+            model = apps.get_model(app_label, model_name)
+            cursor.execute(
+                f"INSERT INTO {quote(SyncChange._meta.db_table)} "
+                f"({quote('table')}, {quote('object_id')}, {quote('deleted')}, "
+                f"{quote('created_at')}) "
+                f"SELECT %s, {quote(model._meta.pk.column)}, %s, %s "
+                f"FROM {quote(model._meta.db_table)} "
+                f"ORDER BY {quote(model._meta.pk.column)}",
+                [table, False, now],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_processingcheckpoint"),
+        ("farmers", "0011_archivedmarkettransaction"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("table", models.CharField(max_length=20)),
+                ("object_id", models.PositiveBigIntegerField()),
+                ("deleted", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["table", "object_id"], name="sync_change_object_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(record_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_syncchange"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="syncchange",
+            name="sequence",
+            field=models.PositiveBigIntegerField(blank=True, null=True, unique=True),
+        ),
+        # The changes so far are committed, and the ids devices already hold
+        # as cursors stay valid
+        migrations.RunSQL(
+            "UPDATE core_syncchange SET sequence = id", migrations.RunSQL.noop
+        ),
+    ]
@@ -22,3 +22,33 @@ class BaseModel(TimeStampModel):
 
 class User(AbstractUser):
     email = models.EmailField(verbose_name="email address", unique=True)
+
+
+class ProcessingCheckpoint(models.Model):
+    """How far a derived table or batch job has been brought up to date"""
+
+    name = models.CharField(max_length=100, unique=True)
+    position = models.DateField(null=True, blank=True)
+    last_update = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.position}"
+
+
+class SyncChange(models.Model):
+    """A change to a row that field devices sync, in the order changes committed"""
+
+    table = models.CharField(max_length=20)
+    object_id = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # The sync cursor, assigned by core.sync.publish() once the change committed
+    sequence = models.PositiveBigIntegerField(null=True, blank=True, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["table", "object_id"], name="sync_change_object_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.pk}: {self.table} {self.object_id}"
@@ -0,0 +1,210 @@
+"""
+Pagination for lists over tables with millions of rows.
+
+An OFFSET has to skip every row before the page and COUNT(*) reads the whole
+table, so both get slower as the table grows. Keyset pagination instead asks
+for the rows that sort after the last row shown, which an index on the
+ordering answers directly, and above a threshold the number of rows is taken
+from the query planner's estimate rather than counted.
+"""
+
+import base64
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.utils.functional import cached_property
+
+# Lists with more rows than this are not counted exactly unless asked to
+ESTIMATE_THRESHOLD = 10_000
+
+CURSOR_VAR = "after"
+EXACT_COUNT_VAR = "exact_count"
+
+
+def estimate_count(queryset):
+    """Return the planner's row estimate for `queryset`, or None without one"""
+    if connections[queryset.db].vendor != "postgresql":
+        return None
+    plan = json.loads(queryset.order_by().explain(format="json"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def _fields(model, ordering):
+    return [
+        (
+            model._meta.pk
+            if name.lstrip("-") == "pk"
+            else model._meta.get_field(name.lstrip("-"))
+        )
+        for name in ordering
+    ]
+
+
+def encode_cursor(obj, ordering):
+    """Return an opaque cursor for the rows that sort after `obj`"""
+    values = [field.value_to_string(obj) for field in _fields(type(obj), ordering)]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(model, ordering, cursor):
+    """Return the ordering values in a cursor; raise ValidationError if invalid"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValidationError("Invalid cursor")
+    fields = _fields(model, ordering)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValidationError("Invalid cursor")
+    return [field.to_python(value) for field, value in zip(fields, values)]
+
+
+def after(ordering, values):
+    """
+    Match the rows that sort after `values` in `ordering`, a sequence of field
+    names ending with a unique one.
+    """
+    condition = models.Q(pk__in=[])
+    equal = models.Q()
+    for name, value in zip(ordering, values):
+        field = name.lstrip("-")
+        lookup = "lt" if name.startswith("-") else "gt"
+        condition |= equal & models.Q(**{f"{field}__{lookup}": value})
+        equal &= models.Q(**{field: value})
+    # Bound the index scan on the leading field; the OR alone is not sargable
+    first = ordering[0]
+    bound = "lte" if first.startswith("-") else "gte"
+    return models.Q(**{f"{first.lstrip('-')}__{bound}": values[0]}) & condition
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that counts at most `threshold` rows and estimates beyond
+    that. `threshold=None` always counts exactly.
+    """
+
+    def __init__(self, *args, threshold=ESTIMATE_THRESHOLD, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+        self.estimated = False
+
+    @cached_property
+    def count(self):
+        if self.threshold is None:
+            return super().count
+        # Counting a LIMITed subquery stops after threshold + 1 rows
+        count = self.object_list[: self.threshold + 1].count()
+        if count <= self.threshold:
+            return count
+        self.estimated = True
+        return max(estimate_count(self.object_list) or 0, count)
+
+    def validate_number(self, number):
+        # Pages past an estimated count are empty rather than invalid
+        if self.estimated and str(number).isdigit() and int(number) >= 1:
+            return int(number)
+        return super().validate_number(number)
+
+    def page(self, number):
+        if not self.estimated:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom : bottom + self.per_page], number, self
+        )
+
+
+class KeysetChangeList(ChangeList):
+    """
+    A changelist that pages with a cursor while it is sorted by the model
+    admin's `keyset_ordering`, and by page number with an estimated count
+    when it is sorted by anything else.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.keyset = False
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+        # Sorting and filtering links start again from the first page
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        lookup_params.pop(EXACT_COUNT_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        ordering = list(self.model_admin.keyset_ordering)
+        # The model admin's ordering is repeated after the one asked for, and
+        # nothing after the unique last field changes the order
+        applied = list(dict.fromkeys(self.queryset.query.order_by))
+        self.keyset = applied[: len(ordering)] == ordering
+        if not self.keyset or self.show_all:
+            return super().get_results(request)
+
+        paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page
+        )
+        result_list = self.queryset
+        if self.cursor:
+            try:
+                values = decode_cursor(self.model, ordering, self.cursor)
+            except ValidationError:
+                raise IncorrectLookupParameters
+            result_list = result_list.filter(after(ordering, values))
+        result_list = result_list[: self.list_per_page]
+        rows = list(result_list)
+        if len(rows) == self.list_per_page:
+            self.next_cursor = encode_cursor(rows[-1], ordering)
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = result_list
+        self.can_show_all = False
+        self.multi_page = self.cursor is not None or self.next_cursor is not None
+        self.paginator = paginator
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+    @property
+    def next_page_url(self):
+        if self.next_cursor:
+            return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+    @property
+    def exact_count_url(self):
+        return self.get_query_string({EXACT_COUNT_VAR: 1})
+
+
+class KeysetPaginationMixin:
+    """
+    Page a changelist by cursor over `keyset_ordering`, a sequence of indexed
+    field names ending with a unique one, and estimate large counts. The
+    model's changelist needs a pagination.html that includes
+    admin/keyset_pagination.html.
+    """
+
+    keyset_ordering = ("-pk",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_paginator(self, request, queryset, per_page, **kwargs):
+        threshold = None if EXACT_COUNT_VAR in request.GET else ESTIMATE_THRESHOLD
+        return self.paginator(queryset, per_page, threshold=threshold, **kwargs)
+
+    def get_ordering(self, request):
+        return self.keyset_ordering
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
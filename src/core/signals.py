@@ -0,0 +1,55 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from farmers.models import Farmer, FieldExtensionOfficer
+from market.models import Market, MarketDay, Produce, ProducePrice
+
+from . import sync
+
+
+@receiver(post_save, sender=Farmer)
+@receiver(post_save, sender=Market)
+@receiver(post_save, sender=Produce)
+@receiver(post_save, sender=ProducePrice)
+def record_save(sender, instance, **kwargs):
+    sync.record(sync.table_of(sender), [instance.pk])
+
+
+@receiver(post_delete, sender=Farmer)
+@receiver(post_delete, sender=Market)
+@receiver(post_delete, sender=Produce)
+@receiver(post_delete, sender=ProducePrice)
+def record_delete(sender, instance, **kwargs):
+    sync.record(sync.table_of(sender), [instance.pk], deleted=True)
+
+
+@receiver(m2m_changed, sender=Market.produce_items.through)
+def record_market_produce(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        sync.record("markets", [instance.pk])
+    elif pk_set:
+        sync.record("markets", sorted(pk_set))
+    else:
+        # Cleared from the produce's side
+        sync.record("markets", instance.market_set.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Produce)
+def record_produce_markets(sender, instance, **kwargs):
+    # The produce is dropped from the markets without m2m_changed
+    sync.record("markets", instance.market_set.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=FieldExtensionOfficer)
+def record_officer_farmers(sender, instance, **kwargs):
+    # The farmers' officer is set to null with an UPDATE, without post_save
+    sync.record("farmers", instance.farmer.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=MarketDay)
+def record_market_day_prices(sender, instance, created, **kwargs):
+    # Prices are synced with the market and date of their market day
+    if not created:
+        sync.record("prices", instance.produce_price.values_list("pk", flat=True))
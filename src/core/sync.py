@@ -0,0 +1,405 @@
+"""
+Delta sync of farmers, markets, produce and prices to offline field devices.
+
+Every save and delete of a synced row appends a `SyncChange`, whose
+`sequence` is the sync cursor. A device sends the cursor it last reached and
+gets back only the rows changed since, a page of changes at a time, with each
+table's columns named once and its rows as lists of values. Rows deleted
+since are listed by id.
+
+Sequences follow the order changes commit in, not the order they were
+written in, so a transaction that stays open cannot commit a change below a
+cursor a device has already moved past. `publish()` numbers the committed
+changes that have no sequence yet, after every commit that recorded some,
+one publisher at a time.
+
+Devices push the market transactions they recorded back in batches keyed by
+the transaction's UUID, so a batch sent again after a dropped connection is
+not saved twice.
+"""
+
+import uuid
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db import connection, models, transaction
+
+from farmers import ingest
+from farmers.models import ArchivedMarketTransaction, Farmer, FarmersMarketTransaction
+from market.models import Market, Produce, ProducePrice
+
+from .exports import PHONE_NUMBER
+from .models import SyncChange
+
+# Changes handed out in a page
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 5000
+# Key of the PostgreSQL advisory lock publishers take turns on
+PUBLISH_LOCK = 0x53594E43
+# Oldest transaction a device may push, in days
+MAX_PUSH_AGE = 30
+MAX_QUANTITY = 32767
+
+Table = namedtuple("Table", ["model", "columns", "related"])
+
+TABLES = {
+    "farmers": Table(
+        Farmer,
+        {
+            "id": "pk",
+            "slug": "slug",
+            "first_name": "first_name",
+            "last_name": "last_name",
+            "phone_number": PHONE_NUMBER,
+            "identification_number": "identification_number",
+            "state": "state_id",
+            "lga": "lga_id",
+            "field_extension_officer": "field_extension_officer_id",
+        },
+        {},
+    ),
+    "markets": Table(
+        Market,
+        {
+            "id": "pk",
+            "slug": "slug",
+            "name": "name",
+            "market_frequency": "market_frequency",
+            "last_market_day": "last_market_day",
+            "is_active": "is_active",
+        },
+        # The produce each market trades, a list of produce ids
+        {"produce_items": "produce_items"},
+    ),
+    "produce": Table(
+        Produce,
+        {
+            "id": "pk",
+            "slug": "slug",
+            "name": "name",
+            "extra": "extra",
+            "local_name": "local_name",
+            "category": "category",
+            "unit": "unit",
+        },
+        {},
+    ),
+    "prices": Table(
+        ProducePrice,
+        {
+            "id": "pk",
+            "produce": "produce_id",
+            "market": "market_day__market_id",
+            "date": "market_day__date",
+            "price_type": "price_type",
+            "price": "price",
+        },
+        {},
+    ),
+}
+
+
+def table_of(model):
+    """Return the name `model` is synced as, or None"""
+    for name, table in TABLES.items():
+        if table.model is model:
+            return name
+    return None
+
+
+def record(table, object_ids, deleted=False):
+    """Record that rows of a synced table were changed or deleted"""
+    SyncChange.objects.bulk_create(
+        [
+            SyncChange(table=table, object_id=object_id, deleted=deleted)
+            for object_id in object_ids
+        ],
+        batch_size=1000,
+    )
+    transaction.on_commit(publish, robust=True)
+
+
+def publish():
+    """
+    Give the committed changes without a sequence the next sequences, in id
+    order. Publishers run one at a time and each commits before the next one
+    reads the highest sequence, so the sequences a device can see are always
+    every sequence up to the highest one. Returns the number published.
+    """
+    pending = SyncChange.objects.filter(sequence__isnull=True)
+    if not pending.exists():
+        return 0
+    quote = connection.ops.quote_name
+    table = quote(SyncChange._meta.db_table)
+    sequence = quote(SyncChange._meta.get_field("sequence").column)
+    pk = quote(SyncChange._meta.pk.column)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [PUBLISH_LOCK])
+        # One statement, which SQLite runs holding the database write lock
+        cursor.execute(
+            f"UPDATE {table} SET {sequence} = numbered.next "
+            f"FROM (SELECT {pk}, ROW_NUMBER() OVER (ORDER BY {pk}) + "
+            f"(SELECT COALESCE(MAX({sequence}), 0) FROM {table}) AS next "
+            f"FROM {table} WHERE {sequence} IS NULL) AS numbered "
+            f"WHERE {table}.{pk} = numbered.{pk}"
+        )
+        return cursor.rowcount
+
+
+def _related(table, ids):
+    """Return the related ids of each row, per many-to-many field"""
+    related = {}
+    for name, field_name in table.related.items():
+        field = table.model._meta.get_field(field_name)
+        through = field.remote_field.through
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        values = {pk: [] for pk in ids}
+        for pk, other in (
+            through.objects.filter(**{f"{source}__in": ids})
+            .order_by(source, target)
+            .values_list(f"{source}_id", f"{target}_id")
+        ):
+            values[pk].append(other)
+        related[name] = values
+    return related
+
+
+def _rows(table, ids):
+    """Return the current rows with these ids, as lists of column values"""
+    rows = [
+        list(row)
+        for row in table.model.objects.filter(pk__in=ids)
+        .order_by("pk")
+        .values_list(*table.columns.values())
+    ]
+    if table.related:
+        related = _related(table, [row[0] for row in rows])
+        for row in rows:
+            row.extend(related[name][row[0]] for name in table.related)
+    return rows
+
+
+def pull_params(data):
+    """
+    Return the tables, cursor and page size asked for in a query string, or
+    raise ValidationError
+    """
+    tables = data.get("tables")
+    tables = tables.split(",") if tables else list(TABLES)
+    unknown = [name for name in tables if name not in TABLES]
+    if unknown:
+        raise ValidationError(f"Unknown tables: {', '.join(unknown)}")
+    try:
+        cursor = int(data.get("cursor", 0))
+        limit = int(data.get("limit", PAGE_SIZE))
+    except ValueError:
+        raise ValidationError("The cursor and limit must be whole numbers")
+    if cursor < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValidationError(f"The limit must be from 1 to {MAX_PAGE_SIZE}")
+    return tables, cursor, limit
+
+
+def pull(tables, cursor=0, limit=PAGE_SIZE):
+    """
+    Return the rows of `tables` changed after `cursor`, a page of changes at a
+    time, with the cursor to ask for the next page from and whether there is
+    one.
+    """
+    # Changes committed by a process that stopped before publishing them
+    publish()
+    changes = list(
+        SyncChange.objects.filter(sequence__gt=cursor, table__in=tables)
+        .order_by("sequence")
+        .values_list("sequence", "table", "object_id", "deleted")[:limit]
+    )
+    # Only the last change of a row in the page counts
+    latest = {}
+    for _, name, object_id, deleted in changes:
+        latest[name, object_id] = deleted
+
+    page = {}
+    for name in tables:
+        table = TABLES[name]
+        changed = [pk for (each, pk), deleted in latest.items() if each == name]
+        if not changed:
+            continue
+        rows = _rows(table, [pk for pk in changed if not latest[name, pk]])
+        # Rows deleted since the change was recorded are deleted for the device
+        present = {row[0] for row in rows}
+        page[name] = {
+            "columns": [*table.columns, *table.related],
+            "rows": rows,
+            "deleted": sorted(pk for pk in changed if pk not in present),
+        }
+    return {
+        "cursor": changes[-1][0] if changes else cursor,
+        "more": len(changes) == limit,
+        "tables": page,
+    }
+
+
+def compact():
+    """
+    Delete the published changes of rows changed again since. The last change
+    of every row is kept, so a device resuming from any cursor still gets
+    every row changed after it. Returns the number of changes deleted.
+    """
+    superseded = SyncChange.objects.filter(
+        models.Exists(
+            SyncChange.objects.filter(
+                table=models.OuterRef("table"),
+                object_id=models.OuterRef("object_id"),
+                sequence__gt=models.OuterRef("sequence"),
+            )
+        )
+    )
+    return superseded._raw_delete(superseded.db)
+
+
+def _parse(item, today):
+    """Return an unsaved transaction for a pushed item and the errors in it"""
+    if not isinstance(item, dict):
+        return None, ["Expected an object"]
+    errors = []
+    try:
+        pk = uuid.UUID(str(item.get("id")))
+    except ValueError:
+        return None, ["Expected a transaction id, a UUID"]
+
+    ids = {}
+    for name in ("farmer", "market", "produce"):
+        value = item.get(name)
+        if not isinstance(value, int) or isinstance(value, bool):
+            errors.append(f"Expected a {name} id")
+        ids[name] = value
+    quantity = item.get("quantity")
+    if (
+        not isinstance(quantity, int)
+        or isinstance(quantity, bool)
+        or not 0 < quantity <= MAX_QUANTITY
+    ):
+        errors.append(f"Quantity must be a whole number from 1 to {MAX_QUANTITY}")
+    try:
+        transaction_date = date.fromisoformat(item.get("transaction_date"))
+    except (TypeError, ValueError):
+        errors.append("Expected a transaction date, YYYY-MM-DD")
+    else:
+        if not today - timedelta(days=MAX_PUSH_AGE) <= transaction_date <= today:
+            errors.append(
+                f"Transaction date must be within the last {MAX_PUSH_AGE} days"
+            )
+    if errors:
+        return None, errors
+    return (
+        FarmersMarketTransaction(
+            id=pk,
+            farmer_id=ids["farmer"],
+            market_id=ids["market"],
+            produce_id=ids["produce"],
+            quantity=quantity,
+            transaction_date=transaction_date,
+        ),
+        [],
+    )
+
+
+def _check(txns):
+    """Return the errors of each parsed transaction against the database"""
+    # Inactive markets are unknown to devices, as they are to intake
+    markets = (
+        Market.objects.filter(is_active=True)
+        .only("pk", "last_market_day", "market_frequency")
+        .in_bulk({txn.market_id for txn in txns})
+    )
+    traded = set(
+        Market.produce_items.through.objects.filter(market_id__in=markets).values_list(
+            "market_id", "produce_id"
+        )
+    )
+    farmers = set(
+        Farmer.objects.filter(pk__in={txn.farmer_id for txn in txns}).values_list(
+            "pk", flat=True
+        )
+    )
+    produce = set(
+        Produce.objects.filter(pk__in={txn.produce_id for txn in txns}).values_list(
+            "pk", flat=True
+        )
+    )
+
+    errors = {}
+    for txn in txns:
+        found = []
+        market = markets.get(txn.market_id)
+        if market is None:
+            found.append("Unknown market")
+        elif (
+            txn.transaction_date - market.last_market_day
+        ).days % market.market_frequency:
+            found.append("Transactions can only be recorded on market days")
+        if txn.produce_id not in produce:
+            found.append("Unknown produce")
+        elif market is not None and (txn.market_id, txn.produce_id) not in traded:
+            found.append("The market does not trade this produce")
+        if txn.farmer_id not in farmers:
+            found.append("Unknown farmer")
+        errors[txn.pk] = found
+    return errors
+
+
+def _saved_points(ids):
+    """Return the points of the transactions with these ids that are saved"""
+    points = {}
+    for model in (FarmersMarketTransaction, ArchivedMarketTransaction):
+        points.update(
+            model.objects.filter(pk__in=ids).values_list("pk", "points_earned")
+        )
+    return points
+
+
+def push(items):
+    """
+    Save market transactions pushed by a device, and return a result for each.
+    A transaction whose id is already saved is not saved again, and is
+    reported as saved; one that clashes with a different transaction of the
+    same farmer, market, produce and date is reported as a conflict.
+    """
+    today = date.today()
+    parsed = [_parse(item, today) for item in items]
+    # A transaction pushed twice in one batch is saved once, first one wins
+    txns = {}
+    for txn, _ in parsed:
+        if txn is not None:
+            txns.setdefault(txn.pk, txn)
+
+    already = _saved_points(list(txns))
+    new = [txn for pk, txn in txns.items() if pk not in already]
+    errors = _check(new)
+    valid = [txn for txn in new if not errors[txn.pk]]
+    if valid:
+        # Transactions clashing with a saved one are left out, see below
+        ingest.write(valid, on_conflict="ignore")
+    points = _saved_points(list(txns))
+    written = [txn for txn in valid if txn.pk in points and txn.pk not in already]
+    if written:
+        ingest.finish(
+            {txn.farmer_id for txn in written},
+            {(txn.market_id, txn.produce_id, txn.transaction_date) for txn in written},
+        )
+
+    results = []
+    for item, (txn, found) in zip(items, parsed):
+        result = {"id": item.get("id") if isinstance(item, dict) else None}
+        if txn is not None:
+            found = errors.get(txn.pk, [])
+        if found:
+            result.update(status="invalid", errors=found)
+        elif txn.pk in points:
+            result.update(status="saved", points_earned=points[txn.pk])
+        else:
+            result.update(status="conflict")
+        results.append(result)
+    return results
@@ -0,0 +1,47 @@
+"""Fixture helpers shared by the apps' tests"""
+
+from cities_light.models import Country, Region, SubRegion
+
+from farmers.models import Farmer
+from market.models import Address, ContactPerson, Market
+
+
+def create_location():
+    """Return the country, state and LGA fixtures are placed in"""
+    country, _ = Country.objects.get_or_create(name="Nigeria", code2="NG")
+    state, _ = Region.objects.get_or_create(name="Kano", country=country)
+    lga, _ = SubRegion.objects.get_or_create(
+        name="Kano Municipal", region=state, country=country
+    )
+    return country, state, lga
+
+
+def create_farmer(first_name="Amina", last_name="Bello", **fields):
+    country, state, lga = create_location()
+    return Farmer.objects.create(
+        first_name=first_name,
+        last_name=last_name,
+        gender=Farmer.Gender.FEMALE,
+        education=Farmer.Education.PRIMARY_SCHOOL,
+        state=state,
+        country=country,
+        lga=lga,
+        state_of_origin=state,
+        slug=f"{first_name}-{last_name}".lower(),
+        **fields,
+    )
+
+
+def create_market(name="Dawanau", phone_number="+2348031234567", **fields):
+    """Create a market with its contact person and an address in the LGA"""
+    market = Market.objects.create(
+        name=name,
+        slug=name.lower(),
+        contact_person=ContactPerson.objects.create(
+            first_name="Musa", last_name=name, phone_number=phone_number
+        ),
+        **fields,
+    )
+    country, state, lga = create_location()
+    Address.objects.create(market=market, local_govt=lga, state=state, country=country)
+    return market
@@ -1,3 +1,245 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import uuid
+from datetime import date
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core import sync
+from core.models import SyncChange
+from core.pagination import CURSOR_VAR, EstimatedCountPaginator
+from core.testing import create_farmer, create_market
+from farmers.models import FarmersMarketTransaction
+from market.models import Produce
+
+
+class SyncCursorTest(TestCase):
+    def pull(self, cursor):
+        page = sync.pull(["produce"], cursor)
+        return page["cursor"], [row[0] for row in page["tables"]["produce"]["rows"]]
+
+    def test_changes_are_pulled_in_commit_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            maize = Produce.objects.create(name="Maize", slug="maize")
+        cursor, rows = self.pull(0)
+        self.assertEqual(rows, [maize.pk])
+
+        # A transaction that took its change id early and committed after a
+        # device pulled a later change
+        millet = Produce.objects.create(name="Millet", slug="millet")
+        sorghum = Produce.objects.create(name="Sorghum", slug="sorghum")
+        SyncChange.objects.filter(sequence__isnull=True).delete()
+        first = SyncChange.objects.order_by("-pk").values_list("pk", flat=True)[0]
+        SyncChange.objects.create(id=first + 10, table="produce", object_id=sorghum.pk)
+        sync.publish()
+        cursor, rows = self.pull(cursor)
+        self.assertEqual(rows, [sorghum.pk])
+
+        SyncChange.objects.create(id=first + 5, table="produce", object_id=millet.pk)
+        sync.publish()
+        cursor, rows = self.pull(cursor)
+        self.assertEqual(rows, [millet.pk])
+        self.assertEqual(sync.pull(["produce"], cursor)["tables"], {})
+
+    def test_unpublished_changes_are_not_pulled_past(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Produce.objects.create(name="Maize", slug="maize")
+        self.assertTrue(callbacks)
+        self.assertTrue(SyncChange.objects.filter(sequence__isnull=True).exists())
+        # Pulling publishes the committed changes left behind
+        self.assertEqual(len(self.pull(0)[1]), 1)
+        self.assertFalse(SyncChange.objects.filter(sequence__isnull=True).exists())
+
+    def test_compact_keeps_the_last_change_of_each_row(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            maize = Produce.objects.create(name="Maize", slug="maize")
+            maize.name = "Yellow maize"
+            maize.save()
+        self.assertEqual(sync.compact(), 1)
+        self.assertEqual(self.pull(0)[1], [maize.pk])
+
+
+class SyncPushTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        produce = Produce.objects.create(name="Maize", slug="maize")
+        cls.markets = [
+            create_market(last_market_day=date.today()),
+            create_market(
+                "Mile 12",
+                "+2348031234568",
+                last_market_day=date.today(),
+                is_active=False,
+            ),
+        ]
+        for market in cls.markets:
+            market.produce_items.add(produce)
+        cls.produce = produce
+        cls.user = get_user_model().objects.create_superuser(
+            "device", "device@example.com", "password"
+        )
+
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(self.user)
+
+    def push(self, token=None):
+        items = [
+            {
+                "id": str(uuid.uuid4()),
+                "farmer": self.farmer.pk,
+                "market": market.pk,
+                "produce": self.produce.pk,
+                "quantity": 3,
+                "transaction_date": date.today().isoformat(),
+            }
+            for market in self.markets
+        ]
+        return self.client.post(
+            reverse("sync_push"),
+            json.dumps(items),
+            content_type="application/json",
+            headers={"X-CSRFToken": token} if token else {},
+        )
+
+    def test_push_sends_the_csrf_token_of_a_pull(self):
+        self.assertEqual(self.push().status_code, 403)
+
+        self.client.get(reverse("sync_pull"), {"tables": "produce"})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.push(self.client.cookies["csrftoken"].value)
+        self.assertEqual(response.status_code, 200)
+        saved, inactive = response.json()["results"]
+        self.assertEqual(saved["status"], "saved")
+        # An inactive market takes no transactions
+        self.assertEqual(inactive["status"], "invalid")
+        self.assertEqual(inactive["errors"], ["Unknown market"])
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_points_aggregation_needs_transactions(self):
+        with self.assertRaisesMessage(CommandError, "no transactions to benchmark"):
+            call_command("benchmark_points_aggregation")
+
+    def test_points_aggregation_totals_agree(self):
+        out = StringIO()
+        call_command(
+            "benchmark_points_aggregation",
+            seed=5,
+            transactions_per_farmer=3,
+            stdout=out,
+        )
+        self.assertIn("points of 5 farmers", out.getvalue())
+        self.assertNotIn("differ", out.getvalue())
+
+
+class LoadMarketTransactionsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        create_market()
+        Produce.objects.create(name="Maize", slug="maize")
+
+    def load(self, *rows, **options):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as file:
+            writer = csv.writer(file)
+            writer.writerow(
+                ["farmer", "market", "produce", "quantity", "transaction_date"]
+            )
+            writer.writerows(rows)
+        self.addCleanup(os.remove, file.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "load_market_transactions",
+                file.name,
+                stdout=StringIO(),
+                stderr=StringIO(),
+                **options,
+            )
+
+    def test_rows_are_loaded_and_reloaded(self):
+        self.load(
+            ["amina-bello", "dawanau", "maize", 4, "2024-05-02"],
+            ["amina-bello", "dawanau", "maize", 6, "2024-05-09"],
+            ["amina-bello", "nowhere", "maize", 8, "2024-05-09"],
+        )
+        self.assertQuerySetEqual(
+            FarmersMarketTransaction.objects.order_by("transaction_date").values_list(
+                "quantity", flat=True
+            ),
+            [4, 6],
+        )
+        self.farmer.refresh_from_db()
+        self.assertEqual(self.farmer.earned_points, 10)
+
+        # A row for a sale already loaded replaces it by default
+        self.load(["amina-bello", "dawanau", "maize", 9, "2024-05-02"])
+        self.load(
+            ["amina-bello", "dawanau", "maize", 1, "2024-05-09"],
+            on_conflict="ignore",
+        )
+        self.assertQuerySetEqual(
+            FarmersMarketTransaction.objects.order_by("transaction_date").values_list(
+                "quantity", flat=True
+            ),
+            [9, 6],
+        )
+        self.farmer.refresh_from_db()
+        self.assertEqual(self.farmer.earned_points, 15)
+
+
+class KeysetPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        farmer = create_farmer()
+        market = create_market()
+        produce = Produce.objects.create(name="Maize", slug="maize")
+        cls.sales = [
+            FarmersMarketTransaction.objects.create(
+                farmer=farmer,
+                market=market,
+                produce=produce,
+                quantity=1,
+                transaction_date=date(2024, 5, day),
+            )
+            for day in (2, 9, 16, 23, 30)
+        ]
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "password"
+        )
+
+    def test_changelist_pages_by_cursor(self):
+        self.client.force_login(self.user)
+        url = reverse("admin:farmers_farmersmarkettransaction_changelist")
+        pages, params = [], {}
+        with mock.patch.object(
+            admin.site._registry[FarmersMarketTransaction], "list_per_page", 2
+        ):
+            while True:
+                changelist = self.client.get(url, params).context["cl"]
+                pages.append([sale.pk for sale in changelist.result_list])
+                if changelist.next_cursor is None:
+                    break
+                params = {CURSOR_VAR: changelist.next_cursor}
+        newest_first = [sale.pk for sale in reversed(self.sales)]
+        self.assertEqual(pages, [newest_first[:2], newest_first[2:4], newest_first[4:]])
+
+    def test_count_is_estimated_past_the_threshold(self):
+        sales = FarmersMarketTransaction.objects.order_by("transaction_date")
+        paginator = EstimatedCountPaginator(sales, 2, threshold=3)
+        # Without a planner estimate, the rows counted up to the threshold
+        self.assertEqual(paginator.count, 4)
+        self.assertTrue(paginator.estimated)
+        self.assertEqual(list(paginator.page(3)), [self.sales[4]])
+        self.assertEqual(list(paginator.page(9)), [])
+        exact = EstimatedCountPaginator(sales, 2, threshold=None)
+        self.assertEqual((exact.count, exact.estimated), (5, False))
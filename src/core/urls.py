@@ -1,7 +1,12 @@
 from django.urls import path
 from django.views.generic import TemplateView
 
+from . import views
+
 # URLConf
 urlpatterns = [
     path("", TemplateView.as_view(template_name="core/home.html"), name="home"),
+    path("exports/<slug:name>.<slug:format>", views.export, name="export"),
+    path("sync/pull/", views.sync_pull, name="sync_pull"),
+    path("sync/push/", views.sync_push, name="sync_push"),
 ]
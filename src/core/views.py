@@ -1,2 +1,77 @@
-from django.http import HttpResponse
-from django.shortcuts import render
+import json
+
+from django.contrib.auth.decorators import login_required, permission_required
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.http import (
+    Http404,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET, require_POST
+
+from . import exports, sync
+
+# Largest batch of transactions one push may send
+MAX_PUSH_ITEMS = 1000
+
+
+@login_required
+def export(request, name, format):
+    """Stream an export as CSV or JSON Lines, filtered by the query string"""
+    if name not in exports.EXPORTS or format not in exports.FORMATS:
+        raise Http404
+    opts = exports.EXPORTS[name].model._meta
+    if not request.user.has_perm(f"{opts.app_label}.view_{opts.model_name}"):
+        raise PermissionDenied
+    try:
+        chunks = exports.render(name, format, request.GET)
+    except ValidationError as error:
+        return HttpResponseBadRequest("; ".join(error.messages))
+    return StreamingHttpResponse(
+        chunks,
+        content_type=exports.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{format}"'},
+    )
+
+
+@require_GET
+@login_required
+@ensure_csrf_cookie
+@gzip_page
+def sync_pull(request):
+    """
+    Return the synced rows changed since the cursor in the query string. The
+    response sets the CSRF cookie a device sends back when it pushes.
+    """
+    try:
+        tables, cursor, limit = sync.pull_params(request.GET)
+    except ValidationError as error:
+        return HttpResponseBadRequest("; ".join(error.messages))
+    for name in tables:
+        opts = sync.TABLES[name].model._meta
+        if not request.user.has_perm(f"{opts.app_label}.view_{opts.model_name}"):
+            raise PermissionDenied
+    return JsonResponse(sync.pull(tables, cursor, limit))
+
+
+@require_POST
+@permission_required("farmers.add_farmersmarkettransaction", raise_exception=True)
+def sync_push(request):
+    """
+    Save a batch of market transactions recorded on a device. Devices use the
+    session they logged in with, so the request is CSRF checked like a form:
+    it sends the value of the csrftoken cookie, set at login or by a pull, in
+    an X-CSRFToken header, and over HTTPS a Referer of this site as well.
+    """
+    try:
+        items = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid JSON")
+    if not isinstance(items, list) or len(items) > MAX_PUSH_ITEMS:
+        return HttpResponseBadRequest(
+            f"Expected a list of up to {MAX_PUSH_ITEMS} transactions"
+        )
+    return JsonResponse({"results": sync.push(items)})
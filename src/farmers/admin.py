@@ -1,17 +1,34 @@
-from django.contrib import admin
-from unfold.admin import ModelAdmin
+from django.contrib import admin, messages
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from unfold.admin import ModelAdmin, TabularInline
 
+from core.filters import AutocompleteFilter, AutocompleteFilterMixin
+from core.pagination import KeysetPaginationMixin
+from farmers import dedup, search
+from farmers.managers import AGE_BANDS
 from farmers.models import (
     AgroVendor,
+    ArchivedMarketTransaction,
+    DuplicateCandidate,
     Farmer,
     FarmersInputTransaction,
     FarmersMarketTransaction,
     FieldExtensionOfficer,
+    LeaderboardEntry,
+    PointsLedgerEntry,
+    PointsRule,
+    PointsRuleSet,
+    TransactionAnomaly,
 )
 
+SEARCH_LIMIT = 100
+
 
 @admin.register(AgroVendor)
-class AgroVendorAdmin(ModelAdmin):
+class AgroVendorAdmin(AutocompleteFilterMixin, ModelAdmin):
     list_display = (
         "name",
         "state",
@@ -19,11 +36,35 @@ class AgroVendorAdmin(ModelAdmin):
         "phone_number",
         "verification_status",
     )
-    list_filter = ("verification_status", "state")
+    list_filter = ("verification_status", ("state", AutocompleteFilter))
+    search_fields = ("name__istartswith",)
+
+
+class AgeBandFilter(admin.SimpleListFilter):
+    title = "Age band"
+    parameter_name = "age_band"
+
+    def lookups(self, request, model_admin):
+        return [(band, label) for band, (label, *_) in AGE_BANDS.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() in AGE_BANDS:
+            return queryset.in_age_band(self.value())
+
+
+class AgeMixin:
+    """Show the age computed by the database, sortable by date of birth"""
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_age()
+
+    @admin.display(description="Age", ordering="-date_of_birth")
+    def age(self, obj):
+        return obj.age
 
 
 @admin.register(FieldExtensionOfficer)
-class FieldExtensionOfficerAdmin(ModelAdmin):
+class FieldExtensionOfficerAdmin(AgeMixin, ModelAdmin):
     list_display = (
         "first_name",
         "last_name",
@@ -38,13 +79,14 @@ class FieldExtensionOfficerAdmin(ModelAdmin):
         "means_of_identification",
         "identification_number",
     )
+    list_filter = (AgeBandFilter, "gender")
     autocomplete_fields = ("state_of_origin", "state")
     list_select_related = ("state_of_origin", "state")
     prepopulated_fields = {"slug": ("first_name", "last_name", "phone_number")}
 
 
 @admin.register(Farmer)
-class FarmerAdmin(ModelAdmin):
+class FarmerAdmin(AgeMixin, ModelAdmin):
     list_display = (
         "first_name",
         "last_name",
@@ -75,7 +117,10 @@ class FarmerAdmin(ModelAdmin):
     list_filter = (
         "is_verified",
         "gender",
+        AgeBandFilter,
     )
+    search_fields = ("phone_number", "identification_number", "first_name")
+    search_help_text = "Phone number, identification number or name"
     autocomplete_fields = ("state_of_origin", "state", "lga")
     prepopulated_fields = {
         "slug": (
@@ -85,9 +130,19 @@ class FarmerAdmin(ModelAdmin):
         )
     }
 
+    def get_search_results(self, request, queryset, search_term):
+        # Served by the lookup indexes instead of icontains over every field
+        if not search_term.strip():
+            return queryset, False
+        matches = search.search(search_term, limit=SEARCH_LIMIT, queryset=queryset)
+        return queryset.filter(pk__in=[farmer.pk for farmer in matches]), False
+
 
 @admin.register(FarmersMarketTransaction)
-class FarmersMarketTransactionAdmin(ModelAdmin):
+class FarmersMarketTransactionAdmin(
+    AutocompleteFilterMixin, KeysetPaginationMixin, ModelAdmin
+):
+    keyset_ordering = ("-transaction_date", "-pk")
     list_display = (
         "id",
         "farmer",
@@ -98,7 +153,27 @@ class FarmersMarketTransactionAdmin(ModelAdmin):
         "points_earned",
     )
     list_select_related = ("farmer", "market", "produce")
-    list_filter = ("market__name", "farmer")
+    list_filter = (("market", AutocompleteFilter), ("farmer", AutocompleteFilter))
+
+
+@admin.register(ArchivedMarketTransaction)
+class ArchivedMarketTransactionAdmin(
+    AutocompleteFilterMixin, KeysetPaginationMixin, ModelAdmin
+):
+    keyset_ordering = ("-transaction_date", "-pk")
+    list_display = FarmersMarketTransactionAdmin.list_display
+    list_select_related = FarmersMarketTransactionAdmin.list_select_related
+    list_filter = FarmersMarketTransactionAdmin.list_filter
+
+    # Archived transactions are only moved here by farmers.archive
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(FarmersInputTransaction)
@@ -112,3 +187,157 @@ class FarmersInputTransactionAdmin(ModelAdmin):
         "points_earned",
     )
     list_select_related = ("farmer", "vendor", "market")
+
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(ModelAdmin):
+    list_display = ("farmer", "scope", "scope_id", "year", "points")
+    list_select_related = ("farmer",)
+    list_filter = ("scope", "year")
+    ordering = ("-points",)
+
+
+class PointsRuleInline(TabularInline):
+    model = PointsRule
+    extra = 1
+    autocomplete_fields = ("market",)
+
+
+@admin.register(PointsRuleSet)
+class PointsRuleSetAdmin(ModelAdmin):
+    list_display = ("version", "description", "is_active", "created_at")
+    inlines = [PointsRuleInline]
+
+
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(ModelAdmin):
+    list_display = ("kind", "record", "duplicate", "score", "reasons", "status")
+    list_filter = ("kind", "status")
+    ordering = ("-score",)
+    readonly_fields = ("kind", "record_id", "duplicate_id", "score", "reasons")
+    actions = ["merge_candidates", "dismiss_candidates"]
+
+    def _link(self, candidate, pk):
+        model = dedup.MODELS[candidate.kind]._meta
+        url = reverse(f"admin:{model.app_label}_{model.model_name}_change", args=[pk])
+        return format_html('<a href="{}">{}</a>', url, pk)
+
+    @admin.display(description="Kept record")
+    def record(self, candidate):
+        return self._link(candidate, candidate.record_id)
+
+    @admin.display(description="Duplicate")
+    def duplicate(self, candidate):
+        return self._link(candidate, candidate.duplicate_id)
+
+    @admin.action(description="Merge the duplicates into the kept records")
+    def merge_candidates(self, request, queryset):
+        merged = 0
+        for candidate in queryset.filter(status=DuplicateCandidate.Status.PENDING):
+            try:
+                dedup.merge(candidate)
+                merged += 1
+            except ValidationError as e:
+                self.message_user(
+                    request, f"{candidate}: {' '.join(e.messages)}", messages.ERROR
+                )
+            except ObjectDoesNotExist:
+                self.message_user(
+                    request, f"{candidate}: a record no longer exists", messages.ERROR
+                )
+        self.message_user(request, f"Merged {merged} duplicate records.")
+
+    @admin.action(description="Dismiss the selected candidates")
+    def dismiss_candidates(self, request, queryset):
+        dismissed = queryset.filter(status=DuplicateCandidate.Status.PENDING).update(
+            status=DuplicateCandidate.Status.DISMISSED, reviewed_at=timezone.now()
+        )
+        self.message_user(request, f"Dismissed {dismissed} candidates.")
+
+
+@admin.register(TransactionAnomaly)
+class TransactionAnomalyAdmin(AutocompleteFilterMixin, ModelAdmin):
+    list_display = (
+        "source",
+        "transaction",
+        "farmer",
+        "market",
+        "produce",
+        "week",
+        "value",
+        "median",
+        "score",
+        "status",
+    )
+    list_filter = (
+        "source",
+        "status",
+        ("market", AutocompleteFilter),
+        "week",
+    )
+    list_select_related = ("farmer", "market", "produce")
+    ordering = ("-score",)
+    readonly_fields = (
+        "source",
+        "source_id",
+        "farmer",
+        "market",
+        "produce",
+        "week",
+        "value",
+        "median",
+        "mad",
+        "score",
+    )
+    actions = ["confirm_anomalies", "dismiss_anomalies"]
+
+    def get_changelist_instance(self, request):
+        """Find which of the page's market transactions were archived, in one query"""
+        changelist = super().get_changelist_instance(request)
+        anomalies = [
+            anomaly
+            for anomaly in changelist.result_list
+            if anomaly.source == PointsLedgerEntry.Source.MARKET
+        ]
+        hot = {
+            str(pk)
+            for pk in FarmersMarketTransaction.objects.filter(
+                pk__in=[anomaly.source_id for anomaly in anomalies]
+            ).values_list("pk", flat=True)
+        }
+        for anomaly in anomalies:
+            anomaly.archived = anomaly.source_id not in hot
+        return changelist
+
+    @admin.display(description="Transaction")
+    def transaction(self, anomaly):
+        if anomaly.source == PointsLedgerEntry.Source.INPUT:
+            model = FarmersInputTransaction
+        else:
+            archived = getattr(anomaly, "archived", None)
+            if archived is None:
+                archived = not FarmersMarketTransaction.objects.filter(
+                    pk=anomaly.source_id
+                ).exists()
+            model = ArchivedMarketTransaction if archived else FarmersMarketTransaction
+        opts = model._meta
+        url = reverse(
+            f"admin:{opts.app_label}_{opts.model_name}_change",
+            args=[anomaly.source_id],
+        )
+        return format_html('<a href="{}">{}</a>', url, anomaly.source_id)
+
+    def _review(self, request, queryset, status):
+        return queryset.filter(status=TransactionAnomaly.Status.PENDING).update(
+            status=status, reviewed_at=timezone.now()
+        )
+
+    @admin.action(description="Confirm the selected anomalies")
+    def confirm_anomalies(self, request, queryset):
+        confirmed = self._review(request, queryset, TransactionAnomaly.Status.CONFIRMED)
+        self.message_user(request, f"Confirmed {confirmed} anomalies.")
+
+    @admin.action(description="Dismiss the selected anomalies")
+    def dismiss_anomalies(self, request, queryset):
+        dismissed = self._review(request, queryset, TransactionAnomaly.Status.DISMISSED)
+        self.message_user(request, f"Dismissed {dismissed} anomalies.")
@@ -0,0 +1,225 @@
+"""
+Flagging transactions with inflated quantities or amounts for review.
+
+Points follow a market transaction's quantity and an input purchase's
+amount, so inflating them is how the reward is gamed. Each transaction is
+compared with the others of its market and produce (input purchases: its
+market) in the same week by a robust z-score, the distance above the group's
+median in median absolute deviations, which a few inflated entries cannot
+drag towards themselves the way they would a mean and standard deviation.
+Transactions scoring above `THRESHOLD` are stored as `TransactionAnomaly`
+rows for review.
+
+Rows are read a few weeks at a time into NumPy arrays, and every group's
+statistics are computed together from one sort, without a Python loop over
+groups or rows. A `ProcessingCheckpoint` records the first week that can
+still change: later runs only read the weeks from there on.
+"""
+
+from collections import namedtuple
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import models, transaction
+
+from core import sync
+from core.models import ProcessingCheckpoint
+
+from .models import (
+    ArchivedMarketTransaction,
+    FarmersInputTransaction,
+    FarmersMarketTransaction,
+    PointsLedgerEntry,
+    TransactionAnomaly,
+)
+
+Source = PointsLedgerEntry.Source
+
+# Robust z-score above which a transaction is flagged
+THRESHOLD = 3.5
+# Groups with fewer transactions are not scored
+MIN_GROUP_SIZE = 8
+WEEKS_PER_BATCH = 4
+# Devices push transactions up to this many days late, so weeks are rescored
+# until they are this old
+SETTLE_DAYS = sync.MAX_PUSH_AGE
+# Scales the median absolute deviation, and the mean absolute deviation used
+# when it is 0, to a standard deviation of normally distributed values
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+Detector = namedtuple(
+    "Detector", ["models", "date_field", "value_field", "group_fields", "checkpoint"]
+)
+
+DETECTORS = {
+    Source.MARKET: Detector(
+        (FarmersMarketTransaction, ArchivedMarketTransaction),
+        "transaction_date",
+        "quantity",
+        ("market_id", "produce_id"),
+        "market_transaction_anomalies",
+    ),
+    Source.INPUT: Detector(
+        (FarmersInputTransaction,),
+        "receipt_verification_date",
+        "amount",
+        ("market_id",),
+        "input_transaction_anomalies",
+    ),
+}
+
+
+def week_of(day):
+    """Return the Monday of a date's week"""
+    return day - timedelta(days=day.weekday())
+
+
+def _group_ends(keys):
+    """Return where each run of equal keys starts in sorted key arrays"""
+    changed = np.zeros(len(keys[0]), dtype=bool)
+    changed[0] = True
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+    return np.flatnonzero(changed)
+
+
+def _middle(values, starts, counts):
+    """Return the median of each group of sorted values"""
+    return (values[starts + (counts - 1) // 2] + values[starts + counts // 2]) / 2
+
+
+def robust_scores(keys, values, min_group_size=MIN_GROUP_SIZE):
+    """
+    Return the median, median absolute deviation and robust z-score of every
+    value within the group of values with the same keys, in input order.
+    Values in groups smaller than `min_group_size` score 0.
+    """
+    if not len(values):
+        empty = np.zeros(0)
+        return empty, empty, empty
+    order = np.lexsort((values, *reversed(keys)))
+    sorted_values = values[order]
+    starts = _group_ends([key[order] for key in keys])
+    counts = np.diff(np.append(starts, len(values)))
+    group = np.repeat(np.arange(len(starts)), counts)
+
+    median = _middle(sorted_values, starts, counts)
+    deviation = np.abs(sorted_values - median[group])
+    mad = _middle(deviation[np.lexsort((deviation, group))], starts, counts)
+    # More than half the group has the same value: fall back on the mean
+    spread = np.where(
+        mad > 0,
+        mad * MAD_SCALE,
+        np.add.reduceat(deviation, starts) / counts * MEAN_AD_SCALE,
+    )
+    score = np.divide(
+        sorted_values - median[group],
+        spread[group],
+        out=np.zeros(len(values)),
+        where=(spread[group] > 0) & (counts[group] >= min_group_size),
+    )
+
+    unsorted = np.empty_like(order)
+    unsorted[order] = np.arange(len(order))
+    return median[group][unsorted], mad[group][unsorted], score[unsorted]
+
+
+def _load(detector, first, last):
+    """Return the transactions dated in [first, last] as columns"""
+    fields = [
+        "pk",
+        "farmer_id",
+        *detector.group_fields,
+        detector.date_field,
+        detector.value_field,
+    ]
+    rows = []
+    for model in detector.models:
+        rows += model.objects.filter(
+            **{f"{detector.date_field}__range": (first, last)}
+        ).values_list(*fields)
+    return dict(zip(fields, zip(*rows))) if rows else None
+
+
+def _flag(source, detector, first, last, threshold):
+    """Score the transactions of the weeks from `first` to `last`"""
+    columns = _load(detector, first, last)
+    flagged = []
+    if columns:
+        weeks = np.array([day.toordinal() for day in columns[detector.date_field]])
+        weeks -= (weeks - 1) % 7  # date.fromordinal(1) is a Monday
+        keys = [weeks] + [np.array(columns[name]) for name in detector.group_fields]
+        values = np.array(columns[detector.value_field], dtype=float)
+        median, mad, score = robust_scores(keys, values)
+        produce = columns.get("produce_id")
+        for i in np.flatnonzero(score > threshold):
+            flagged.append(
+                TransactionAnomaly(
+                    source=source,
+                    source_id=str(columns["pk"][i]),
+                    farmer_id=columns["farmer_id"][i],
+                    market_id=columns["market_id"][i],
+                    produce_id=produce[i] if produce else None,
+                    week=date.fromordinal(int(weeks[i])),
+                    value=columns[detector.value_field][i],
+                    median=median[i],
+                    mad=mad[i],
+                    score=score[i],
+                )
+            )
+
+    with transaction.atomic():
+        # Pending flags are replaced; reviewed ones are kept as they are
+        TransactionAnomaly.objects.filter(
+            source=source,
+            week__range=(first, last),
+            status=TransactionAnomaly.Status.PENDING,
+        ).delete()
+        TransactionAnomaly.objects.bulk_create(
+            flagged, batch_size=1000, ignore_conflicts=True
+        )
+    return len(columns["pk"]) if columns else 0, len(flagged)
+
+
+def _earliest(detector):
+    days = [
+        model.objects.aggregate(first=models.Min(detector.date_field))["first"]
+        for model in detector.models
+    ]
+    days = [day for day in days if day is not None]
+    return min(days) if days else None
+
+
+def flag(source, threshold=THRESHOLD, full=False):
+    """
+    Flag the outlying transactions of a source in the weeks not yet settled,
+    or in every week with `full`. Returns the number of transactions scored
+    and flagged.
+    """
+    detector = DETECTORS[source]
+    today = date.today()
+    start = None
+    if not full:
+        start = (
+            ProcessingCheckpoint.objects.filter(name=detector.checkpoint)
+            .values_list("position", flat=True)
+            .first()
+        )
+    if start is None:
+        start = _earliest(detector) or today
+
+    scored = flagged = 0
+    week = week_of(start)
+    while week <= today:
+        last = week + timedelta(weeks=WEEKS_PER_BATCH) - timedelta(days=1)
+        counts = _flag(source, detector, week, last, threshold)
+        scored += counts[0]
+        flagged += counts[1]
+        week = last + timedelta(days=1)
+
+    ProcessingCheckpoint.objects.update_or_create(
+        name=detector.checkpoint,
+        defaults={"position": week_of(today - timedelta(days=SETTLE_DAYS))},
+    )
+    return scored, flagged
@@ -0,0 +1,136 @@
+"""
+Moving the market transactions of closed years out of the hot table.
+
+`archive()` moves every transaction dated before a year boundary from
+`FarmersMarketTransaction` to `ArchivedMarketTransaction` a chunk at a time,
+and records the boundary in a `ProcessingCheckpoint`: every archived
+transaction is older than it, so queries over later dates skip the archive.
+On PostgreSQL the archive is range partitioned by year, and a year's
+partition is created before its transactions are moved.
+
+Rows are moved without the save and delete signals, so points, ledger
+entries, flags and rollups are unchanged. A row for a sale the archive
+already holds is a duplicate, and is deleted with its signals instead so
+its points are taken back. The queries that read the raw transactions read
+the archive as well.
+"""
+
+from datetime import date
+
+from django.db import connection, models, transaction
+
+from core.models import ProcessingCheckpoint
+from core.pagination import after
+
+from .models import ArchivedMarketTransaction, FarmersMarketTransaction
+
+CHECKPOINT = "market_transaction_archive"
+
+FIELDS = [
+    "id",
+    "farmer_id",
+    "market_id",
+    "produce_id",
+    "quantity",
+    "transaction_date",
+    "points_earned",
+]
+ORDERING = ("transaction_date", "pk")
+
+
+def archived_before():
+    """Return the date every archived transaction is older than, or None"""
+    return (
+        ProcessingCheckpoint.objects.filter(name=CHECKPOINT)
+        .values_list("position", flat=True)
+        .first()
+    )
+
+
+def create_partition(year):
+    """Create the archive partition of a year on PostgreSQL, if it is missing"""
+    if connection.vendor != "postgresql":
+        return
+    table = ArchivedMarketTransaction._meta.db_table
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {quote(f'{table}_{year}')} "
+            f"PARTITION OF {quote(table)} FOR VALUES FROM (%s) TO (%s)",
+            [date(year, 1, 1), date(year + 1, 1, 1)],
+        )
+
+
+def _copy(queryset):
+    """
+    Copy transactions to the archive with one INSERT ... SELECT. Rows already
+    copied by a run that failed before its delete committed are skipped.
+    """
+    select, params = (
+        queryset.order_by()
+        .values_list(*FIELDS)
+        .query.get_compiler(connection=connection)
+        .as_sql()
+    )
+    quote = connection.ops.quote_name
+    columns = ", ".join(
+        quote(ArchivedMarketTransaction._meta.get_field(name).column) for name in FIELDS
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(ArchivedMarketTransaction._meta.db_table)} "
+            f"({columns}) {select} ON CONFLICT DO NOTHING",
+            params,
+        )
+
+
+def archive(before, chunk_size=5000):
+    """
+    Move the transactions dated before `before`, a January 1st, to the
+    archive. Returns the number of transactions moved.
+    """
+    transactions = FarmersMarketTransaction.objects.filter(
+        transaction_date__lt=before
+    ).order_by(*ORDERING)
+    first = transactions.values_list("transaction_date", flat=True).first()
+    if first is not None:
+        for year in range(first.year, before.year):
+            create_partition(year)
+
+    # Recorded first, so queries read the archive as soon as rows reach it
+    position = archived_before()
+    if position is None or position < before:
+        ProcessingCheckpoint.objects.update_or_create(
+            name=CHECKPOINT, defaults={"position": before}
+        )
+
+    moved = 0
+    remaining = transactions
+    while True:
+        with transaction.atomic():
+            end = list(remaining.values_list(*ORDERING)[chunk_size - 1 : chunk_size])
+            chunk = remaining
+            if end:
+                # The chunk is a range of the (transaction_date, id) index,
+                # cheaper to copy and delete by than a list of ids
+                day, pk = end[0]
+                chunk = remaining.filter(
+                    models.Q(transaction_date__lt=day)
+                    | models.Q(transaction_date=day, pk__lte=pk)
+                )
+            held = ArchivedMarketTransaction.objects.filter(
+                produce=models.OuterRef("produce"),
+                farmer=models.OuterRef("farmer"),
+                market=models.OuterRef("market"),
+                transaction_date=models.OuterRef("transaction_date"),
+            ).exclude(pk=models.OuterRef("pk"))
+            chunk.filter(models.Exists(held)).delete()
+            _copy(chunk)
+            # A plain DELETE: the delete signals would take the points back
+            moved += chunk._raw_delete(connection.alias)
+        if not end:
+            break
+        # Resume after the chunk instead of skipping the deleted rows at the
+        # start of the index
+        remaining = transactions.filter(after(ORDERING, end[0]))
+    return moved
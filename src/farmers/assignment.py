@@ -0,0 +1,192 @@
+"""
+Balanced assignment of farmers to field extension officers.
+
+Farmers without an officer are given the officer with the smallest caseload
+in their LGA, or in their state when no officer in the LGA can take them.
+Each LGA and state keeps a heap of its officers ordered by caseload, so a
+farmer is assigned in O(log officers), and the result is written with one
+UPDATE per officer for every chunk of farmers.
+
+With a distance weight, a farmer goes to the officer in the LGA or state with
+the lowest caseload plus weight * kilometres instead. Farmers are placed at
+the market they last sold at, and officers at the centre of their farmers'
+markets; either without a known place adds no distance.
+"""
+
+import heapq
+import math
+from collections import Counter, defaultdict, namedtuple
+
+from django.db import models, transaction
+
+from core import sync
+from core.utils import chunked
+from market.models import Address
+
+from .models import Farmer, FarmersMarketTransaction, FieldExtensionOfficer
+
+Plan = namedtuple("Plan", ["assignments", "scopes", "unassigned", "before", "after"])
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def distance(a, b):
+    """Return the great-circle distance between two (latitude, longitude) in km"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def farmer_locations():
+    """Return the coordinates of the market each farmer last sold at"""
+    markets = {
+        market_id: (latitude, longitude)
+        for market_id, latitude, longitude in Address.objects.filter(
+            latitude__isnull=False, longitude__isnull=False
+        ).values_list("market_id", "latitude", "longitude")
+    }
+    # The farmer's latest sale at a located market, read from the
+    # (farmer, transaction_date) index
+    latest = (
+        FarmersMarketTransaction.objects.filter(
+            farmer=models.OuterRef("pk"),
+            market__address__latitude__isnull=False,
+            market__address__longitude__isnull=False,
+        )
+        .order_by("-transaction_date")
+        .values("market_id")[:1]
+    )
+    rows = Farmer.objects.annotate(last_market=models.Subquery(latest)).values_list(
+        "pk", "last_market"
+    )
+    return {
+        farmer_id: location
+        for farmer_id, market_id in rows.iterator(chunk_size=5000)
+        if (location := markets.get(market_id))
+    }
+
+
+def officer_locations(locations):
+    """Return the centre of the farmer locations of each officer"""
+    totals = defaultdict(lambda: [0.0, 0.0, 0])
+    rows = Farmer.objects.filter(field_extension_officer__isnull=False).values_list(
+        "pk", "field_extension_officer_id"
+    )
+    for farmer_id, officer_id in rows.iterator(chunk_size=5000):
+        if location := locations.get(farmer_id):
+            total = totals[officer_id]
+            total[0] += location[0]
+            total[1] += location[1]
+            total[2] += 1
+    return {pk: (lat / n, lon / n) for pk, (lat, lon, n) in totals.items()}
+
+
+def caseloads():
+    """Return the number of farmers of each officer"""
+    return dict(
+        Farmer.objects.filter(field_extension_officer__isnull=False)
+        .values("field_extension_officer")
+        .annotate(farmers=models.Count("pk"))
+        .values_list("field_extension_officer", "farmers")
+        .order_by()
+    )
+
+
+def plan(farmers=None, capacity=None, distance_weight=0):
+    """
+    Work out an officer for every farmer in `farmers` (by default, every
+    farmer without one) without saving anything. Officers already at
+    `capacity` farmers are not given more.
+    """
+    if farmers is None:
+        farmers = Farmer.objects.filter(field_extension_officer__isnull=True)
+    officers = list(
+        FieldExtensionOfficer.objects.filter(blacklisted=False).values_list(
+            "pk", "lga_id", "state_id"
+        )
+    )
+    before = caseloads()
+    load = {pk: before.get(pk, 0) for pk, _, _ in officers}
+
+    by_lga, by_state = defaultdict(list), defaultdict(list)
+    for pk, lga_id, state_id in officers:
+        by_lga[lga_id].append((load[pk], pk))
+        by_state[state_id].append((load[pk], pk))
+    for heap in (*by_lga.values(), *by_state.values()):
+        heapq.heapify(heap)
+
+    if distance_weight:
+        locations = farmer_locations()
+        centres = officer_locations(locations)
+
+    def lightest(heap):
+        # Entries go stale when the officer is given a farmer through the
+        # other heap, and are pushed back with the officer's current load
+        while heap:
+            count, pk = heap[0]
+            if count != load[pk]:
+                heapq.heapreplace(heap, (load[pk], pk))
+            elif capacity is not None and count >= capacity:
+                return None
+            else:
+                return pk
+        return None
+
+    def nearest(heap, farmer_id):
+        here = locations.get(farmer_id)
+        best, best_cost = None, None
+        for _, pk in heap:
+            if capacity is not None and load[pk] >= capacity:
+                continue
+            cost = load[pk]
+            if here and (centre := centres.get(pk)):
+                cost += distance_weight * distance(here, centre)
+            if best_cost is None or cost < best_cost:
+                best, best_cost = pk, cost
+        return best
+
+    assignments = {}
+    scopes = Counter()
+    unassigned = 0
+    rows = farmers.order_by("pk").values_list("pk", "lga_id", "state_id")
+    for farmer_id, lga_id, state_id in rows.iterator(chunk_size=5000):
+        for scope, heap in (
+            ("lga", by_lga.get(lga_id)),
+            ("state", by_state.get(state_id)),
+        ):
+            if not heap:
+                continue
+            pk = nearest(heap, farmer_id) if distance_weight else lightest(heap)
+            if pk is not None:
+                break
+        else:
+            unassigned += 1
+            continue
+        assignments[farmer_id] = pk
+        scopes[scope] += 1
+        load[pk] += 1
+    return Plan(assignments, scopes, unassigned, before, load)
+
+
+def apply(assignments, chunk_size=5000):
+    """
+    Save a plan's assignments, one UPDATE per officer for every chunk of
+    farmers. Farmers given an officer since the plan was made keep theirs.
+    Returns the number of farmers updated.
+    """
+    updated = 0
+    for chunk in chunked(assignments.items(), chunk_size):
+        by_officer = defaultdict(list)
+        for farmer_id, officer_id in chunk:
+            by_officer[officer_id].append(farmer_id)
+        with transaction.atomic():
+            for officer_id, farmer_ids in by_officer.items():
+                updated += Farmer.objects.filter(
+                    pk__in=farmer_ids, field_extension_officer__isnull=True
+                ).update(field_extension_officer_id=officer_id)
+            # The UPDATE bypasses the save signal that records the change
+            sync.record("farmers", [farmer_id for farmer_id, _ in chunk])
+    return updated
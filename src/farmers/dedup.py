@@ -0,0 +1,286 @@
+"""
+Duplicate detection and merging for farmer and officer records.
+
+Comparing every record with every other one does not scale, so records are
+first grouped into blocks that share a normalised phone number, a normalised
+identification number, an LGA and date of birth, or the phonetic codes of
+their names within a state. Only pairs inside a block are scored, and pairs
+scoring above a threshold are stored as `DuplicateCandidate` rows for review.
+"""
+
+import re
+from collections import defaultdict
+from functools import lru_cache
+from itertools import combinations
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from core import sync
+from core.utils import chunked
+
+from . import ledger
+from .models import (
+    ArchivedMarketTransaction,
+    DuplicateCandidate,
+    Farmer,
+    FarmersInputTransaction,
+    FarmersMarketTransaction,
+    FieldExtensionOfficer,
+    TransactionAnomaly,
+)
+from .search import normalize_identification, similarity
+
+Kind = DuplicateCandidate.Kind
+Status = DuplicateCandidate.Status
+
+MODELS = {Kind.FARMER: Farmer, Kind.OFFICER: FieldExtensionOfficer}
+
+# Blocks this large are shared phones or placeholder values, not people
+MAX_BLOCK_SIZE = 50
+THRESHOLD = 0.6
+# Registrations without a known birthday are saved with the field default
+PLACEHOLDER_BIRTHDAY = Farmer._meta.get_field("date_of_birth").default
+
+FIELDS = [
+    "pk",
+    "first_name",
+    "last_name",
+    "gender",
+    "date_of_birth",
+    # The stored text; parsing every number into a PhoneNumber is slow
+    Cast("phone_number", models.CharField()),
+    "identification_number",
+    "lga_id",
+    "state_id",
+]
+# Fields copied from the duplicate when the record that is kept has none
+FILLED_FIELDS = ["phone_number", "email", "identification_number", "street"]
+
+SOUNDEX_CODES = {
+    **dict.fromkeys("BFPV", "1"),
+    **dict.fromkeys("CGJKQSXZ", "2"),
+    **dict.fromkeys("DT", "3"),
+    "L": "4",
+    **dict.fromkeys("MN", "5"),
+    "R": "6",
+}
+
+
+@lru_cache(maxsize=10000)
+def soundex(name):
+    """Return the American Soundex code of a name, e.g. "Robert" -> "R163" """
+    letters = re.sub(r"[^A-Z]", "", name.upper())
+    if not letters:
+        return ""
+    code, previous = letters[0], SOUNDEX_CODES.get(letters[0])
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter)
+        if digit and digit != previous:
+            code += digit
+        # H and W do not separate letters with the same code, vowels do
+        if letter not in "HW":
+            previous = digit
+    return (code + "000")[:4]
+
+
+def phone_key(phone):
+    """Return the last ten digits of a phone number, which survive reformatting"""
+    digits = re.sub(r"\D", "", str(phone or ""))
+    return digits[-10:] if len(digits) >= 7 else ""
+
+
+def blocking_keys(row):
+    """Yield the (scheme, value) blocks a record belongs to"""
+    _, first_name, last_name, _, birthday, phone, identification, lga, state = row
+    if phone := phone_key(phone):
+        yield ("phone", phone)
+    if identification and (identification := normalize_identification(identification)):
+        yield ("id", identification)
+    if birthday != PLACEHOLDER_BIRTHDAY:
+        yield ("birthday", lga, birthday)
+    yield ("name", state, soundex(first_name), soundex(last_name))
+
+
+def _profile(row):
+    """Return the normalised values of a record that pairs are scored on"""
+    _, first_name, last_name, gender, birthday, phone, identification, lga, _ = row
+    return (
+        f"{first_name} {last_name}",
+        f"{last_name} {first_name}",
+        gender,
+        None if birthday == PLACEHOLDER_BIRTHDAY else birthday,
+        phone_key(phone),
+        normalize_identification(identification or ""),
+        lga,
+    )
+
+
+def score(a, b):
+    """Return how likely two record profiles are the same person, from 0 to 1"""
+    a_name, a_reversed, a_gender, a_birthday, a_phone, a_id, a_lga = a
+    b_name, _, b_gender, b_birthday, b_phone, b_id, b_lga = b
+    total = 0.5 * max(similarity(a_name, b_name), similarity(a_reversed, b_name))
+    if a_phone and a_phone == b_phone:
+        total += 0.3
+    if a_id and a_id == b_id:
+        total += 0.3
+    if a_birthday and a_birthday == b_birthday:
+        total += 0.25
+    if a_lga == b_lga:
+        total += 0.1
+    if a_gender != b_gender:
+        total -= 0.2
+    return max(0.0, min(total, 1.0))
+
+
+def find(kind, threshold=THRESHOLD, chunk_size=5000):
+    """
+    Block, score and store the duplicate candidates of one kind of record.
+    Returns the number of pairs scored, candidates stored and oversized
+    blocks skipped.
+    """
+    model = MODELS[kind]
+    blocks = defaultdict(list)
+    for row in model.objects.values_list(*FIELDS).iterator(chunk_size=chunk_size):
+        for key in blocking_keys(row):
+            blocks[key].append(row[0])
+
+    pairs = defaultdict(set)
+    skipped = 0
+    for key, pks in blocks.items():
+        if len(pks) > MAX_BLOCK_SIZE:
+            skipped += 1
+            continue
+        for pair in combinations(sorted(pks), 2):
+            pairs[pair].add(key[0])
+    del blocks
+
+    stored = 0
+    for chunk in chunked(pairs.items(), chunk_size):
+        ids = {pk for (a, b), _ in chunk for pk in (a, b)}
+        profiles = {
+            row[0]: _profile(row)
+            for row in model.objects.filter(pk__in=ids).values_list(*FIELDS)
+        }
+        candidates = []
+        for (a, b), reasons in chunk:
+            if (value := score(profiles[a], profiles[b])) >= threshold:
+                candidates.append(
+                    DuplicateCandidate(
+                        kind=kind,
+                        record_id=a,
+                        duplicate_id=b,
+                        score=round(value, 3),
+                        reasons=",".join(sorted(reasons)),
+                    )
+                )
+        # Pairs found by an earlier run keep their review status
+        found = set(
+            DuplicateCandidate.objects.filter(
+                kind=kind,
+                record_id__in={candidate.record_id for candidate in candidates},
+                duplicate_id__in={candidate.duplicate_id for candidate in candidates},
+            ).values_list("record_id", "duplicate_id")
+        )
+        candidates = [
+            candidate
+            for candidate in candidates
+            if (candidate.record_id, candidate.duplicate_id) not in found
+        ]
+        DuplicateCandidate.objects.bulk_create(candidates, ignore_conflicts=True)
+        stored += len(candidates)
+    return len(pairs), stored, skipped
+
+
+def _fill_missing(record, duplicate):
+    """Copy the contact details the record that is kept lacks from the duplicate"""
+    filled = []
+    for field in FILLED_FIELDS:
+        if not getattr(record, field) and getattr(duplicate, field):
+            setattr(record, field, getattr(duplicate, field))
+            filled.append(field)
+    return filled
+
+
+def merge_farmers(record, duplicate):
+    """Move everything that belongs to `duplicate` onto `record` and delete it"""
+    applications = apps.get_model("subsidy", "SubsidyApplication").objects
+    clashing = applications.filter(
+        farmer=duplicate,
+        subsidy__in=applications.filter(farmer=record).values("subsidy"),
+    )
+    if clashing.exists():
+        raise ValidationError(
+            "Both farmers applied for the same subsidy, resolve the applications first"
+        )
+
+    def held_by_record(transactions):
+        return models.Exists(
+            transactions.filter(
+                farmer=record,
+                market=models.OuterRef("market"),
+                produce=models.OuterRef("produce"),
+                transaction_date=models.OuterRef("transaction_date"),
+            )
+        )
+
+    same_sale = held_by_record(FarmersMarketTransaction.objects) | held_by_record(
+        ArchivedMarketTransaction.objects
+    )
+    # A sale recorded for both registrations, live or archived, is the same
+    # sale; the delete signals take it out of the ledger and daily rollups
+    for transactions in (
+        FarmersMarketTransaction.objects,
+        ArchivedMarketTransaction.objects,
+    ):
+        transactions.filter(farmer=duplicate).filter(same_sale).delete()
+        transactions.filter(farmer=duplicate).update(farmer=record)
+    FarmersInputTransaction.objects.filter(farmer=duplicate).update(farmer=record)
+    # Flags already reviewed are not raised again for the moved transactions
+    TransactionAnomaly.objects.filter(farmer=duplicate).update(farmer=record)
+    applications.filter(farmer=duplicate).update(farmer=record)
+    ledger.reconcile([record.pk, duplicate.pk])
+
+    filled = _fill_missing(record, duplicate)
+    duplicate.delete()
+    if filled:
+        record.save(update_fields=filled)
+    Farmer.objects.filter(pk=record.pk).refresh_transaction_flags()
+
+
+def merge_officers(record, duplicate):
+    """Move the farmers of `duplicate` onto `record` and delete it"""
+    farmers = Farmer.objects.filter(field_extension_officer=duplicate)
+    sync.record("farmers", farmers.values_list("pk", flat=True))
+    farmers.update(field_extension_officer=record)
+    filled = _fill_missing(record, duplicate)
+    duplicate.delete()
+    if filled:
+        record.save(update_fields=filled)
+
+
+@transaction.atomic
+def merge(candidate):
+    """Merge a candidate's duplicate record into the record that is kept"""
+    model = MODELS[candidate.kind]
+    record = model.objects.get(pk=candidate.record_id)
+    duplicate = model.objects.get(pk=candidate.duplicate_id)
+    if candidate.kind == Kind.FARMER:
+        merge_farmers(record, duplicate)
+    else:
+        merge_officers(record, duplicate)
+
+    # Other pairs with the deleted record are found again on the next run
+    DuplicateCandidate.objects.filter(
+        models.Q(record_id=candidate.duplicate_id)
+        | models.Q(duplicate_id=candidate.duplicate_id),
+        kind=candidate.kind,
+        status=Status.PENDING,
+    ).exclude(pk=candidate.pk).delete()
+    candidate.status = Status.MERGED
+    candidate.reviewed_at = timezone.now()
+    candidate.save(update_fields=["status", "reviewed_at"])
@@ -1,7 +1,13 @@
 import django_filters
 from django import forms
+from django.db import models
 
-from farmers.models import FarmersMarketTransaction
+from farmers.models import (
+    ArchivedMarketTransaction,
+    Farmer,
+    FarmersInputTransaction,
+    FarmersMarketTransaction,
+)
 from market.models import Market, Produce
 
 
@@ -29,3 +35,52 @@ class TransactionFilter(django_filters.FilterSet):
     class Meta:
         model = FarmersMarketTransaction
         fields = ("start_date", "end_date", "produce")
+
+
+class InputTransactionFilter(django_filters.FilterSet):
+    """The date range of TransactionFilter, over the receipt verification date"""
+
+    start_date = django_filters.DateFilter(
+        field_name="receipt_verification_date",
+        lookup_expr="gte",
+        label="Date From",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+
+    end_date = django_filters.DateFilter(
+        field_name="receipt_verification_date",
+        lookup_expr="lte",
+        label="Date To",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+
+    class Meta:
+        model = FarmersInputTransaction
+        fields = ("start_date", "end_date")
+
+
+class FarmerFilter(TransactionFilter):
+    """
+    The farmers with a market transaction matching TransactionFilter, live or
+    archived
+    """
+
+    class Meta:
+        model = Farmer
+        fields = ("start_date", "end_date", "produce")
+
+    def filter_queryset(self, queryset):
+        values = {
+            name: value
+            for name, value in self.form.cleaned_data.items()
+            if value is not None
+        }
+        if not values:
+            return queryset
+        matched = []
+        for model in (FarmersMarketTransaction, ArchivedMarketTransaction):
+            transactions = model.objects.filter(farmer=models.OuterRef("pk"))
+            for name, value in values.items():
+                transactions = self.filters[name].filter(transactions, value)
+            matched.append(models.Exists(transactions))
+        return queryset.filter(matched[0] | matched[1])
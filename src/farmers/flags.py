@@ -0,0 +1,35 @@
+"""
+Deferred recompute of the farmer transaction flags.
+
+Deleting transactions, one by one or through a cascade from a `Market`,
+queues the affected farmers, and their flags are recomputed in one batch
+when the surrounding database transaction commits.
+"""
+
+from asgiref.local import Local
+from django.db import transaction
+
+from .models import Farmer
+
+_state = Local()
+
+
+def _pending():
+    if not hasattr(_state, "farmer_ids"):
+        _state.farmer_ids = set()
+    return _state.farmer_ids
+
+
+def _flush():
+    farmer_ids = _pending()
+    if not farmer_ids:
+        return
+    _state.farmer_ids = set()
+    Farmer.objects.filter(pk__in=farmer_ids).refresh_transaction_flags()
+
+
+def schedule_refresh(farmer_id):
+    """Queue a farmer for a flags recompute once the current transaction commits"""
+    _pending().add(farmer_id)
+    # Every callback after the first finds the queue already flushed
+    transaction.on_commit(_flush)
@@ -0,0 +1,66 @@
+"""
+Bulk writes of market transactions.
+
+These bypass `FarmersMarketTransaction.save()` and its signals. `write()`
+records the points of the rows it writes in the ledger itself, and callers
+collect the affected farmers and run `finish()` once when they are done.
+"""
+
+from django.db import transaction
+
+from core.utils import chunked
+
+from . import ledger, listing, rollups, rules
+from .models import Farmer, FarmersMarketTransaction
+
+UNIQUE_FIELDS = ["produce", "farmer", "market", "transaction_date"]
+
+
+def write(transactions, on_conflict="update"):
+    """
+    Insert a batch of unsaved transactions with a single statement and
+    return the ones inserted.
+
+    Rows that clash with `unique_mkt_transaction`, or with an earlier row of
+    the batch, are either left alone (`on_conflict="ignore"`) or overwrite
+    the saved row's quantity and points (`on_conflict="update"`).
+    """
+    points = rules.score_market_transactions(transactions)
+    for txn, points_earned in zip(transactions, points):
+        txn.points_earned = points_earned
+
+    if on_conflict == "ignore":
+        options = {"ignore_conflicts": True}
+    else:
+        options = {
+            "update_conflicts": True,
+            "unique_fields": UNIQUE_FIELDS,
+            "update_fields": ["quantity", "points_earned"],
+        }
+    with transaction.atomic():
+        FarmersMarketTransaction.objects.bulk_create(transactions, **options)
+        # A clashing row keeps the saved row's id, not the one given to it
+        saved = set(
+            FarmersMarketTransaction.objects.filter(
+                pk__in=[txn.pk for txn in transactions]
+            ).values_list("pk", flat=True)
+        )
+        inserted = [txn for txn in transactions if txn.pk in saved]
+        ledger.record_created(inserted)
+        if on_conflict != "ignore" and len(inserted) < len(transactions):
+            # Only the farmers of overwritten rows need their points recounted
+            ledger.reconcile(
+                sorted({txn.farmer_id for txn in transactions if txn.pk not in saved})
+            )
+        transaction.on_commit(listing.invalidate)
+    return inserted
+
+
+def finish(farmer_ids, rollup_keys=(), chunk_size=1000):
+    """
+    Update the transaction flags of farmers, and the daily rollup rows of
+    (market id, produce id, date) keys, after a bulk write.
+    """
+    for chunk in chunked(sorted(farmer_ids), chunk_size):
+        Farmer.objects.filter(pk__in=chunk).refresh_transaction_flags(chunk_size)
+    rollups.refresh(rollup_keys)
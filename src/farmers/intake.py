@@ -0,0 +1,268 @@
+"""
+Batched intake of market transactions submitted by market agents.
+
+Submissions are validated against cached markets and produce, then queued in
+a write-behind buffer instead of being saved one row at a time. The first
+request to reach an empty buffer waits until it holds `FLUSH_ROWS`
+transactions or `FLUSH_MS` have passed, then writes everything queued by the
+requests handled meanwhile with one `ingest.write()`. Every request waits for
+the flush that saved its transactions before it responds. When no other
+thread has submitted in the last `PEER_SECONDS`, as under a single-threaded
+worker, there is nobody to wait for and the transactions are written at once.
+
+The buffer is shared by the threads of a worker process, so requests are
+written together when workers serve requests on several threads, see
+gunicorn.conf.py. If a flush fails, its transactions are retried one at a
+time so that only the rows that cannot be saved are reported as failed. A
+sale the farmer already recorded that day, for the same produce at the same
+market, is reported as a conflict and the saved one is kept.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date
+
+from django.db import DataError, IntegrityError
+
+from market.models import Market, Produce
+
+from . import ingest
+from .models import Farmer, FarmersMarketTransaction
+
+FLUSH_ROWS = 500
+FLUSH_MS = 50
+# How recently another thread must have submitted for a flush to wait for it
+PEER_SECONDS = 10
+# How long markets and produce are cached between lookups, in seconds
+CATALOGUE_TTL = 60
+MAX_QUANTITY = 32767
+
+FAILED = "failed"
+CONFLICT = "conflict"
+ERRORS = {
+    FAILED: "The transaction could not be saved",
+    CONFLICT: "This farmer's sale of the produce at the market today is "
+    "already recorded",
+}
+
+
+class Catalogue:
+    """The markets and produce transactions are validated against"""
+
+    def __init__(self):
+        self.loaded_at = None
+        self.markets = {}
+        self.produce = {}
+        self.produce_items = {}
+
+    def load(self):
+        self.markets = {
+            market.slug: market
+            for market in Market.objects.filter(is_active=True).only(
+                "pk", "slug", "last_market_day", "market_frequency"
+            )
+        }
+        self.produce = dict(Produce.objects.values_list("slug", "pk"))
+        self.produce_items = {}
+        for market_id, produce_id in Market.produce_items.through.objects.values_list(
+            "market_id", "produce_id"
+        ):
+            self.produce_items.setdefault(market_id, set()).add(produce_id)
+        self.loaded_at = time.monotonic()
+
+    def refresh(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > CATALOGUE_TTL:
+            self.load()
+
+
+_catalogue = Catalogue()
+
+
+def _validate(item, farmers, today):
+    """Return an unsaved transaction for a submitted item and the errors in it"""
+    errors = []
+    if not isinstance(item, dict):
+        return None, ["Expected an object"]
+
+    market = _catalogue.markets.get(item.get("market"))
+    produce_id = _catalogue.produce.get(item.get("produce"))
+    farmer_id = farmers.get(item.get("farmer"))
+    if market is None:
+        errors.append("Unknown market")
+    elif not market.is_market_day:
+        errors.append("Transactions can only be recorded on market days")
+    if produce_id is None:
+        errors.append("Unknown produce")
+    elif market is not None and produce_id not in _catalogue.produce_items.get(
+        market.pk, ()
+    ):
+        errors.append("The market does not trade this produce")
+    if farmer_id is None:
+        errors.append("Unknown farmer")
+
+    quantity = item.get("quantity")
+    if (
+        not isinstance(quantity, int)
+        or isinstance(quantity, bool)
+        or not 0 < quantity <= MAX_QUANTITY
+    ):
+        errors.append(f"Quantity must be a whole number from 1 to {MAX_QUANTITY}")
+    transaction_date = item.get("transaction_date", today.isoformat())
+    if transaction_date != today.isoformat():
+        errors.append("Transaction date must be the current date")
+
+    if errors:
+        return None, errors
+    return (
+        FarmersMarketTransaction(
+            farmer_id=farmer_id,
+            market_id=market.pk,
+            produce_id=produce_id,
+            quantity=quantity,
+            transaction_date=today,
+        ),
+        [],
+    )
+
+
+def validate(items):
+    """Return (transaction, errors) for each submitted item"""
+    _catalogue.refresh()
+    slugs = {item.get("farmer") for item in items if isinstance(item, dict)}
+    farmers = dict(
+        Farmer.objects.filter(
+            slug__in=[slug for slug in slugs if isinstance(slug, str)]
+        ).values_list("slug", "pk")
+    )
+    today = date.today()
+    return [_validate(item, farmers, today) for item in items]
+
+
+def save(transactions):
+    """
+    Write a flush of transactions and bring the derived tables up to date.
+    Returns the transactions left out as a sale already recorded.
+    """
+    inserted = ingest.write(transactions, on_conflict="ignore")
+    ingest.finish(
+        {txn.farmer_id for txn in inserted},
+        {(txn.market_id, txn.produce_id, txn.transaction_date) for txn in inserted},
+    )
+    saved = {id(txn) for txn in inserted}
+    return [txn for txn in transactions if id(txn) not in saved]
+
+
+class WriteBehindBuffer:
+    """Collect transactions from concurrent requests and save them together"""
+
+    def __init__(self, flush_rows=FLUSH_ROWS, flush_ms=FLUSH_MS):
+        self.flush_rows = flush_rows
+        self.flush_ms = flush_ms
+        self.condition = threading.Condition()
+        self.pending = []
+        self.rows = 0
+        # When each thread last submitted, by thread ident
+        self.submitted = {}
+        self.leader = False
+        # Flushes are written one at a time
+        self.writing = threading.Lock()
+
+    def _has_peers(self, now):
+        """Whether other threads have submitted recently"""
+        thread = threading.get_ident()
+        self.submitted = {
+            ident: at
+            for ident, at in self.submitted.items()
+            if now - at < PEER_SECONDS and ident != thread
+        }
+        peers = bool(self.submitted)
+        self.submitted[thread] = now
+        return peers
+
+    def submit(self, transactions):
+        """
+        Queue transactions and wait until they are saved. Returns `FAILED` or
+        `CONFLICT` for the transactions not saved, by their id().
+        """
+        future = Future()
+        with self.condition:
+            self.pending.append((transactions, future))
+            self.rows += len(transactions)
+            now = time.monotonic()
+            peers = self._has_peers(now)
+            if self.leader:
+                lead = False
+                if self.rows >= self.flush_rows:
+                    self.condition.notify()
+            else:
+                # The first submitter waits for the others and writes the flush
+                self.leader = lead = True
+                deadline = now + self.flush_ms / 1000 if peers else now
+                while self.rows < self.flush_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.pending, self.rows = self.pending, [], 0
+                self.leader = False
+        if lead:
+            self.flush(batch)
+        return future.result()
+
+    def flush(self, batch):
+        with self.writing:
+            try:
+                conflicts = {
+                    id(txn)
+                    for txn in save(
+                        [txn for transactions, _ in batch for txn in transactions]
+                    )
+                }
+            except (IntegrityError, DataError):
+                # A row that cannot be saved, such as one whose farmer was
+                # deleted since it was validated, fails only its own item
+                for transactions, future in batch:
+                    outcomes = {}
+                    for txn in transactions:
+                        try:
+                            if save([txn]):
+                                outcomes[id(txn)] = CONFLICT
+                        except (IntegrityError, DataError):
+                            outcomes[id(txn)] = FAILED
+                        except Exception as e:
+                            future.set_exception(e)
+                            break
+                    else:
+                        future.set_result(outcomes)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for transactions, future in batch:
+                    future.set_result(
+                        {
+                            id(txn): CONFLICT
+                            for txn in transactions
+                            if id(txn) in conflicts
+                        }
+                    )
+
+
+_buffer = WriteBehindBuffer()
+
+
+def submit(items):
+    """Validate submitted items, save the valid ones and return a result for each"""
+    checked = validate(items)
+    transactions = [txn for txn, _ in checked if txn is not None]
+    outcomes = _buffer.submit(transactions) if transactions else {}
+    results = []
+    for txn, errors in checked:
+        if txn is None:
+            results.append({"status": "invalid", "errors": errors})
+        elif outcome := outcomes.get(id(txn)):
+            results.append({"status": outcome, "errors": [ERRORS[outcome]]})
+        else:
+            results.append({"status": "saved", "points_earned": txn.points_earned})
+    return results
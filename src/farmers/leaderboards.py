@@ -0,0 +1,332 @@
+"""
+Farmer leaderboards per market, LGA and state for every year.
+
+Standings are kept up to date from the points ledger: every batch of ledger
+entries is turned into point deltas for the boards of the farmer's market,
+LGA and state. Top-N lists are then read from the (scope, scope_id, year,
+-points) index instead of aggregating transactions.
+
+For ranks, every board also counts its farmers with positive points in
+`LeaderboardBucket` rows at `LEVELS` levels: level k splits the points into
+aligned ranges 16 ** k wide. The farmers above a score are the sum of at
+most 15 sibling ranges per level, read with one query on the bucket
+index, so a rank costs O(log points) however far down the board it is.
+A change of a farmer's points moves them between the ranges of the levels
+where the old and new scores differ, usually only the lowest one or two.
+"""
+
+from collections import defaultdict
+from itertools import groupby
+
+from django.db import IntegrityError, models, transaction
+
+from core.utils import chunked
+
+from .models import Farmer, LeaderboardBucket, LeaderboardEntry, PointsLedgerEntry
+
+Scope = LeaderboardEntry.Scope
+
+BUCKET_BITS = 4
+# Enough levels of 16-wide ranges to cover every IntegerField value
+LEVELS = 8
+
+
+def top(scope, scope_id, year, limit=100):
+    """Return the top `limit` entries of a leaderboard, best first"""
+    return (
+        LeaderboardEntry.objects.filter(
+            scope=scope, scope_id=scope_id, year=year, points__gt=0
+        )
+        .select_related("farmer")
+        .order_by("-points", "farmer_id")[:limit]
+    )
+
+
+def rank(farmer, scope, scope_id, year):
+    """Return a farmer's rank on a leaderboard, or None if they are not on it"""
+    board = {"scope": scope, "scope_id": scope_id, "year": year}
+    points = (
+        LeaderboardEntry.objects.filter(**board, farmer=farmer)
+        .values_list("points", flat=True)
+        .first()
+    )
+    if not points or points < 0:
+        return None
+    # Farmers with equal points share a rank: count the scores from points + 1
+    lowest = points + 1
+    above = models.Q(level=0, bucket=lowest)
+    for level in range(LEVELS):
+        bucket = lowest >> (BUCKET_BITS * level)
+        # The later ranges of the same parent range one level up
+        above |= models.Q(
+            level=level,
+            bucket__gt=bucket,
+            bucket__lte=bucket | (1 << BUCKET_BITS) - 1,
+        )
+    farmers = LeaderboardBucket.objects.filter(above, **board).aggregate(
+        total=models.Sum("farmers")
+    )["total"]
+    return (farmers or 0) + 1
+
+
+def _buckets(points):
+    """Yield the (level, bucket) ranges a positive score is counted in"""
+    if points > 0:
+        for level in range(LEVELS):
+            yield level, points >> (BUCKET_BITS * level)
+
+
+def count(changes):
+    """
+    Move farmers between the bucket counts of their boards, from
+    ((scope, scope_id, year), old points, new points) changes
+    """
+    deltas = defaultdict(int)
+    for board, old, new in changes:
+        for bucket in _buckets(old):
+            deltas[(*board, *bucket)] -= 1
+        for bucket in _buckets(new):
+            deltas[(*board, *bucket)] += 1
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    wanted = defaultdict(list)
+    for scope, scope_id, year, level, bucket in deltas:
+        wanted[(scope, scope_id, year, level)].append(bucket)
+    condition = models.Q(pk__in=[])
+    for (scope, scope_id, year, level), buckets in wanted.items():
+        condition |= models.Q(
+            scope=scope, scope_id=scope_id, year=year, level=level, bucket__in=buckets
+        )
+    with transaction.atomic():
+        existing = {
+            (row.scope, row.scope_id, row.year, row.level, row.bucket): row
+            for row in LeaderboardBucket.objects.select_for_update().filter(condition)
+        }
+        changed, created = [], []
+        for key, delta in deltas.items():
+            if key in existing:
+                existing[key].farmers += delta
+                changed.append(existing[key])
+            else:
+                scope, scope_id, year, level, bucket = key
+                created.append(
+                    LeaderboardBucket(
+                        scope=scope,
+                        scope_id=scope_id,
+                        year=year,
+                        level=level,
+                        bucket=bucket,
+                        farmers=delta,
+                    )
+                )
+        LeaderboardBucket.objects.bulk_update(changed, ["farmers"], batch_size=1000)
+        try:
+            with transaction.atomic():
+                LeaderboardBucket.objects.bulk_create(created, batch_size=1000)
+        except IntegrityError:
+            # A concurrent writer created some of the buckets first
+            for row in created:
+                _count_one(row)
+
+
+def _count_one(row):
+    bucket = LeaderboardBucket.objects.filter(
+        scope=row.scope,
+        scope_id=row.scope_id,
+        year=row.year,
+        level=row.level,
+        bucket=row.bucket,
+    )
+    if bucket.update(farmers=models.F("farmers") + row.farmers):
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardBucket.objects.create(
+                scope=row.scope,
+                scope_id=row.scope_id,
+                year=row.year,
+                level=row.level,
+                bucket=row.bucket,
+                farmers=row.farmers,
+            )
+    except IntegrityError:
+        bucket.update(farmers=models.F("farmers") + row.farmers)
+
+
+def _boards(farmer_id, lga_id, state_id, market_id, year):
+    if market_id:
+        yield (Scope.MARKET, market_id, year, farmer_id)
+    yield (Scope.LGA, lga_id, year, farmer_id)
+    yield (Scope.STATE, state_id, year, farmer_id)
+
+
+def _add(scope, scope_id, year, farmer_id, delta):
+    """Add to one entry, creating it if needed; return its old and new points"""
+    entry = LeaderboardEntry.objects.filter(
+        scope=scope, scope_id=scope_id, year=year, farmer_id=farmer_id
+    ).select_for_update()
+    points = entry.values_list("points", flat=True).first()
+    if points is None:
+        try:
+            with transaction.atomic():
+                LeaderboardEntry.objects.create(
+                    scope=scope,
+                    scope_id=scope_id,
+                    year=year,
+                    farmer_id=farmer_id,
+                    points=delta,
+                )
+            return 0, delta
+        except IntegrityError:
+            # Another writer created the entry first
+            points = entry.values_list("points", flat=True).get()
+    entry.update(points=models.F("points") + delta)
+    return points, points + delta
+
+
+def apply(entries):
+    """Apply a batch of ledger entries to the leaderboards"""
+    entries = [entry for entry in entries if entry.points]
+    if not entries:
+        return
+    farmer_ids = {entry.farmer_id for entry in entries}
+    locations = {
+        pk: (lga_id, state_id)
+        for pk, lga_id, state_id in Farmer.objects.filter(
+            pk__in=farmer_ids
+        ).values_list("pk", "lga_id", "state_id")
+    }
+    deltas = defaultdict(int)
+    for entry in entries:
+        if entry.farmer_id not in locations:
+            continue
+        for key in _boards(
+            entry.farmer_id, *locations[entry.farmer_id], entry.market_id, entry.year
+        ):
+            deltas[key] += entry.points
+
+    with transaction.atomic():
+        existing = {
+            (row.scope, row.scope_id, row.year, row.farmer_id): row
+            for row in LeaderboardEntry.objects.select_for_update().filter(
+                farmer_id__in=farmer_ids, year__in={key[2] for key in deltas}
+            )
+        }
+        changed, created, changes = [], [], []
+        for key, delta in deltas.items():
+            if not delta:
+                continue
+            if key in existing:
+                changes.append(
+                    (key[:3], existing[key].points, existing[key].points + delta)
+                )
+                existing[key].points += delta
+                changed.append(existing[key])
+            else:
+                scope, scope_id, year, farmer_id = key
+                created.append(
+                    LeaderboardEntry(
+                        scope=scope,
+                        scope_id=scope_id,
+                        year=year,
+                        farmer_id=farmer_id,
+                        points=delta,
+                    )
+                )
+        LeaderboardEntry.objects.bulk_update(changed, ["points"], batch_size=1000)
+        try:
+            with transaction.atomic():
+                LeaderboardEntry.objects.bulk_create(created, batch_size=1000)
+            changes += [
+                ((entry.scope, entry.scope_id, entry.year), 0, entry.points)
+                for entry in created
+            ]
+        except IntegrityError:
+            # A concurrent writer created some of the entries first
+            for entry in created:
+                board = (entry.scope, entry.scope_id, entry.year)
+                changes.append((board, *_add(*board, entry.farmer_id, entry.points)))
+        count(changes)
+
+
+def forget(entries):
+    """Take leaderboard entries about to be deleted out of the bucket counts"""
+    count(
+        ((entry.scope, entry.scope_id, entry.year), entry.points, 0)
+        for entry in entries
+    )
+
+
+def rebuild(batch_size=10000):
+    """Rebuild every leaderboard from the ledger in one pass, return the entry count"""
+    totals = (
+        PointsLedgerEntry.objects.values(
+            "farmer_id", "farmer__lga_id", "farmer__state_id", "market_id", "year"
+        )
+        .annotate(total=models.Sum("points"))
+        .order_by("farmer_id")
+        .values_list(
+            "farmer_id",
+            "farmer__lga_id",
+            "farmer__state_id",
+            "market_id",
+            "year",
+            "total",
+        )
+    )
+    written = 0
+    with transaction.atomic():
+        LeaderboardEntry.objects.all().delete()
+        batch = []
+        for _, rows in groupby(totals.iterator(), key=lambda row: row[0]):
+            standings = defaultdict(int)
+            for *location, total in rows:
+                for key in _boards(*location):
+                    standings[key] += total
+            batch += [
+                LeaderboardEntry(
+                    scope=scope,
+                    scope_id=scope_id,
+                    year=year,
+                    farmer_id=farmer_id,
+                    points=points,
+                )
+                for (scope, scope_id, year, farmer_id), points in standings.items()
+                if points
+            ]
+            if len(batch) >= batch_size:
+                LeaderboardEntry.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        LeaderboardEntry.objects.bulk_create(batch)
+        rebuild_buckets(batch_size)
+    return written + len(batch)
+
+
+def rebuild_buckets(batch_size=10000):
+    """Recount the bucket rows of every leaderboard from its entries"""
+    with transaction.atomic():
+        LeaderboardBucket.objects.all().delete()
+        for level in range(LEVELS):
+            rows = (
+                LeaderboardEntry.objects.filter(points__gt=0)
+                .annotate(bucket=models.F("points") / (1 << BUCKET_BITS * level))
+                .values("scope", "scope_id", "year", "bucket")
+                .annotate(farmers=models.Count("pk"))
+                .order_by()
+                .values_list("scope", "scope_id", "year", "bucket", "farmers")
+            )
+            for chunk in chunked(rows.iterator(), batch_size):
+                LeaderboardBucket.objects.bulk_create(
+                    LeaderboardBucket(
+                        scope=scope,
+                        scope_id=scope_id,
+                        year=year,
+                        level=level,
+                        bucket=bucket,
+                        farmers=farmers,
+                    )
+                    for scope, scope_id, year, bucket, farmers in chunk
+                )
@@ -0,0 +1,271 @@
+"""
+Incrementally maintained points balances.
+
+Every change to the points of a market or input transaction is appended to
+`PointsLedgerEntry` as a delta, and the same delta is applied to the farmer's
+`earned_points` and `FarmerAnnualPoints` rows. Reading a balance is therefore a
+single row lookup no matter how long the farmer's transaction history is.
+"""
+
+from collections import defaultdict
+from itertools import chain
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
+
+from core.utils import chunked
+
+from . import leaderboards
+from .models import (
+    ArchivedMarketTransaction,
+    Farmer,
+    FarmerAnnualPoints,
+    FarmersInputTransaction,
+    FarmersMarketTransaction,
+    PointsLedgerEntry,
+)
+
+Source = PointsLedgerEntry.Source
+
+# The date field that decides which year a transaction's points belong to
+SOURCE_MODELS = {
+    Source.MARKET: (FarmersMarketTransaction, "transaction_date"),
+    Source.INPUT: (FarmersInputTransaction, "receipt_verification_date"),
+}
+# Where the transactions of closed years are moved to, see farmers.archive
+ARCHIVE_MODELS = {Source.MARKET: [ArchivedMarketTransaction]}
+
+
+def source_for(instance):
+    """Return the ledger source of a transaction instance"""
+    if isinstance(instance, (FarmersMarketTransaction, ArchivedMarketTransaction)):
+        return Source.MARKET
+    return Source.INPUT
+
+
+def annual_points(farmer, year):
+    """Return the points a farmer earned in a year"""
+    return (
+        FarmerAnnualPoints.objects.filter(farmer=farmer, year=year)
+        .values_list("points", flat=True)
+        .first()
+        or 0
+    )
+
+
+def _expected(rows):
+    """Group (source_id, farmer, market, date, points) rows into ledger keys"""
+    totals = defaultdict(int)
+    for source_id, farmer_id, market_id, day, points in rows:
+        totals[(str(source_id), farmer_id, market_id, day.year)] += points
+    return totals
+
+
+def _recorded(source, **filters):
+    """Return the ledger totals per key for a source"""
+    rows = (
+        PointsLedgerEntry.objects.filter(source=source, **filters)
+        .values("source_id", "farmer_id", "market_id", "year")
+        .annotate(total=models.Sum("points"))
+        .values_list("source_id", "farmer_id", "market_id", "year", "total")
+    )
+    return {tuple(row[:4]): row[4] for row in rows}
+
+
+def _entries(source, expected, recorded, detach_market=False):
+    """Build the ledger entries that take `recorded` to `expected`"""
+    entries = []
+    for key in expected.keys() | recorded.keys():
+        delta = expected.get(key, 0) - recorded.get(key, 0)
+        if not delta:
+            continue
+        source_id, farmer_id, market_id, year = key
+        entries.append(
+            PointsLedgerEntry(
+                source=source,
+                source_id=source_id,
+                farmer_id=farmer_id,
+                market_id=None if detach_market else market_id,
+                year=year,
+                points=delta,
+            )
+        )
+    return entries
+
+
+def _bump_annual_points(farmer_id, year, delta):
+    balance = FarmerAnnualPoints.objects.filter(farmer_id=farmer_id, year=year)
+    if balance.update(points=models.F("points") + delta):
+        return
+    try:
+        with transaction.atomic():
+            FarmerAnnualPoints.objects.create(
+                farmer_id=farmer_id, year=year, points=delta
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        balance.update(points=models.F("points") + delta)
+
+
+def _apply(entries):
+    """Apply ledger entries to the balances and leaderboards"""
+    annual = defaultdict(int)
+    totals = defaultdict(int)
+    for entry in entries:
+        annual[(entry.farmer_id, entry.year)] += entry.points
+        totals[entry.farmer_id] += entry.points
+
+    for (farmer_id, year), delta in annual.items():
+        if delta:
+            _bump_annual_points(farmer_id, year, delta)
+    for farmer_id, delta in totals.items():
+        if delta:
+            Farmer.objects.filter(pk=farmer_id).update(
+                earned_points=models.F("earned_points") + delta
+            )
+    leaderboards.apply(entries)
+
+
+def record(instance, deleted=False, detach_market=False):
+    """
+    Bring the ledger and balances in line with a saved or deleted transaction.
+
+    Must run inside the database transaction that wrote `instance`.
+    """
+    source = source_for(instance)
+    expected = {}
+    if not deleted:
+        date_field = SOURCE_MODELS[source][1]
+        expected = _expected(
+            [
+                (
+                    instance.pk,
+                    instance.farmer_id,
+                    instance.market_id,
+                    getattr(instance, date_field),
+                    instance.points_earned,
+                )
+            ]
+        )
+    recorded = _recorded(source, source_id=str(instance.pk))
+    entries = _entries(source, expected, recorded, detach_market=detach_market)
+    if entries:
+        PointsLedgerEntry.objects.bulk_create(entries)
+        _apply(entries)
+    return entries
+
+
+def record_created(instances):
+    """
+    Record the points of transactions just inserted without their signals.
+    New rows have no ledger entries yet, so nothing is read.
+    """
+    rows = defaultdict(list)
+    for instance in instances:
+        source = source_for(instance)
+        date_field = SOURCE_MODELS[source][1]
+        rows[source].append(
+            (
+                instance.pk,
+                instance.farmer_id,
+                instance.market_id,
+                getattr(instance, date_field),
+                instance.points_earned,
+            )
+        )
+    entries = []
+    for source, source_rows in rows.items():
+        entries += _entries(source, _expected(source_rows), {})
+    if entries:
+        PointsLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+        _apply(entries)
+    return entries
+
+
+def _rebuild_balances(farmer_ids):
+    """Recompute the balances of `farmer_ids` from the ledger, return the number fixed"""
+    ledger = PointsLedgerEntry.objects.filter(farmer_id__in=farmer_ids)
+    expected = {
+        (farmer_id, year): total
+        for farmer_id, year, total in ledger.values("farmer_id", "year")
+        .annotate(total=models.Sum("points"))
+        .values_list("farmer_id", "year", "total")
+        if total
+    }
+    current = {
+        (farmer_id, year): points
+        for farmer_id, year, points in FarmerAnnualPoints.objects.filter(
+            farmer_id__in=farmer_ids
+        ).values_list("farmer_id", "year", "points")
+        if points
+    }
+    drifted = {farmer_id for (farmer_id, _), _ in expected.items() ^ current.items()}
+
+    totals = defaultdict(int)
+    for (farmer_id, _), total in expected.items():
+        totals[farmer_id] += total
+    drifted.update(
+        Farmer.objects.filter(pk__in=farmer_ids)
+        .exclude(
+            earned_points=Coalesce(
+                models.Subquery(
+                    PointsLedgerEntry.objects.filter(farmer=models.OuterRef("pk"))
+                    .values("farmer")
+                    .annotate(total=models.Sum("points"))
+                    .values("total")
+                ),
+                0,
+            )
+        )
+        .values_list("pk", flat=True)
+    )
+    if not drifted:
+        return 0
+
+    FarmerAnnualPoints.objects.filter(farmer_id__in=drifted).delete()
+    FarmerAnnualPoints.objects.bulk_create(
+        FarmerAnnualPoints(farmer_id=farmer_id, year=year, points=total)
+        for (farmer_id, year), total in expected.items()
+        if farmer_id in drifted
+    )
+    for farmer_id in drifted:
+        Farmer.objects.filter(pk=farmer_id).update(
+            earned_points=totals.get(farmer_id, 0)
+        )
+    return len(drifted)
+
+
+def reconcile(farmer_ids=None, chunk_size=500):
+    """
+    Rebuild the ledger and balances from the raw transactions.
+
+    Missing or stale ledger entries are corrected by appending deltas, so the
+    ledger stays append-only. Returns the number of entries appended and the
+    number of farmers whose balances were corrected.
+    """
+    if farmer_ids is None:
+        farmer_ids = (
+            Farmer.objects.order_by("pk").values_list("pk", flat=True).iterator()
+        )
+
+    appended = corrected = 0
+    for chunk in chunked(farmer_ids, chunk_size):
+        with transaction.atomic():
+            entries = []
+            for source, (model, date_field) in SOURCE_MODELS.items():
+                tables = [model, *ARCHIVE_MODELS.get(source, [])]
+                expected = _expected(
+                    chain.from_iterable(
+                        each.objects.filter(farmer_id__in=chunk).values_list(
+                            "pk", "farmer_id", "market_id", date_field, "points_earned"
+                        )
+                        for each in tables
+                    )
+                )
+                recorded = _recorded(source, farmer_id__in=chunk)
+                entries += _entries(source, expected, recorded)
+            PointsLedgerEntry.objects.bulk_create(entries, batch_size=1000)
+            leaderboards.apply(entries)
+            appended += len(entries)
+            corrected += _rebuild_balances(chunk)
+    return appended, corrected
@@ -0,0 +1,142 @@
+"""
+Browsing market transactions matching a `TransactionFilter`, a page at a time.
+
+Pages are read by keyset, newest first: a page is the transactions that sort
+after the cursor of the last one shown, which the (transaction_date, id)
+index answers directly, and the (produce, transaction_date, id) index when
+filtered by produce, however deep the page. Every archived transaction is
+older than the archive boundary, but sales pushed late can still land in
+`FarmersMarketTransaction` with earlier dates, so a page reads the rows
+after the cursor from both tables and merges them.
+
+Counting a filter's matches is the slow part, so counts are cached per
+filter, counted exactly up to `ESTIMATE_THRESHOLD` and estimated beyond. The
+cache keys include a generation that `invalidate()` replaces whenever
+transactions are written, so a cached count is not served after new
+transactions land. With Django's default local-memory cache each worker
+process has its own generation, and a count cached by another worker is
+replaced after `COUNT_TIMEOUT` at the latest.
+"""
+
+import hashlib
+import heapq
+import json
+import time
+from collections import namedtuple
+from operator import attrgetter
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from core.pagination import EstimatedCountPaginator, after, decode_cursor, encode_cursor
+
+from . import archive
+from .filters import TransactionFilter
+from .models import ArchivedMarketTransaction, FarmersMarketTransaction
+
+ORDERING = ("-transaction_date", "-id")
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# How long a filter's count is cached, in seconds
+COUNT_TIMEOUT = 5 * 60
+GENERATION_KEY = "market_transactions:generation"
+
+# The columns a page is read with
+FIELDS = (
+    "id",
+    "quantity",
+    "transaction_date",
+    "points_earned",
+    "farmer__slug",
+    "farmer__first_name",
+    "farmer__last_name",
+    "market__slug",
+    "market__name",
+    "produce__slug",
+    "produce__name",
+)
+
+Page = namedtuple(
+    "Page", ["filter", "transactions", "next_cursor", "count", "estimated"]
+)
+
+
+def invalidate():
+    """Stop serving the counts cached before transactions were written"""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def _querysets(filterset):
+    """Return the querysets of the hot table and the archive that can match"""
+    data = filterset.form.cleaned_data
+    boundary = archive.archived_before()
+    models = [FarmersMarketTransaction]
+    if boundary is not None and (
+        not data.get("start_date") or data["start_date"] < boundary
+    ):
+        models.append(ArchivedMarketTransaction)
+    return [
+        filterset.filter_queryset(model.objects.all()).order_by(*ORDERING)
+        for model in models
+    ]
+
+
+def _count(filterset, querysets):
+    """Return the number of matches and whether it is estimated, cached"""
+    params = {
+        name: getattr(value, "pk", value)
+        for name, value in filterset.form.cleaned_data.items()
+        if value is not None
+    }
+    digest = hashlib.md5(
+        json.dumps(params, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    generation = cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+    key = f"market_transactions:count:{generation}:{digest}"
+    counted = cache.get(key)
+    if counted is None:
+        count, estimated = 0, False
+        for queryset in querysets:
+            paginator = EstimatedCountPaginator(queryset, PAGE_SIZE)
+            count += paginator.count
+            estimated = estimated or paginator.estimated
+        counted = (count, estimated)
+        cache.set(key, counted, COUNT_TIMEOUT)
+    return counted
+
+
+def browse(data, cursor=None, size=PAGE_SIZE):
+    """
+    Return a `Page` of the transactions matching the filter in `data` that
+    sort after `cursor`. Raises ValidationError for an invalid filter or
+    cursor.
+    """
+    filterset = TransactionFilter(data, queryset=FarmersMarketTransaction.objects)
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    querysets = _querysets(filterset)
+    values = (
+        decode_cursor(FarmersMarketTransaction, ORDERING, cursor) if cursor else None
+    )
+
+    sources = []
+    for queryset in querysets:
+        if values is not None:
+            queryset = queryset.filter(after(ORDERING, values))
+        # One row more than the page tells whether there is a next one
+        sources.append(
+            queryset.select_related("farmer", "market", "produce").only(*FIELDS)[
+                : size + 1
+            ]
+        )
+    # Archived ids are those of the hot rows they were moved from, so the
+    # merged rows are unique in (transaction_date, id) order
+    transactions = list(
+        heapq.merge(*sources, key=attrgetter("transaction_date", "id"), reverse=True)
+    )[: size + 1]
+
+    next_cursor = None
+    if len(transactions) > size:
+        transactions = transactions[:size]
+        next_cursor = encode_cursor(transactions[-1], ORDERING)
+    return Page(filterset, transactions, next_cursor, *_count(filterset, querysets))
@@ -1,50 +1,337 @@
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.apps import apps
 from django.db import models
+from django.db.models.functions import ExtractYear
+
+# Age bands in whole years as (label, minimum age, age the band ends before)
+AGE_BANDS = {
+    "youth": ("Youth (under 35)", None, 35),
+    "adult": ("Adult (35 to 59)", 35, 60),
+    "senior": ("Senior (60 and over)", 60, None),
+}
+
+
+def year_range(year):
+    """Return the half-open [start, end) date range of a year"""
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def in_years(field, years):
+    """Match `field` against whole years using index-friendly date ranges"""
+    condition = models.Q(pk__in=[])
+    for year in set(years):
+        start, end = year_range(year)
+        condition |= models.Q(**{f"{field}__gte": start, f"{field}__lt": end})
+    return condition
+
+
+def birthday_cutoff(age, today=None):
+    """Return the latest date of birth of someone who is at least `age` years old"""
+    today = today or date.today()
+    try:
+        return today.replace(year=today.year - age)
+    except ValueError:
+        # Born on 29 February: a year older on 1 March in common years
+        return today.replace(year=today.year - age, day=28)
+
+
+def age_range(minimum=None, maximum=None, today=None):
+    """
+    Match ages from `minimum` up to but excluding `maximum` with a date of
+    birth range, which an index on date_of_birth can answer.
+    """
+    condition = models.Q()
+    if minimum is not None:
+        condition &= models.Q(date_of_birth__lte=birthday_cutoff(minimum, today))
+    if maximum is not None:
+        condition &= models.Q(date_of_birth__gt=birthday_cutoff(maximum, today))
+    return condition
+
+
+class IdentificationKey(models.Func):
+    """
+    An identification number without spaces or dashes, upper-cased, as
+    farmers.search.normalize_identification() returns it. The characters
+    are part of the SQL rather than parameters so that SQLite matches the
+    expression against the index on it.
+    """
+
+    template = "UPPER(REPLACE(REPLACE(%(expressions)s, ' ', ''), '-', ''))"
+    output_field = models.CharField()
+
+
+class PersonalInfoQuerySet(models.QuerySet):
+
+    def with_age(self, today=None):
+        """Annotate the age in whole years, computed by the database"""
+        today = today or date.today()
+        birthday_to_come = models.Q(date_of_birth__month__gt=today.month) | models.Q(
+            date_of_birth__month=today.month, date_of_birth__day__gt=today.day
+        )
+        return self.annotate(
+            age=models.Value(today.year)
+            - ExtractYear("date_of_birth")
+            - models.Case(
+                models.When(birthday_to_come, then=1),
+                default=0,
+                output_field=models.IntegerField(),
+            )
+        )
+
+    def with_age_band(self, today=None):
+        """Annotate the key of the age band from AGE_BANDS"""
+        return self.annotate(
+            age_band=models.Case(
+                *(
+                    models.When(
+                        age_range(minimum, maximum, today), then=models.Value(band)
+                    )
+                    for band, (_, minimum, maximum) in AGE_BANDS.items()
+                ),
+                output_field=models.CharField(),
+            )
+        )
+
+    def in_age_band(self, band, today=None):
+        """Restrict to the people whose age is in an AGE_BANDS band"""
+        _, minimum, maximum = AGE_BANDS[band]
+        return self.filter(age_range(minimum, maximum, today))
+
+    def count_by_age_band(self, today=None):
+        """Count the people in each age band in one GROUP BY query"""
+        counts = dict(
+            self.with_age_band(today)
+            .values("age_band")
+            .annotate(total=models.Count("pk"))
+            .order_by()
+            .values_list("age_band", "total")
+        )
+        return {band: counts.get(band, 0) for band in AGE_BANDS}
+
+
+class FarmerQuerySet(PersonalInfoQuerySet):
+
+    def refresh_transaction_flags(self, chunk_size=1000):
+        """
+        Recompute has_market_transaction, has_input_transaction and is_verified
+        for the selected farmers with EXISTS subqueries, one UPDATE per chunk.
+        """
+        market_transactions = apps.get_model(
+            "farmers", "FarmersMarketTransaction"
+        ).objects.filter(farmer=models.OuterRef("pk"))
+        archived_transactions = apps.get_model(
+            "farmers", "ArchivedMarketTransaction"
+        ).objects.filter(farmer=models.OuterRef("pk"))
+        input_transactions = apps.get_model(
+            "farmers", "FarmersInputTransaction"
+        ).objects.filter(
+            farmer=models.OuterRef("pk"), receipt_verification_date__isnull=False
+        )
+        has_market = models.Exists(market_transactions) | models.Exists(
+            archived_transactions
+        )
+        has_input = models.Exists(input_transactions)
+
+        farmer_ids = self.order_by("pk").values_list("pk", flat=True)
+        updated = last_id = 0
+        while chunk := list(farmer_ids.filter(pk__gt=last_id)[:chunk_size]):
+            last_id = chunk[-1]
+            updated += self.model._base_manager.filter(pk__in=chunk).update(
+                has_market_transaction=has_market,
+                has_input_transaction=has_input,
+                is_verified=models.Case(
+                    models.When(has_market & has_input, then=True), default=False
+                ),
+            )
+        return updated
+
+
+def _period_start(years=None, start_date=None, **period):
+    """Return the first date a period can include, or None if unbounded"""
+    starts = [start_date] if start_date is not None else []
+    if years:
+        starts.append(date(min(years), 1, 1))
+    return max(starts, default=None)
+
+
+def _grouped(queryset, group_by):
+    if "year" in group_by:
+        queryset = queryset.annotate(year=ExtractYear("transaction_date"))
+    return (
+        queryset.values(*group_by)
+        .annotate(total=models.Sum("points_earned"))
+        .order_by()
+        .values_list(*group_by, "total")
+    )
 
 
 class FarmersMarketTransactionQuerySet(models.QuerySet):
+    """
+    The aggregations also count the transactions of closed years moved to
+    ArchivedMarketTransaction. Conditions added with filter() and exclude()
+    are applied to the archive too.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._archive_filters = ()
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._archive_filters = self._archive_filters
+        return clone
+
+    def _filter_or_exclude(self, negate, args, kwargs):
+        clone = super()._filter_or_exclude(negate, args, kwargs)
+        clone._archive_filters = (*self._archive_filters, (negate, args, kwargs))
+        return clone
+
+    def archived(self, start=None):
+        """
+        Return the archived transactions matching this queryset's filters, or
+        None when there are none to read: for the archive itself, before any
+        year is archived, or when the period starting at `start` is after
+        every archived transaction.
+        """
+        from .archive import archived_before
+
+        archive = apps.get_model("farmers", "ArchivedMarketTransaction")
+        if self.model is archive:
+            return None
+        boundary = archived_before()
+        if boundary is None or (start is not None and start >= boundary):
+            return None
+        queryset = archive.objects.all()
+        for negate, args, kwargs in self._archive_filters:
+            if negate:
+                queryset = queryset.exclude(*args, **kwargs)
+            else:
+                queryset = queryset.filter(*args, **kwargs)
+        return queryset
+
+    def _total(self, start=None):
+        """Sum the points of this queryset and of the archived transactions"""
+        total = self.aggregate(total=models.Sum("points_earned"))["total"] or 0
+        archived = self.archived(start)
+        if archived is not None:
+            total += archived.aggregate(total=models.Sum("points_earned"))["total"] or 0
+        return total
 
     def calculate_annual_points(self, farmer, year):
         """Calculate the points earned by a farmer by year"""
-        return (
-            self.filter(farmer=farmer, transaction_date__year=year).aggregate(
-                total=models.Sum("points_earned")
-            )["total"]
-            or 0
-        )
+        start, end = year_range(year)
+        return self.filter(
+            farmer=farmer, transaction_date__gte=start, transaction_date__lt=end
+        )._total(start)
 
     def calculate_points_by_market(self, farmer, market):
         """Calculate the total points earned by a farmer in at a specific market"""
 
-        return (
-            self.filter(market=market, farmer=farmer).aggregate(
-                total=models.Sum("points_earned")
-            )["total"]
-            or 0
-        )
+        return self.filter(market=market, farmer=farmer)._total()
 
     def calculate_total_points(self, farmer):
         """Calculate the total points earned by a farmer across markets"""
-        return (
-            self.filter(farmer=farmer).aggregate(total=models.Sum("points_earned"))[
-                "total"
-            ]
-            or 0
-        )
+        return self.filter(farmer=farmer)._total()
+
+    def _rollup(self, start=None):
+        """
+        Return the daily rollup rows when they can answer for this queryset
+        from `start` onward, or None if the raw transactions must be read.
+        """
+        from .rollups import covers
+
+        # The rollup knows nothing about filters applied to this queryset
+        if self.query.where or not covers(start):
+            return None
+        return apps.get_model("farmers", "DailyMarketProduceRollup").objects.all()
 
     def calculate_market_points_year(self, market, year):
         """Calculate total points accumulated at a market by year"""
-        return (
-            self.filter(market=market, transaction_date__year=year).aggregate(
-                total=models.Sum("points_earned")
-            )["total"]
-            or 0
-        )
+        start, end = year_range(year)
+        rollup = self._rollup(start)
+        if rollup is not None:
+            return (
+                rollup.filter(market=market, date__gte=start, date__lt=end).aggregate(
+                    total=models.Sum("total_points")
+                )["total"]
+                or 0
+            )
+        return self.filter(
+            market=market, transaction_date__gte=start, transaction_date__lt=end
+        )._total(start)
 
     def calculate_market_points(self, market):
         """Calculate the total points earned by a market"""
-        return (
-            self.filter(market=market).aggregate(total=models.Sum("points_earned"))[
-                "total"
-            ]
-            or 0
+        rollup = self._rollup()
+        if rollup is not None:
+            return (
+                rollup.filter(market=market).aggregate(
+                    total=models.Sum("total_points")
+                )["total"]
+                or 0
+            )
+        return self.filter(market=market)._total()
+
+    def filter_period(self, years=None, produce=None, start_date=None, end_date=None):
+        """Restrict transactions to the given years, produce and inclusive date range"""
+        queryset = self
+        if years is not None:
+            queryset = queryset.filter(in_years("transaction_date", years))
+        if produce is not None:
+            queryset = queryset.filter(produce__in=produce)
+        if start_date is not None:
+            queryset = queryset.filter(transaction_date__gte=start_date)
+        if end_date is not None:
+            queryset = queryset.filter(
+                transaction_date__lt=end_date + timedelta(days=1)
+            )
+        return queryset
+
+    def points_totals(self, group_by, **period):
+        """
+        Sum the points grouped by `group_by`, with one GROUP BY query on the
+        transactions and another on the archive when the period reaches it.
+
+        `group_by` may include "year". Returns a dict of the `total` of every
+        group, keyed by a tuple of the `group_by` values.
+        """
+        queryset = self.filter_period(**period)
+        totals = defaultdict(int)
+        for source in (queryset, queryset.archived(_period_start(**period))):
+            if source is None:
+                continue
+            for *group, total in _grouped(source, group_by):
+                totals[tuple(group)] += total
+        return dict(totals)
+
+    def points_by_farmer(self, farmers, **period):
+        """Calculate the total points of many farmers, keyed by farmer id"""
+        return {
+            farmer: total
+            for (farmer,), total in self.filter(farmer__in=farmers)
+            .points_totals(["farmer"], **period)
+            .items()
+        }
+
+    def annual_points_by_farmer(self, farmers, **period):
+        """Calculate the points of many farmers by year, keyed by (farmer id, year)"""
+        return self.filter(farmer__in=farmers).points_totals(
+            ["farmer", "year"], **period
+        )
+
+    def points_by_market(self, markets, **period):
+        """Calculate the total points accumulated at many markets, keyed by market id"""
+        return {
+            market: total
+            for (market,), total in self.filter(market__in=markets)
+            .points_totals(["market"], **period)
+            .items()
+        }
+
+    def annual_points_by_market(self, markets, **period):
+        """Calculate the points of many markets by year, keyed by (market id, year)"""
+        return self.filter(market__in=markets).points_totals(
+            ["market", "year"], **period
         )
@@ -0,0 +1,101 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0001_initial"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FarmerAnnualPoints",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("year", models.PositiveSmallIntegerField()),
+                ("points", models.IntegerField(default=0)),
+                (
+                    "farmer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="annual_points",
+                        to="farmers.farmer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "farmer annual points",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("farmer", "year"), name="unique_farmer_annual_points"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PointsLedgerEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("MKT", "Market Transaction"),
+                            ("INP", "Input Transaction"),
+                        ],
+                        max_length=3,
+                    ),
+                ),
+                ("source_id", models.CharField(max_length=36)),
+                ("year", models.PositiveSmallIntegerField()),
+                ("points", models.IntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "farmer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="points_ledger",
+                        to="farmers.farmer",
+                    ),
+                ),
+                (
+                    "market",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="market.market",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "points ledger entries",
+                "indexes": [
+                    models.Index(
+                        fields=["source", "source_id"], name="points_ledger_source_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently on PostgreSQL, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ("farmers", "0002_points_ledger"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmersmarkettransaction",
+            index=models.Index(
+                fields=["farmer", "transaction_date", "points_earned"],
+                name="mkt_txn_farmer_date_idx",
+            ),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmersmarkettransaction",
+            index=models.Index(
+                fields=["market", "transaction_date", "points_earned"],
+                name="mkt_txn_market_date_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="farmersmarkettransaction",
+            name="farmer",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="mkt_transaction",
+                to="farmers.farmer",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="farmersmarkettransaction",
+            name="market",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="mkt_transaction",
+                to="market.market",
+            ),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0003_transaction_date_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[
+                            ("MKT", "Market"),
+                            ("LGA", "Local Government Area"),
+                            ("STATE", "State"),
+                        ],
+                        max_length=5,
+                    ),
+                ),
+                ("scope_id", models.PositiveBigIntegerField()),
+                ("year", models.PositiveSmallIntegerField()),
+                ("points", models.IntegerField(default=0)),
+                (
+                    "farmer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="farmers.farmer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "leaderboard entries",
+                "indexes": [
+                    models.Index(
+                        fields=["scope", "scope_id", "year", "-points"],
+                        name="leaderboard_rank_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "scope_id", "year", "farmer"),
+                        name="unique_leaderboard_entry",
+                    )
+                ],
+            },
+        ),
+    ]
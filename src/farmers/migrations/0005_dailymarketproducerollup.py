@@ -0,0 +1,64 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0004_leaderboards"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyMarketProduceRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("transaction_count", models.PositiveIntegerField(default=0)),
+                ("total_quantity", models.PositiveBigIntegerField(default=0)),
+                ("total_points", models.BigIntegerField(default=0)),
+                ("distinct_farmers", models.PositiveIntegerField(default=0)),
+                (
+                    "market",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.market",
+                    ),
+                ),
+                (
+                    "produce",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.produce",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["market", "date", "total_points"],
+                        name="rollup_market_date_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("market", "produce", "date"),
+                        name="unique_daily_market_produce",
+                    )
+                ],
+            },
+        ),
+    ]
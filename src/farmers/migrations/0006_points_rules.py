@@ -0,0 +1,133 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:29
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0005_dailymarketproducerollup"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PointsRuleSet",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.PositiveIntegerField(unique=True)),
+                ("description", models.CharField(blank=True, max_length=255)),
+                ("is_active", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-version"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("is_active", True)),
+                        fields=("is_active",),
+                        name="single_active_points_rule_set",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PointsRule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("MKT", "Market Transaction"),
+                            ("INP", "Input Transaction"),
+                        ],
+                        max_length=3,
+                    ),
+                ),
+                (
+                    "produce_category",
+                    models.CharField(
+                        blank=True,
+                        choices=[
+                            ("PN", "Pulse and Nuts"),
+                            ("CT", "Cereals and Tubers"),
+                            ("OF", "Oil and Fats"),
+                            ("MFE", "Meat, Fish and Eggs"),
+                            ("MD", "Milk and Dairy"),
+                            ("VF", "Vegetable and Fruits"),
+                            ("NF", "Non Food"),
+                            ("MS", "Miscellaneous Food"),
+                        ],
+                        max_length=3,
+                    ),
+                ),
+                (
+                    "category_type",
+                    models.CharField(
+                        blank=True,
+                        choices=[("SH", "Smallholder"), ("MC", "Commercial")],
+                        max_length=3,
+                    ),
+                ),
+                ("valid_from", models.DateField(blank=True, null=True)),
+                (
+                    "valid_until",
+                    models.DateField(
+                        blank=True,
+                        help_text="First day the rule no longer applies",
+                        null=True,
+                    ),
+                ),
+                (
+                    "unit",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=1,
+                        max_digits=10,
+                        validators=[
+                            django.core.validators.MinValueValidator(Decimal("0.01"))
+                        ],
+                    ),
+                ),
+                ("points_per_unit", models.PositiveIntegerField(default=1)),
+                (
+                    "market",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.market",
+                    ),
+                ),
+                (
+                    "rule_set",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rules",
+                        to="farmers.pointsruleset",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 13:41
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrentlyIfPostgres, RunSQLIfPostgres
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently on PostgreSQL, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ("cities_light", "0011_alter_city_country_alter_city_region_and_more"),
+        ("farmers", "0006_points_rules"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmer",
+            index=models.Index(
+                django.db.models.functions.text.Lower("first_name"),
+                django.db.models.functions.text.Lower("last_name"),
+                name="farmer_first_name_idx",
+            ),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmer",
+            index=models.Index(
+                django.db.models.functions.text.Lower("last_name"),
+                django.db.models.functions.text.Lower("first_name"),
+                name="farmer_last_name_idx",
+            ),
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmer",
+            index=models.Index(
+                django.db.models.functions.text.Upper("identification_number"),
+                name="farmer_identification_idx",
+            ),
+        ),
+        # Misspelt name lookups; not part of the model state because the
+        # extension and index type only exist on PostgreSQL
+        RunSQLIfPostgres(
+            sql="CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        RunSQLIfPostgres(
+            sql="CREATE INDEX CONCURRENTLY IF NOT EXISTS farmer_name_trgm_idx "
+            "ON farmers_farmer USING gin "
+            "(LOWER(first_name) gin_trgm_ops, LOWER(last_name) gin_trgm_ops)",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS farmer_name_trgm_idx",
+        ),
+    ]
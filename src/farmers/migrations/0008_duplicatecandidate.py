@@ -0,0 +1,66 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0007_farmer_search_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DuplicateCandidate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("FMR", "Farmer"), ("FEO", "Field Extension Officer")],
+                        max_length=3,
+                    ),
+                ),
+                ("record_id", models.PositiveBigIntegerField()),
+                ("duplicate_id", models.PositiveBigIntegerField()),
+                ("score", models.FloatField()),
+                (
+                    "reasons",
+                    models.CharField(
+                        help_text="Matching blocking keys", max_length=255
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("P", "Pending"), ("M", "Merged"), ("D", "Dismissed")],
+                        default="P",
+                        max_length=1,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("reviewed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "status", "-score"], name="duplicate_review_idx"
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "record_id", "duplicate_id"),
+                        name="unique_duplicate_candidate",
+                    )
+                ],
+            },
+        ),
+    ]
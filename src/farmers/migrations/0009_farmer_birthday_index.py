@@ -0,0 +1,22 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:22
+
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+    # The index is built concurrently on PostgreSQL, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ("cities_light", "0011_alter_city_country_alter_city_region_and_more"),
+        ("farmers", "0008_duplicatecandidate"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmer",
+            index=models.Index(fields=["date_of_birth"], name="farmer_birthday_idx"),
+        ),
+    ]
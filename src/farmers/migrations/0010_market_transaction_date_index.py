@@ -0,0 +1,24 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+    # The index is built concurrently on PostgreSQL, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ("farmers", "0009_farmer_birthday_index"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmersmarkettransaction",
+            index=models.Index(
+                fields=["transaction_date", "id"], name="mkt_txn_date_idx"
+            ),
+        ),
+    ]
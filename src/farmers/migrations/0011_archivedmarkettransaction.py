@@ -0,0 +1,101 @@
+# Generated by Django 5.1.1 on 2026-10-18 14:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.operations import RunSQLIfPostgres
+
+# Rebuild the empty table range partitioned by transaction date on PostgreSQL.
+# The yearly partitions are created by farmers.archive as years are closed.
+# A partitioned table's primary key has to include the partition key, and
+# foreign keys and indexes are declared on the parent for every partition.
+PARTITION_TABLE = """
+CREATE TABLE farmers_archivedmarkettransaction_partitioned (
+    LIKE farmers_archivedmarkettransaction INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (transaction_date);
+DROP TABLE farmers_archivedmarkettransaction;
+ALTER TABLE farmers_archivedmarkettransaction_partitioned
+    RENAME TO farmers_archivedmarkettransaction;
+ALTER TABLE farmers_archivedmarkettransaction
+    ADD CONSTRAINT farmers_archivedmarkettransaction_pkey
+    PRIMARY KEY (id, transaction_date),
+    ADD CONSTRAINT farmers_archivedmarkettransaction_farmer_id_fk
+    FOREIGN KEY (farmer_id) REFERENCES farmers_farmer (id)
+    DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT farmers_archivedmarkettransaction_market_id_fk
+    FOREIGN KEY (market_id) REFERENCES market_market (id)
+    DEFERRABLE INITIALLY DEFERRED,
+    ADD CONSTRAINT farmers_archivedmarkettransaction_produce_id_fk
+    FOREIGN KEY (produce_id) REFERENCES market_produce (id)
+    DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX archived_txn_farmer_date_idx ON farmers_archivedmarkettransaction
+    (farmer_id, transaction_date, points_earned);
+CREATE INDEX archived_txn_market_date_idx ON farmers_archivedmarkettransaction
+    (market_id, transaction_date, points_earned);
+CREATE INDEX archived_txn_date_idx ON farmers_archivedmarkettransaction
+    (transaction_date, id);
+CREATE INDEX farmers_archivedmarkettransaction_produce_id ON
+    farmers_archivedmarkettransaction (produce_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0010_market_transaction_date_index"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedMarketTransaction",
+            fields=[
+                ("id", models.UUIDField(primary_key=True, serialize=False)),
+                ("quantity", models.PositiveSmallIntegerField()),
+                ("transaction_date", models.DateField()),
+                ("points_earned", models.IntegerField()),
+                (
+                    "farmer",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_mkt_transaction",
+                        to="farmers.farmer",
+                    ),
+                ),
+                (
+                    "market",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="archived_mkt_transaction",
+                        to="market.market",
+                    ),
+                ),
+                (
+                    "produce",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="market.produce",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["farmer", "transaction_date", "points_earned"],
+                        name="archived_txn_farmer_date_idx",
+                    ),
+                    models.Index(
+                        fields=["market", "transaction_date", "points_earned"],
+                        name="archived_txn_market_date_idx",
+                    ),
+                    models.Index(
+                        fields=["transaction_date", "id"], name="archived_txn_date_idx"
+                    ),
+                ],
+            },
+        ),
+        RunSQLIfPostgres(PARTITION_TABLE, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0011_archivedmarkettransaction"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TransactionAnomaly",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[
+                            ("MKT", "Market Transaction"),
+                            ("INP", "Input Transaction"),
+                        ],
+                        max_length=3,
+                    ),
+                ),
+                ("source_id", models.CharField(max_length=36)),
+                ("week", models.DateField()),
+                ("value", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("median", models.FloatField()),
+                ("mad", models.FloatField(verbose_name="median absolute deviation")),
+                ("score", models.FloatField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("P", "Pending"),
+                            ("C", "Confirmed"),
+                            ("D", "Dismissed"),
+                        ],
+                        default="P",
+                        max_length=1,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("reviewed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "farmer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="farmers.farmer",
+                    ),
+                ),
+                (
+                    "market",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.market",
+                    ),
+                ),
+                (
+                    "produce",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.produce",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "transaction anomalies",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "-score"], name="anomaly_review_idx"
+                    ),
+                    models.Index(fields=["source", "week"], name="anomaly_week_idx"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("source", "source_id"),
+                        name="unique_transaction_anomaly",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+    # The hot table's index is built concurrently on PostgreSQL, outside a
+    # transaction. A partitioned table cannot be indexed concurrently, so the
+    # archive's is built as a plain index.
+    atomic = False
+
+    dependencies = [
+        ("farmers", "0012_transactionanomaly"),
+        ("market", "0003_remove_contactperson_unique_contact_person_and_more"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmersmarkettransaction",
+            index=models.Index(
+                fields=["produce", "transaction_date", "id"],
+                name="mkt_txn_produce_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedmarkettransaction",
+            index=models.Index(
+                fields=["produce", "transaction_date", "id"],
+                name="archived_txn_produce_date_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="farmersmarkettransaction",
+            name="produce",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="market.produce",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="archivedmarkettransaction",
+            name="produce",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="market.produce",
+            ),
+        ),
+    ]
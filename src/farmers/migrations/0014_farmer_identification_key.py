@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+import farmers.managers
+from core.operations import AddIndexConcurrentlyIfPostgres
+
+
+class Migration(migrations.Migration):
+    # The index is rebuilt concurrently on PostgreSQL, outside a transaction
+    atomic = False
+
+    dependencies = [
+        ("cities_light", "0011_alter_city_country_alter_city_region_and_more"),
+        ("farmers", "0013_transaction_produce_date_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="farmer",
+            name="farmer_identification_idx",
+        ),
+        AddIndexConcurrentlyIfPostgres(
+            model_name="farmer",
+            index=models.Index(
+                farmers.managers.IdentificationKey("identification_number"),
+                name="farmer_identification_idx",
+            ),
+        ),
+    ]
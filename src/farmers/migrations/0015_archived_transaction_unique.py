@@ -0,0 +1,52 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:33
+
+from django.db import migrations, models
+
+SALE_FIELDS = ["produce_id", "farmer_id", "market_id", "transaction_date"]
+
+
+def delete_duplicate_sales(apps, schema_editor):
+    """
+    Keep one archived row per sale, the one with the smallest id, and take
+    the points of the rows deleted out of their farmers' balances.
+    """
+    ArchivedMarketTransaction = apps.get_model("farmers", "ArchivedMarketTransaction")
+    duplicated = (
+        ArchivedMarketTransaction.objects.values(*SALE_FIELDS)
+        .annotate(count=models.Count("pk"))
+        .filter(count__gt=1)
+        .values_list(*SALE_FIELDS)
+    )
+    farmer_ids = set()
+    for sale in duplicated.iterator():
+        rows = ArchivedMarketTransaction.objects.filter(**dict(zip(SALE_FIELDS, sale)))
+        keep = rows.order_by("pk").values_list("pk", flat=True).first()
+        rows.exclude(pk=keep).delete()
+        farmer_ids.add(sale[1])
+    if farmer_ids:
+        # The historical models send no signals; the ledger appends the
+        # reversals the deleted rows are missing
+        from farmers import ledger
+
+        ledger.reconcile(sorted(farmer_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0014_farmer_identification_key"),
+        # ledger.reconcile updates the leaderboard buckets
+        ("farmers", "0016_leaderboardbucket"),
+        ("market", "0007_foodbasket"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_sales, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="archivedmarkettransaction",
+            constraint=models.UniqueConstraint(
+                fields=("produce", "farmer", "market", "transaction_date"),
+                name="unique_archived_mkt_transaction",
+            ),
+        ),
+    ]
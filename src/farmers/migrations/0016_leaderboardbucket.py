@@ -0,0 +1,60 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+def count_leaderboard_buckets(apps, schema_editor):
+    from farmers import leaderboards
+
+    leaderboards.rebuild_buckets()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("farmers", "0014_farmer_identification_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[
+                            ("MKT", "Market"),
+                            ("LGA", "Local Government Area"),
+                            ("STATE", "State"),
+                        ],
+                        max_length=5,
+                    ),
+                ),
+                ("scope_id", models.PositiveBigIntegerField()),
+                ("year", models.PositiveSmallIntegerField()),
+                ("level", models.PositiveSmallIntegerField()),
+                ("bucket", models.PositiveBigIntegerField()),
+                ("farmers", models.IntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("scope", "scope_id", "year", "level", "bucket"),
+                        name="unique_leaderboard_bucket",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            count_leaderboard_buckets, migrations.RunPython.noop, elidable=True
+        ),
+    ]
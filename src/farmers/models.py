@@ -1,12 +1,14 @@
 import uuid
 from datetime import date
+from decimal import Decimal
 
 from cities_light.models import Country, Region, SubRegion
 from django.contrib import admin
 from django.core.validators import MinValueValidator
 
 # from django.contrib.gis.db import models as gis_models
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.forms import ValidationError
 from django.urls import reverse
 from django.utils import timezone
@@ -15,7 +17,12 @@ from phonenumber_field.modelfields import PhoneNumberField
 from market.models import Market, Produce
 from market.validators import validate_file_size
 
-from .managers import FarmersMarketTransactionQuerySet
+from .managers import (
+    FarmerQuerySet,
+    FarmersMarketTransactionQuerySet,
+    IdentificationKey,
+    PersonalInfoQuerySet,
+)
 
 
 class BaseFarmersModel(models.Model):
@@ -101,15 +108,23 @@ class PersonalInfo(BaseFarmersModel):
 
     @property
     def age(self):
+        # Annotated by PersonalInfoQuerySet.with_age() when it was loaded
+        if "age" in self.__dict__:
+            return self.__dict__["age"]
         today = date.today()
         dob = self.date_of_birth
         return today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
 
+    @age.setter
+    def age(self, value):
+        self.__dict__["age"] = value
+
 
 class FieldExtensionOfficer(PersonalInfo):
     affiliation = models.CharField(
         max_length=255, blank=True, null=True
     )  # School, Training institution, Certificate
+    objects = PersonalInfoQuerySet.as_manager()
 
     class Meta:
         constraints = [
@@ -169,6 +184,7 @@ class Farmer(PersonalInfo):
     earned_points = models.IntegerField(
         validators=[MinValueValidator(0)], default=0, editable=False
     )
+    objects = FarmerQuerySet.as_manager()
 
     class Meta:
         constraints = [
@@ -177,6 +193,21 @@ class Farmer(PersonalInfo):
                 name="farmer_unique_id",
             ),
         ]
+        # Lookups by name prefix and identification number, see farmers.search
+        indexes = [
+            models.Index(
+                Lower("first_name"), Lower("last_name"), name="farmer_first_name_idx"
+            ),
+            models.Index(
+                Lower("last_name"), Lower("first_name"), name="farmer_last_name_idx"
+            ),
+            models.Index(
+                IdentificationKey("identification_number"),
+                name="farmer_identification_idx",
+            ),
+            # Age filters are date of birth ranges, see PersonalInfoQuerySet
+            models.Index(fields=["date_of_birth"], name="farmer_birthday_idx"),
+        ]
 
     def __str__(self):
         return f"{self.first_name}-{self.last_name}"
@@ -194,13 +225,20 @@ class FarmersMarketTransaction(models.Model):
     """A model to track the transactions between a farmer and a market"""
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4)
+    # The foreign keys are served by the composite indexes in Meta.indexes
     farmer = models.ForeignKey(
-        Farmer, on_delete=models.CASCADE, related_name="mkt_transaction"
+        Farmer,
+        on_delete=models.CASCADE,
+        related_name="mkt_transaction",
+        db_index=False,
     )
     market = models.ForeignKey(
-        Market, on_delete=models.CASCADE, related_name="mkt_transaction"
+        Market,
+        on_delete=models.CASCADE,
+        related_name="mkt_transaction",
+        db_index=False,
     )
-    produce = models.ForeignKey(Produce, on_delete=models.PROTECT)
+    produce = models.ForeignKey(Produce, on_delete=models.PROTECT, db_index=False)
     quantity = models.PositiveSmallIntegerField()
     transaction_date = models.DateField()
     points_earned = models.IntegerField(
@@ -215,6 +253,24 @@ class FarmersMarketTransaction(models.Model):
                 name="unique_mkt_transaction",
             )
         ]
+        indexes = [
+            # Cover the points queries so they never have to visit the table
+            models.Index(
+                fields=["farmer", "transaction_date", "points_earned"],
+                name="mkt_txn_farmer_date_idx",
+            ),
+            models.Index(
+                fields=["market", "transaction_date", "points_earned"],
+                name="mkt_txn_market_date_idx",
+            ),
+            # Keyset pagination of the admin changelist, newest first
+            models.Index(fields=["transaction_date", "id"], name="mkt_txn_date_idx"),
+            # Keyset pagination of the transaction list filtered by produce
+            models.Index(
+                fields=["produce", "transaction_date", "id"],
+                name="mkt_txn_produce_date_idx",
+            ),
+        ]
 
     def clean(self):
         super().clean()
@@ -222,13 +278,74 @@ class FarmersMarketTransaction(models.Model):
             raise ValidationError("Transaction Data must be curent date")
 
     def _calculate_earned_points(self):
-        """Calculate the points earned by the quantity"""
-        return int(self.quantity)
+        """Calculate the points earned by the quantity under the active rules"""
+        from .rules import points_for  # the rules module imports this one
+
+        return points_for(self)
 
     def save(self, *args, **kwargs):
         self.points_earned = self._calculate_earned_points()
+        # Keep the row and its points ledger entries in one database transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
-        super().save(*args, **kwargs)
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.id}"
+
+
+class ArchivedMarketTransaction(models.Model):
+    """A market transaction of a closed year, moved here by farmers.archive"""
+
+    id = models.UUIDField(primary_key=True)
+    farmer = models.ForeignKey(
+        Farmer,
+        on_delete=models.CASCADE,
+        related_name="archived_mkt_transaction",
+        db_index=False,
+    )
+    market = models.ForeignKey(
+        Market,
+        on_delete=models.CASCADE,
+        related_name="archived_mkt_transaction",
+        db_index=False,
+    )
+    produce = models.ForeignKey(
+        Produce, on_delete=models.PROTECT, related_name="+", db_index=False
+    )
+    quantity = models.PositiveSmallIntegerField()
+    transaction_date = models.DateField()
+    points_earned = models.IntegerField()
+    objects = FarmersMarketTransactionQuerySet.as_manager()
+
+    class Meta:
+        # On PostgreSQL the table is range partitioned by year, see migration 0011
+        constraints = [
+            models.UniqueConstraint(
+                fields=["produce", "farmer", "market", "transaction_date"],
+                name="unique_archived_mkt_transaction",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["farmer", "transaction_date", "points_earned"],
+                name="archived_txn_farmer_date_idx",
+            ),
+            models.Index(
+                fields=["market", "transaction_date", "points_earned"],
+                name="archived_txn_market_date_idx",
+            ),
+            models.Index(
+                fields=["transaction_date", "id"], name="archived_txn_date_idx"
+            ),
+            models.Index(
+                fields=["produce", "transaction_date", "id"],
+                name="archived_txn_produce_date_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.id}"
@@ -265,16 +382,321 @@ class FarmersInputTransaction(models.Model):
 
     def clean(self):
         super().clean()
-        if not self.market.is_market_day:
+        if (
+            self.market_id is not None
+            and not Market.objects.filter(pk=self.market_id).market_day_on().exists()
+        ):
             raise ValidationError("Input purchase can only be verified on market days")
 
     def _calculate_earned_points(self):
-        """Calculate the points earned by the purchase amount"""
-        return round(int(self.amount / 1000))
+        """Calculate the points earned by the purchase amount under the active rules"""
+        from .rules import points_for  # the rules module imports this one
+
+        return points_for(self)
 
     def save(self, *args, **kwargs):
         self.points_earned = self._calculate_earned_points()
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.receipt_number}{self.farmer.first_name}{self.receipt_verification_date}"
+
+
+class PointsLedgerEntry(models.Model):
+    """An append-only record of every change to a farmer's points"""
+
+    class Source(models.TextChoices):
+        MARKET = "MKT", "Market Transaction"
+        INPUT = "INP", "Input Transaction"
+
+    farmer = models.ForeignKey(
+        Farmer, on_delete=models.CASCADE, related_name="points_ledger"
+    )
+    market = models.ForeignKey(
+        Market,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        null=True,
+        blank=True,
+    )
+    source = models.CharField(max_length=3, choices=Source.choices)
+    source_id = models.CharField(max_length=36)
+    year = models.PositiveSmallIntegerField()
+    points = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = "points ledger entries"
+        indexes = [
+            models.Index(
+                fields=["source", "source_id"], name="points_ledger_source_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.farmer_id}-{self.source}-{self.source_id}: {self.points}"
+
+
+class FarmerAnnualPoints(models.Model):
+    """A farmer's points balance for a single year"""
+
+    farmer = models.ForeignKey(
+        Farmer, on_delete=models.CASCADE, related_name="annual_points"
+    )
+    year = models.PositiveSmallIntegerField()
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "farmer annual points"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["farmer", "year"],
+                name="unique_farmer_annual_points",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.farmer_id}-{self.year}: {self.points}"
+
+
+class LeaderboardEntry(models.Model):
+    """A farmer's points on a market, LGA or state leaderboard for a year"""
+
+    class Scope(models.TextChoices):
+        MARKET = "MKT", "Market"
+        LGA = "LGA", "Local Government Area"
+        STATE = "STATE", "State"
+
+    scope = models.CharField(max_length=5, choices=Scope.choices)
+    # The id of the Market, SubRegion or Region the leaderboard belongs to
+    scope_id = models.PositiveBigIntegerField()
+    year = models.PositiveSmallIntegerField()
+    farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name="+")
+    points = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "leaderboard entries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "scope_id", "year", "farmer"],
+                name="unique_leaderboard_entry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["scope", "scope_id", "year", "-points"],
+                name="leaderboard_rank_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}-{self.scope_id}-{self.year}: {self.farmer_id}"
+
+
+class LeaderboardBucket(models.Model):
+    """
+    The number of farmers on a leaderboard whose points fall in a range,
+    [bucket * 16 ** level, (bucket + 1) * 16 ** level), see farmers.leaderboards
+    """
+
+    scope = models.CharField(max_length=5, choices=LeaderboardEntry.Scope.choices)
+    scope_id = models.PositiveBigIntegerField()
+    year = models.PositiveSmallIntegerField()
+    level = models.PositiveSmallIntegerField()
+    bucket = models.PositiveBigIntegerField()
+    farmers = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scope", "scope_id", "year", "level", "bucket"],
+                name="unique_leaderboard_bucket",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.scope}-{self.scope_id}-{self.year} {self.level}/{self.bucket}"
+
+
+class DailyMarketProduceRollup(models.Model):
+    """Transaction volume and points per market, produce and day"""
+
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name="+")
+    produce = models.ForeignKey(Produce, on_delete=models.CASCADE, related_name="+")
+    date = models.DateField()
+    transaction_count = models.PositiveIntegerField(default=0)
+    total_quantity = models.PositiveBigIntegerField(default=0)
+    total_points = models.BigIntegerField(default=0)
+    distinct_farmers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["market", "produce", "date"],
+                name="unique_daily_market_produce",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["market", "date", "total_points"],
+                name="rollup_market_date_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.market_id}-{self.produce_id}-{self.date}"
+
+
+class PointsRuleSet(models.Model):
+    """A version of the points rules; transactions are scored by the active one"""
+
+    version = models.PositiveIntegerField(unique=True)
+    description = models.CharField(max_length=255, blank=True)
+    is_active = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-version"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["is_active"],
+                condition=models.Q(is_active=True),
+                name="single_active_points_rule_set",
+            )
+        ]
+
+    def __str__(self):
+        return f"v{self.version}"
+
+
+class PointsRule(models.Model):
+    """
+    Points per `unit` of quantity (market transactions) or amount (input
+    transactions). Blank criteria match anything; the most specific matching
+    rule wins.
+    """
+
+    rule_set = models.ForeignKey(
+        PointsRuleSet, on_delete=models.CASCADE, related_name="rules"
+    )
+    source = models.CharField(max_length=3, choices=PointsLedgerEntry.Source.choices)
+    produce_category = models.CharField(
+        max_length=3, choices=Produce.ProduceCategory.choices, blank=True
+    )
+    market = models.ForeignKey(
+        Market, on_delete=models.CASCADE, related_name="+", null=True, blank=True
+    )
+    category_type = models.CharField(
+        max_length=3, choices=Farmer.CategoryType.choices, blank=True
+    )
+    valid_from = models.DateField(null=True, blank=True)
+    valid_until = models.DateField(
+        null=True, blank=True, help_text="First day the rule no longer applies"
+    )
+    unit = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=1,
+        validators=[MinValueValidator(Decimal("0.01"))],
+    )
+    points_per_unit = models.PositiveIntegerField(default=1)
+
+    def clean(self):
+        super().clean()
+        if self.produce_category and self.source != PointsLedgerEntry.Source.MARKET:
+            raise ValidationError("Only market transaction rules have a produce")
+        if self.valid_from and self.valid_until and self.valid_until <= self.valid_from:
+            raise ValidationError("A rule must end after it starts")
+
+    def __str__(self):
+        return f"{self.rule_set}-{self.source}: {self.points_per_unit}/{self.unit}"
+
+
+class DuplicateCandidate(models.Model):
+    """A pair of farmer or officer records that may be the same person"""
+
+    class Kind(models.TextChoices):
+        FARMER = "FMR", "Farmer"
+        OFFICER = "FEO", "Field Extension Officer"
+
+    class Status(models.TextChoices):
+        PENDING = "P", "Pending"
+        MERGED = "M", "Merged"
+        DISMISSED = "D", "Dismissed"
+
+    kind = models.CharField(max_length=3, choices=Kind.choices)
+    # Ids of the Farmer or FieldExtensionOfficer records, `record_id` being
+    # the one that is kept when the pair is merged
+    record_id = models.PositiveBigIntegerField()
+    duplicate_id = models.PositiveBigIntegerField()
+    score = models.FloatField()
+    reasons = models.CharField(max_length=255, help_text="Matching blocking keys")
+    status = models.CharField(
+        max_length=1, choices=Status.choices, default=Status.PENDING
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "record_id", "duplicate_id"],
+                name="unique_duplicate_candidate",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["kind", "status", "-score"], name="duplicate_review_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.record_id} ~ {self.duplicate_id}"
+
+
+class TransactionAnomaly(models.Model):
+    """A transaction whose quantity or amount is far above others like it"""
+
+    class Status(models.TextChoices):
+        PENDING = "P", "Pending"
+        CONFIRMED = "C", "Confirmed"
+        DISMISSED = "D", "Dismissed"
+
+    source = models.CharField(max_length=3, choices=PointsLedgerEntry.Source.choices)
+    source_id = models.CharField(max_length=36)
+    farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name="+")
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name="+")
+    produce = models.ForeignKey(
+        Produce, on_delete=models.CASCADE, related_name="+", null=True, blank=True
+    )
+    # Monday of the week the transaction was compared within
+    week = models.DateField()
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+    median = models.FloatField()
+    mad = models.FloatField(verbose_name="median absolute deviation")
+    score = models.FloatField()
+    status = models.CharField(
+        max_length=1, choices=Status.choices, default=Status.PENDING
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "transaction anomalies"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source", "source_id"], name="unique_transaction_anomaly"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["status", "-score"], name="anomaly_review_idx"),
+            models.Index(fields=["source", "week"], name="anomaly_week_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.source}-{self.source_id}: {self.value} ({self.score:.1f})"
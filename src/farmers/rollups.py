@@ -0,0 +1,234 @@
+"""
+Daily transaction volume and points per market and produce.
+
+`DailyMarketProduceRollup` is kept up to date from every transaction save
+and delete. `backfill()` rebuilds it from the raw transactions and records
+in a `ProcessingCheckpoint` the date from which the rollup is complete, so
+queries can read from it whenever their range is fully covered.
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import models, transaction
+
+from core.models import ProcessingCheckpoint
+from core.utils import chunked
+
+from .models import (
+    ArchivedMarketTransaction,
+    DailyMarketProduceRollup,
+    FarmersMarketTransaction,
+)
+
+CHECKPOINT = "daily_market_produce_rollup"
+# Coverage of a backfill over the whole transaction history
+ALL_TIME = date.min
+
+# The archive holds the transactions of closed years, see farmers.archive
+TRANSACTION_MODELS = [FarmersMarketTransaction, ArchivedMarketTransaction]
+
+STATE_FIELDS = [
+    "market_id",
+    "produce_id",
+    "transaction_date",
+    "quantity",
+    "points_earned",
+]
+
+
+def covered_from():
+    """Return the date from which the rollup is complete, or None"""
+    return (
+        ProcessingCheckpoint.objects.filter(name=CHECKPOINT)
+        .values_list("position", flat=True)
+        .first()
+    )
+
+
+def covers(start=None):
+    """Whether the rollup is complete from `start` (or from the beginning) onward"""
+    position = covered_from()
+    if position is None:
+        return False
+    return position == ALL_TIME if start is None else position <= start
+
+
+def saved_state(instance):
+    """Return the rollup fields of a transaction as they are in the database"""
+    return (
+        FarmersMarketTransaction.objects.filter(pk=instance.pk)
+        .values_list(*STATE_FIELDS)
+        .first()
+    )
+
+
+def state_of(instance):
+    """Return the rollup fields of an in-memory transaction"""
+    return tuple(getattr(instance, field) for field in STATE_FIELDS)
+
+
+def _bump(state, sign):
+    market_id, produce_id, day, quantity, points = state
+    rollup = DailyMarketProduceRollup.objects.filter(
+        market_id=market_id, produce_id=produce_id, date=day
+    )
+    # A farmer has at most one transaction per market, produce and day, so
+    # every transaction is also a distinct farmer
+    changes = {
+        "transaction_count": models.F("transaction_count") + sign,
+        "distinct_farmers": models.F("distinct_farmers") + sign,
+        "total_quantity": models.F("total_quantity") + sign * quantity,
+        "total_points": models.F("total_points") + sign * points,
+    }
+    if rollup.update(**changes) or sign < 0:
+        return
+    _, created = DailyMarketProduceRollup.objects.get_or_create(
+        market_id=market_id,
+        produce_id=produce_id,
+        date=day,
+        defaults={
+            "transaction_count": 1,
+            "distinct_farmers": 1,
+            "total_quantity": quantity,
+            "total_points": points,
+        },
+    )
+    if not created:
+        rollup.update(**changes)
+
+
+def record(previous, current):
+    """Move a transaction's contribution from its `previous` state to `current`"""
+    if previous == current:
+        return
+    if previous is not None:
+        _bump(previous, -1)
+    if current is not None:
+        _bump(current, 1)
+
+
+def _grouped(queryset):
+    return (
+        queryset.values("market_id", "produce_id", "transaction_date")
+        .annotate(
+            count=models.Count("pk"),
+            quantity=models.Sum("quantity"),
+            points=models.Sum("points_earned"),
+            farmers=models.Count("farmer_id", distinct=True),
+        )
+        .order_by()
+        .values_list(
+            "market_id",
+            "produce_id",
+            "transaction_date",
+            "count",
+            "quantity",
+            "points",
+            "farmers",
+        )
+    )
+
+
+def _totals(**filters):
+    """Total the transactions matching `filters`, archived ones included"""
+    totals = defaultdict(lambda: [0, 0, 0, 0])
+    for model in TRANSACTION_MODELS:
+        for market_id, produce_id, day, *values in _grouped(
+            model.objects.filter(**filters)
+        ):
+            row = totals[(market_id, produce_id, day)]
+            row[:] = [total + value for total, value in zip(row, values)]
+    return [(*key, *values) for key, values in totals.items()]
+
+
+def _rows(totals):
+    return [
+        DailyMarketProduceRollup(
+            market_id=market_id,
+            produce_id=produce_id,
+            date=day,
+            transaction_count=count,
+            total_quantity=quantity,
+            total_points=points,
+            distinct_farmers=farmers,
+        )
+        for market_id, produce_id, day, count, quantity, points, farmers in totals
+    ]
+
+
+def refresh(keys, chunk_size=500):
+    """Recompute the rollup rows of (market id, produce id, date) keys"""
+    for chunk in chunked(sorted(keys), chunk_size):
+        wanted = set(chunk)
+        markets, produce, dates = (set(column) for column in zip(*chunk))
+        totals = [
+            row
+            for row in _totals(
+                market_id__in=markets,
+                produce_id__in=produce,
+                transaction_date__in=dates,
+            )
+            if row[:3] in wanted
+        ]
+        with transaction.atomic():
+            stale = wanted - {row[:3] for row in totals}
+            for market_id, produce_id, day in stale:
+                DailyMarketProduceRollup.objects.filter(
+                    market_id=market_id, produce_id=produce_id, date=day
+                ).delete()
+            DailyMarketProduceRollup.objects.bulk_create(
+                _rows(totals),
+                update_conflicts=True,
+                unique_fields=["market", "produce", "date"],
+                update_fields=[
+                    "transaction_count",
+                    "total_quantity",
+                    "total_points",
+                    "distinct_farmers",
+                ],
+            )
+
+
+def backfill(start=None, end=None, window=31):
+    """
+    Rebuild the rollup from the raw transactions between `start` and `end`,
+    one window of days at a time. Safe to run repeatedly.
+    """
+    dates = [
+        model.objects.aggregate(
+            first=models.Min("transaction_date"), last=models.Max("transaction_date")
+        )
+        for model in TRANSACTION_MODELS
+    ]
+    first = start or min(
+        (each["first"] for each in dates if each["first"]), default=None
+    )
+    last = end or max((each["last"] for each in dates if each["last"]), default=None)
+
+    if start is None:
+        # Rows left behind by transactions older than any that remain
+        DailyMarketProduceRollup.objects.filter(date__lt=first or date.max).delete()
+
+    written = 0
+    day = first
+    while first and last and day <= last:
+        until = min(day + timedelta(days=window), last + timedelta(days=1))
+        with transaction.atomic():
+            DailyMarketProduceRollup.objects.filter(
+                date__gte=day, date__lt=until
+            ).delete()
+            rows = _rows(_totals(transaction_date__gte=day, transaction_date__lt=until))
+            DailyMarketProduceRollup.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+        day = until
+
+    # Only a backfill that runs up to the present extends the covered range
+    if end is None:
+        position = covered_from()
+        start = start or ALL_TIME
+        if position is None or start < position:
+            ProcessingCheckpoint.objects.update_or_create(
+                name=CHECKPOINT, defaults={"position": start}
+            )
+    return written
@@ -0,0 +1,257 @@
+"""
+Versioned points rules, evaluated over whole batches with NumPy.
+
+The rules of a `PointsRuleSet` are compiled into plain `Rule` tuples ordered
+from least to most specific, so a later match overrides an earlier one.
+`score()` applies them to arrays of transaction attributes and `points_for()`
+scores a single transaction the same way for `save()`. Transactions that no
+rule matches are scored at the built-in rates.
+
+Measures are handled in hundredths so that all arithmetic is on integers.
+
+The active rules are compiled once and cached, with the category of every
+produce when they use it, under a generation that `invalidate()` replaces
+whenever a rule, rule set or produce is saved. With Django's default
+local-memory cache each worker process has its own generation, and rules
+cached by another worker are recompiled after `RULES_TIMEOUT` at the latest.
+"""
+
+import time
+from collections import namedtuple
+
+import numpy as np
+from django.core.cache import cache
+
+from .models import (
+    Farmer,
+    FarmersMarketTransaction,
+    PointsLedgerEntry,
+    PointsRule,
+    Produce,
+)
+
+Source = PointsLedgerEntry.Source
+
+# How long compiled rules are cached, in seconds
+RULES_TIMEOUT = 60
+GENERATION_KEY = "points_rules:generation"
+
+Rule = namedtuple(
+    "Rule",
+    [
+        "market_id",
+        "produce_category",
+        "category_type",
+        "valid_from",
+        "valid_until",
+        "unit",
+        "points_per_unit",
+    ],
+)
+
+# One point per unit of quantity, and per 1000 of an input purchase amount
+DEFAULT_RULES = {
+    Source.MARKET: Rule(None, "", "", None, None, 100, 1),
+    Source.INPUT: Rule(None, "", "", None, None, 100_000, 1),
+}
+
+
+def hundredths(value):
+    """Convert a quantity or Decimal amount to an integer count of hundredths"""
+    return int(value * 100)
+
+
+def _ordinal(day):
+    return day.toordinal() if day else None
+
+
+def _specificity(rule):
+    return (
+        sum(
+            bool(criterion)
+            for criterion in (
+                rule.market_id,
+                rule.produce_category,
+                rule.category_type,
+                rule.valid_from or rule.valid_until,
+            )
+        ),
+        _ordinal(rule.valid_from) or 0,
+        rule.pk,
+    )
+
+
+def load(source, rule_set=None):
+    """Compile the rules of `rule_set` (default: the active one) for `source`"""
+    rules = PointsRule.objects.filter(source=source)
+    if rule_set is None:
+        rules = rules.filter(rule_set__is_active=True)
+    else:
+        rules = rules.filter(rule_set=rule_set)
+    return [DEFAULT_RULES[source]] + [
+        Rule(
+            rule.market_id,
+            rule.produce_category,
+            rule.category_type,
+            _ordinal(rule.valid_from),
+            _ordinal(rule.valid_until),
+            hundredths(rule.unit),
+            rule.points_per_unit,
+        )
+        for rule in sorted(rules, key=_specificity)
+    ]
+
+
+def invalidate():
+    """Stop serving the rules compiled before the rules or produce changed"""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+def active(source):
+    """
+    Return the compiled rules of the active rule set for `source`, and the
+    category of every produce by id when the rules use it, cached
+    """
+    generation = cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+    key = f"points_rules:{generation}:{source}"
+    compiled = cache.get(key)
+    if compiled is None:
+        rules = load(source)
+        categories = {}
+        if uses(rules, "produce_category"):
+            categories = dict(Produce.objects.values_list("pk", "category"))
+        compiled = (rules, categories)
+        cache.set(key, compiled, RULES_TIMEOUT)
+    return compiled
+
+
+def uses(rules, criterion):
+    """Whether any of the rules depends on `criterion`"""
+    return any(getattr(rule, criterion) for rule in rules)
+
+
+def score(rules, measures, days, market_ids, produce_categories, category_types):
+    """
+    Score a batch of transactions given as equally long arrays of measures in
+    hundredths, date ordinals, market ids, produce categories and farmer
+    category types. Returns an int64 array of points.
+    """
+    measures = np.asarray(measures, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    market_ids = np.asarray(market_ids, dtype=np.int64)
+    produce_categories = np.asarray(produce_categories, dtype=str)
+    category_types = np.asarray(category_types, dtype=str)
+
+    points = np.zeros(len(measures), dtype=np.int64)
+    for rule in rules:
+        matches = np.ones(len(measures), dtype=bool)
+        if rule.market_id is not None:
+            matches &= market_ids == rule.market_id
+        if rule.produce_category:
+            matches &= produce_categories == rule.produce_category
+        if rule.category_type:
+            matches &= category_types == rule.category_type
+        if rule.valid_from is not None:
+            matches &= days >= rule.valid_from
+        if rule.valid_until is not None:
+            matches &= days < rule.valid_until
+        points[matches] = measures[matches] // rule.unit * rule.points_per_unit
+    return points
+
+
+def score_rows(rules, rows):
+    """
+    Score (measure, date, market id, produce category, category type) rows.
+    A plain function of its arguments, so it can run in worker processes.
+    """
+    if not rows:
+        return []
+    measures, days, market_ids, produce_categories, category_types = zip(*rows)
+    return score(
+        rules,
+        [hundredths(measure) for measure in measures],
+        [day.toordinal() for day in days],
+        market_ids,
+        produce_categories,
+        category_types,
+    ).tolist()
+
+
+def score_market_transactions(transactions, rules=None):
+    """Score a batch of unsaved market transactions, return their points"""
+    if rules is None:
+        rules, categories = active(Source.MARKET)
+    elif uses(rules, "produce_category"):
+        categories = dict(Produce.objects.values_list("pk", "category"))
+    else:
+        categories = {}
+    types = {}
+    if uses(rules, "category_type"):
+        types = dict(
+            Farmer.objects.filter(
+                pk__in={txn.farmer_id for txn in transactions}
+            ).values_list("pk", "category_type")
+        )
+    return score_rows(
+        rules,
+        [
+            (
+                txn.quantity,
+                txn.transaction_date,
+                txn.market_id,
+                categories.get(txn.produce_id, ""),
+                types.get(txn.farmer_id, ""),
+            )
+            for txn in transactions
+        ],
+    )
+
+
+def _matches(rule, day, market_id, produce_category, category_type):
+    if rule.market_id is not None and rule.market_id != market_id:
+        return False
+    if rule.produce_category and rule.produce_category != produce_category:
+        return False
+    if rule.category_type and rule.category_type != category_type:
+        return False
+    if rule.valid_from is not None and (day is None or day < rule.valid_from):
+        return False
+    if rule.valid_until is not None and (day is None or day >= rule.valid_until):
+        return False
+    return True
+
+
+def points_for(instance):
+    """Score a single market or input transaction under the active rules"""
+    if isinstance(instance, FarmersMarketTransaction):
+        source = Source.MARKET
+        measure, day = instance.quantity, instance.transaction_date
+    else:
+        source = Source.INPUT
+        measure, day = instance.amount, instance.receipt_verification_date
+    rules, categories = active(source)
+
+    produce_category = ""
+    if source == Source.MARKET:
+        produce_category = categories.get(instance.produce_id, "")
+    category_type = None
+    for rule in reversed(rules):
+        if rule.category_type and category_type is None:
+            # The farmer is only read for a rule that would otherwise apply
+            if not _matches(
+                rule._replace(category_type=""),
+                _ordinal(day),
+                instance.market_id,
+                produce_category,
+                "",
+            ):
+                continue
+            category_type = instance.farmer.category_type
+        if _matches(
+            rule,
+            _ordinal(day),
+            instance.market_id,
+            produce_category,
+            category_type or "",
+        ):
+            return hundredths(measure) // rule.unit * rule.points_per_unit
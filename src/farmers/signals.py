@@ -1,8 +1,27 @@
-from django.db import models
-from django.db.models.signals import post_delete, post_save
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import Farmer, FarmersInputTransaction, FarmersMarketTransaction
+from market.models import Market, Produce
+
+from . import flags, leaderboards, ledger, listing, rollups, rules
+from .models import (
+    ArchivedMarketTransaction,
+    Farmer,
+    FarmersInputTransaction,
+    FarmersMarketTransaction,
+    LeaderboardBucket,
+    LeaderboardEntry,
+    PointsRule,
+    PointsRuleSet,
+)
+
+
+def _deleted_via(origin, model):
+    """Whether a delete was started by deleting `model` instance(s)"""
+    if isinstance(origin, models.QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
 
 
 @receiver(post_save, sender=FarmersMarketTransaction)
@@ -31,17 +50,82 @@ def update_farmer_input_transaction_status(sender, instance, created, **kwargs):
         )
 
 
+@receiver(post_save, sender=FarmersMarketTransaction)
+@receiver(post_save, sender=FarmersInputTransaction)
+def record_transaction_points(sender, instance, **kwargs):
+    ledger.record(instance)
+
+
+# Archived transactions are only deleted, by cascades from their farmer,
+# market or produce, or by merging farmers
+@receiver(post_delete, sender=FarmersMarketTransaction)
+@receiver(post_delete, sender=ArchivedMarketTransaction)
+@receiver(post_delete, sender=FarmersInputTransaction)
+def reverse_transaction_points(sender, instance, origin=None, **kwargs):
+    # The farmer's ledger and balances are deleted along with the farmer
+    if _deleted_via(origin, Farmer):
+        return
+    ledger.record(instance, deleted=True, detach_market=_deleted_via(origin, Market))
+
+
+@receiver(pre_save, sender=FarmersMarketTransaction)
+def remember_rollup_state(sender, instance, **kwargs):
+    instance._rollup_previous = (
+        None if instance._state.adding else rollups.saved_state(instance)
+    )
+
+
+@receiver(post_save, sender=FarmersMarketTransaction)
+def update_daily_rollup(sender, instance, **kwargs):
+    rollups.record(instance._rollup_previous, rollups.state_of(instance))
+    instance._rollup_previous = rollups.state_of(instance)
+
+
+@receiver(post_delete, sender=FarmersMarketTransaction)
+@receiver(post_delete, sender=ArchivedMarketTransaction)
+def remove_from_daily_rollup(sender, instance, **kwargs):
+    rollups.record(rollups.state_of(instance), None)
+
+
+@receiver(post_save, sender=FarmersMarketTransaction)
+@receiver(post_delete, sender=FarmersMarketTransaction)
+@receiver(post_delete, sender=ArchivedMarketTransaction)
+def invalidate_transaction_counts(sender, **kwargs):
+    transaction.on_commit(listing.invalidate)
+
+
+@receiver(post_save, sender=PointsRule)
+@receiver(post_delete, sender=PointsRule)
+@receiver(post_save, sender=PointsRuleSet)
+@receiver(post_delete, sender=PointsRuleSet)
+@receiver(post_save, sender=Produce)
+def invalidate_points_rules(sender, **kwargs):
+    # At once for the rest of this transaction, and again on commit for rules
+    # compiled by other requests before the change was visible
+    rules.invalidate()
+    transaction.on_commit(rules.invalidate)
+
+
+@receiver(post_delete, sender=Market)
+def delete_market_leaderboards(sender, instance, **kwargs):
+    board = {"scope": LeaderboardEntry.Scope.MARKET, "scope_id": instance.pk}
+    LeaderboardEntry.objects.filter(**board).delete()
+    LeaderboardBucket.objects.filter(**board).delete()
+
+
+@receiver(pre_delete, sender=Farmer)
+def remove_farmer_from_leaderboards(sender, instance, **kwargs):
+    # The farmer's entries are deleted along with the farmer, without a ledger
+    # reversal to take them off the boards
+    leaderboards.forget(LeaderboardEntry.objects.filter(farmer=instance))
+
+
+@receiver(post_delete, sender=FarmersMarketTransaction)
+@receiver(post_delete, sender=ArchivedMarketTransaction)
 @receiver(post_delete, sender=FarmersInputTransaction)
-def update_farmer_has_input_transactions(sender, instance, **kwarg):
-    farmer = instance.farmer
-    has_input_transaction = FarmersInputTransaction.objects.filter(
-        farmer=farmer
-    ).exists()
-    if not has_input_transaction:
-        print("\n Did we ge here")
-        farmer.has_input_transaction = False
-        farmer.is_verified = False
-        farmer.save(update_fields=["has_input_transaction", "is_verified"])
+def refresh_farmer_transaction_flags(sender, instance, origin=None, **kwargs):
+    if not _deleted_via(origin, Farmer):
+        flags.schedule_refresh(instance.farmer_id)
 
     # @admin.display(description="Total Points")
     # def total_points(self):
@@ -1,3 +1,916 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, models
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.testing import create_farmer, create_market
+from farmers import (
+    archive,
+    assignment,
+    dedup,
+    intake,
+    leaderboards,
+    ledger,
+    listing,
+    rollups,
+    rules,
+    search,
+)
+from farmers.filters import FarmerFilter
+from farmers.managers import AGE_BANDS
+from farmers.models import (
+    ArchivedMarketTransaction,
+    DailyMarketProduceRollup,
+    Farmer,
+    FarmersInputTransaction,
+    FarmersMarketTransaction,
+    LeaderboardBucket,
+    LeaderboardEntry,
+    PointsLedgerEntry,
+    PointsRule,
+    PointsRuleSet,
+    TransactionAnomaly,
+)
+from market.models import Address, Produce
+
+
+class IndexScanMixin:
+    def setUp(self):
+        super().setUp()
+        if connection.vendor == "postgresql":
+            # Small test tables would otherwise always be sequentially scanned
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+
+
+class TransactionQueryPlanTest(IndexScanMixin, TestCase):
+    """The points queries must stay index range scans as the table grows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.market = create_market()
+        produce = Produce.objects.create(name="Maize", slug="maize")
+        FarmersMarketTransaction.objects.create(
+            farmer=cls.farmer,
+            market=cls.market,
+            produce=produce,
+            quantity=10,
+            transaction_date=date(2024, 6, 1),
+        )
+
+    def assertUsesIndex(self, run, index_name):
+        """EXPLAIN the transaction queries `run` makes"""
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        statements = [
+            query["sql"]
+            for query in queries
+            if FarmersMarketTransaction._meta.db_table in query["sql"]
+        ]
+        self.assertTrue(statements)
+        for sql in statements:
+            with connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}")
+                plan = "\n".join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn(index_name, plan)
+            if connection.vendor == "sqlite":
+                self.assertIn("COVERING INDEX", plan)
+
+    def test_farmer_year_query_uses_covering_index(self):
+        self.assertUsesIndex(
+            lambda: FarmersMarketTransaction.objects.points_by_farmer(
+                [self.farmer], years=[2023, 2024]
+            ),
+            "mkt_txn_farmer_date_idx",
+        )
+
+    def test_market_year_query_uses_covering_index(self):
+        self.assertUsesIndex(
+            lambda: FarmersMarketTransaction.objects.points_by_market(
+                [self.market], years=[2024]
+            ),
+            "mkt_txn_market_date_idx",
+        )
+
+    def test_annual_points(self):
+        transactions = FarmersMarketTransaction.objects
+        self.assertEqual(transactions.calculate_annual_points(self.farmer, 2024), 10)
+        self.assertEqual(transactions.calculate_annual_points(self.farmer, 2025), 0)
+        self.assertEqual(
+            transactions.calculate_market_points_year(self.market, 2024), 10
+        )
+
+
+class FarmerFlagsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.markets = [
+            create_market(),
+            create_market("Yankaba", "+2348031234568"),
+        ]
+        produce = Produce.objects.create(name="Maize", slug="maize")
+        for market in cls.markets:
+            FarmersMarketTransaction.objects.create(
+                farmer=cls.farmer,
+                market=market,
+                produce=produce,
+                quantity=1,
+                transaction_date=date(2024, 5, 2),
+            )
+        FarmersInputTransaction.objects.create(
+            farmer=cls.farmer,
+            market=cls.markets[0],
+            amount=100,
+            receipt_number="R-1",
+        )
+
+    def flags(self):
+        self.farmer.refresh_from_db()
+        return (
+            self.farmer.has_market_transaction,
+            self.farmer.has_input_transaction,
+            self.farmer.is_verified,
+        )
+
+    def test_deletes_recompute_the_flags_on_commit(self):
+        self.assertEqual(self.flags(), (True, True, True))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.markets[0].delete()
+        # The sale at the other market is left, the input purchase went with
+        # the market
+        self.assertEqual(self.flags(), (True, False, False))
+        with self.captureOnCommitCallbacks(execute=True):
+            FarmersMarketTransaction.objects.all().delete()
+        self.assertEqual(self.flags(), (False, False, False))
+
+    def test_refresh_corrects_stale_flags(self):
+        Farmer.objects.update(has_market_transaction=False, has_input_transaction=False)
+        self.assertEqual(Farmer.objects.refresh_transaction_flags(chunk_size=1), 1)
+        self.assertEqual(self.flags(), (True, True, True))
+
+
+class DailyRollupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmers = [create_farmer(), create_farmer("Musa", "Garba")]
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize", slug="maize")
+
+    def sell(self, farmer, day, quantity):
+        return FarmersMarketTransaction.objects.create(
+            farmer=farmer,
+            market=self.market,
+            produce=self.produce,
+            quantity=quantity,
+            transaction_date=day,
+        )
+
+    def rollup(self):
+        return list(
+            DailyMarketProduceRollup.objects.order_by("date").values_list(
+                "date", "transaction_count", "total_quantity", "distinct_farmers"
+            )
+        )
+
+    def test_rollup_follows_saves_deletes_and_refresh(self):
+        sale = self.sell(self.farmers[0], date(2024, 5, 2), 4)
+        self.sell(self.farmers[1], date(2024, 5, 2), 6)
+        later = self.sell(self.farmers[0], date(2024, 5, 9), 1)
+        self.assertEqual(
+            self.rollup(), [(date(2024, 5, 2), 2, 10, 2), (date(2024, 5, 9), 1, 1, 1)]
+        )
+        sale.quantity = 5
+        sale.save()
+        later.delete()
+        self.assertEqual(
+            self.rollup(), [(date(2024, 5, 2), 2, 11, 2), (date(2024, 5, 9), 0, 0, 0)]
+        )
+
+        # Deleted without signals, as a raw bulk delete does; a refresh also
+        # drops the rows left empty
+        sales = FarmersMarketTransaction.objects.filter(farmer=self.farmers[1])
+        sales._raw_delete(sales.db)
+        rollups.refresh(
+            {
+                (self.market.pk, self.produce.pk, date(2024, 5, 2)),
+                (self.market.pk, self.produce.pk, date(2024, 5, 9)),
+            }
+        )
+        self.assertEqual(self.rollup(), [(date(2024, 5, 2), 1, 5, 1)])
+
+    def test_backfill_covers_the_market_points(self):
+        self.sell(self.farmers[0], date(2024, 5, 2), 4)
+        self.sell(self.farmers[1], date(2023, 5, 2), 6)
+        DailyMarketProduceRollup.objects.all().delete()
+        self.assertFalse(rollups.covers())
+        rollups.backfill()
+        self.assertTrue(rollups.covers())
+        self.assertEqual(len(self.rollup()), 2)
+        transactions = FarmersMarketTransaction.objects
+        self.assertEqual(transactions.calculate_market_points(self.market), 10)
+        self.assertEqual(
+            transactions.calculate_market_points_year(self.market, 2024), 4
+        )
+
+
+class AgeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, born in (
+            ("Turned", date(1989, 3, 1)),
+            ("Almost", date(1989, 3, 2)),
+            ("Senior", date(1964, 3, 1)),
+            ("Adult", date(1964, 3, 2)),
+            ("Leap", date(2000, 2, 29)),
+        ):
+            create_farmer(name, "Bello", date_of_birth=born)
+
+    def ages(self, today):
+        return dict(Farmer.objects.with_age(today).values_list("first_name", "age"))
+
+    def test_ages_and_bands_agree_around_birthdays(self):
+        self.assertEqual(
+            self.ages(date(2024, 3, 1)),
+            {"Turned": 35, "Almost": 34, "Senior": 60, "Adult": 59, "Leap": 24},
+        )
+        self.assertEqual(self.ages(date(2023, 2, 28))["Leap"], 22)
+        self.assertEqual(
+            Farmer.objects.count_by_age_band(date(2024, 3, 1)),
+            {"youth": 2, "adult": 2, "senior": 1},
+        )
+        for today in (date(2024, 3, 1), date(2024, 2, 29), date(2023, 2, 28)):
+            ages = self.ages(today)
+            for band, (_, minimum, maximum) in AGE_BANDS.items():
+                with self.subTest(today=today, band=band):
+                    self.assertEqual(
+                        set(
+                            Farmer.objects.in_age_band(band, today).values_list(
+                                "first_name", flat=True
+                            )
+                        ),
+                        {
+                            name
+                            for name, age in ages.items()
+                            if (minimum is None or age >= minimum)
+                            and (maximum is None or age < maximum)
+                        },
+                    )
+
+
+class FarmerSearchTest(IndexScanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer(identification_number="ab-123 45")
+        create_farmer("Musa", "Garba", identification_number="AB12346")
+
+    def test_identification_number_with_separators(self):
+        for query in ("ab-123 45", "AB12345", "AB 123-45"):
+            with self.subTest(query=query):
+                self.assertEqual(search.search(query), [self.farmer])
+
+    def test_exact_and_prefix_names_come_first(self):
+        create_farmer("Aminatu", "Bellow")
+        create_farmer("Amina", "Bella")
+        self.assertEqual(
+            [str(farmer) for farmer in search.search("amina bello")],
+            ["Amina-Bello", "Aminatu-Bellow", "Amina-Bella"],
+        )
+
+    def test_identification_lookup_uses_index(self):
+        plan = (
+            Farmer.objects.alias(key=search.IdentificationKey("identification_number"))
+            .filter(key="AB12345")
+            .explain()
+        )
+        self.assertIn("farmer_identification_idx", plan)
+
+
+class TransactionIntakeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        create_farmer("Musa", "Garba")
+        cls.market = create_market(last_market_day=date.today())
+        cls.market.produce_items.add(Produce.objects.create(name="Maize", slug="maize"))
+
+    def setUp(self):
+        intake._catalogue.load()
+        # A buffer that would hold a lone request for a minute if it waited
+        patcher = mock.patch.object(
+            intake, "_buffer", intake.WriteBehindBuffer(flush_ms=60_000)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def item(self, farmer="amina-bello", quantity=5):
+        return {
+            "farmer": farmer,
+            "market": "dawanau",
+            "produce": "maize",
+            "quantity": quantity,
+        }
+
+    def test_lone_request_is_written_at_once(self):
+        start = time.monotonic()
+        results = intake.submit([self.item(), self.item("musa-garba", 0)])
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual(results[0], {"status": "saved", "points_earned": 5})
+        self.assertEqual(results[1]["status"], "invalid")
+        self.assertEqual(FarmersMarketTransaction.objects.count(), 1)
+
+    def test_sale_recorded_twice_is_a_conflict(self):
+        with mock.patch.object(ledger, "reconcile") as reconcile:
+            intake.submit([self.item()])
+            results = intake.submit([self.item(quantity=8), self.item(quantity=9)])
+        reconcile.assert_not_called()
+        self.assertEqual([result["status"] for result in results], ["conflict"] * 2)
+        self.assertQuerySetEqual(
+            FarmersMarketTransaction.objects.values_list("quantity", flat=True), [5]
+        )
+        self.farmer.refresh_from_db()
+        self.assertEqual(self.farmer.earned_points, 5)
+        self.assertEqual(ledger.annual_points(self.farmer, date.today().year), 5)
+
+    def test_sale_submitted_twice_in_a_flush_keeps_the_first(self):
+        results = intake.submit(
+            [self.item("musa-garba", 3), self.item("musa-garba", 4)]
+        )
+        self.assertEqual(results[0], {"status": "saved", "points_earned": 3})
+        self.assertEqual(results[1]["status"], "conflict")
+        self.assertQuerySetEqual(
+            FarmersMarketTransaction.objects.values_list("quantity", flat=True), [3]
+        )
+
+    def test_waits_for_peers(self):
+        intake._buffer.submitted[threading.get_ident() + 1] = time.monotonic()
+        intake._buffer.flush_ms = 50
+        start = time.monotonic()
+        intake.submit([self.item()])
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_failed_flush_is_retried_row_by_row(self):
+        save = intake.save
+
+        def failing_save(transactions):
+            if any(txn.quantity == 13 for txn in transactions):
+                raise IntegrityError("rejected")
+            return save(transactions)
+
+        with mock.patch.object(intake, "save", failing_save):
+            results = intake.submit([self.item(), self.item("musa-garba", 13)])
+        self.assertEqual(results[0]["status"], "saved")
+        self.assertEqual(results[1]["status"], "failed")
+        self.assertQuerySetEqual(
+            FarmersMarketTransaction.objects.values_list("farmer", flat=True),
+            [self.farmer.pk],
+        )
+
+    def test_endpoint_is_csrf_checked(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(
+            get_user_model().objects.create_superuser(
+                "device", "device@example.com", "password"
+            )
+        )
+        url = reverse("transaction_intake")
+        body = json.dumps(self.item())
+        self.assertEqual(
+            client.post(url, body, content_type="application/json").status_code, 403
+        )
+        client.get(reverse("sync_pull"), {"tables": "markets"})
+        response = client.post(
+            url,
+            body,
+            content_type="application/json",
+            headers={"X-CSRFToken": client.cookies["csrftoken"].value},
+        )
+        self.assertEqual(response.json()["results"][0]["status"], "saved")
+
+
+class LedgerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize", slug="maize")
+
+    def sell(self, quantity, transaction_date=date(2024, 5, 2)):
+        return FarmersMarketTransaction.objects.create(
+            farmer=self.farmer,
+            market=self.market,
+            produce=self.produce,
+            quantity=quantity,
+            transaction_date=transaction_date,
+        )
+
+    def assertBalances(self, total, annual):
+        self.farmer.refresh_from_db()
+        self.assertEqual(self.farmer.earned_points, total)
+        for year, points in annual.items():
+            self.assertEqual(ledger.annual_points(self.farmer, year), points)
+
+    def test_records_create_edit_and_delete(self):
+        sale = self.sell(4)
+        self.assertBalances(4, {2024: 4})
+        sale.quantity = 7
+        sale.save()
+        self.assertQuerySetEqual(
+            PointsLedgerEntry.objects.order_by("pk").values_list("points", flat=True),
+            [4, 3],
+        )
+        self.assertBalances(7, {2024: 7})
+
+        sale.transaction_date = date(2023, 12, 30)
+        sale.save()
+        self.assertBalances(7, {2023: 7, 2024: 0})
+        sale.delete()
+        self.assertBalances(0, {2023: 0, 2024: 0})
+        self.assertEqual(
+            PointsLedgerEntry.objects.aggregate(total=models.Sum("points"))["total"], 0
+        )
+
+    def test_reconcile_restores_missing_entries_and_balances(self):
+        self.sell(4)
+        self.sell(6, date(2023, 5, 2))
+        PointsLedgerEntry.objects.all().delete()
+        Farmer.objects.filter(pk=self.farmer.pk).update(earned_points=1)
+        self.assertEqual(ledger.reconcile([self.farmer.pk]), (2, 1))
+        self.assertBalances(10, {2023: 6, 2024: 4})
+        self.assertEqual(ledger.reconcile([self.farmer.pk]), (0, 0))
+
+
+class PointsRulesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize", slug="maize")
+        rule_set = PointsRuleSet.objects.create(version=1, is_active=True)
+        cls.rule = PointsRule.objects.create(
+            rule_set=rule_set,
+            source=PointsLedgerEntry.Source.MARKET,
+            produce_category=cls.produce.category,
+            points_per_unit=2,
+        )
+        # A farmer category rule for another market
+        PointsRule.objects.create(
+            rule_set=rule_set,
+            source=PointsLedgerEntry.Source.MARKET,
+            market=create_market("Yankaba", "+2348031234568"),
+            category_type=Farmer.CategoryType.SMALL_HOLDER,
+            points_per_unit=5,
+        )
+
+    def setUp(self):
+        # The rules cached from a test outlive its rolled back rule changes
+        rules.invalidate()
+        self.addCleanup(rules.invalidate)
+        self.day = date(2024, 5, 1)
+
+    def sell(self):
+        # A sale whose farmer and produce are not loaded
+        self.day += timedelta(days=1)
+        return FarmersMarketTransaction.objects.create(
+            farmer_id=self.farmer.pk,
+            market=self.market,
+            produce_id=self.produce.pk,
+            quantity=3,
+            transaction_date=self.day,
+        )
+
+    def test_compiled_rules_are_cached(self):
+        self.assertEqual(self.sell().points_earned, 6)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.sell().points_earned, 6)
+        # Scored before the INSERT without reading the rules, produce or farmer
+        statements = [query["sql"] for query in queries]
+        insert = next(i for i, sql in enumerate(statements) if sql.startswith("INSERT"))
+        self.assertFalse(
+            [sql for sql in statements[:insert] if sql.startswith("SELECT")]
+        )
+
+    def test_changed_rules_are_recompiled(self):
+        self.sell()
+        self.rule.points_per_unit = 4
+        self.rule.save()
+        self.assertEqual(self.sell().points_earned, 12)
+        self.produce.category = Produce.ProduceCategory.PULSE_NUT
+        self.produce.save()
+        self.assertEqual(self.sell().points_earned, 3)
+        self.assertEqual(
+            rules.active(PointsLedgerEntry.Source.MARKET)[1],
+            {self.produce.pk: Produce.ProduceCategory.PULSE_NUT},
+        )
+
+
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize", slug="maize")
+        for day, quantity in ((date(2023, 5, 2), 4), (date(2024, 5, 2), 6)):
+            FarmersMarketTransaction.objects.create(
+                farmer=cls.farmer,
+                market=cls.market,
+                produce=cls.produce,
+                quantity=quantity,
+                transaction_date=day,
+            )
+
+    def test_archive_moves_closed_years_and_keeps_points(self):
+        self.assertEqual(archive.archive(date(2024, 1, 1), chunk_size=1), 1)
+        self.assertEqual(archive.archived_before(), date(2024, 1, 1))
+        self.assertQuerySetEqual(
+            ArchivedMarketTransaction.objects.values_list("quantity", flat=True), [4]
+        )
+        self.assertQuerySetEqual(
+            FarmersMarketTransaction.objects.values_list("quantity", flat=True), [6]
+        )
+        self.farmer.refresh_from_db()
+        self.assertEqual(self.farmer.earned_points, 10)
+        self.assertEqual(ledger.annual_points(self.farmer, 2023), 4)
+
+    def test_archive_drops_sales_it_already_holds(self):
+        archive.archive(date(2024, 1, 1))
+        FarmersMarketTransaction.objects.create(
+            farmer=self.farmer,
+            market=self.market,
+            produce=self.produce,
+            quantity=4,
+            transaction_date=date(2023, 5, 2),
+        )
+        self.assertEqual(archive.archive(date(2024, 1, 1)), 0)
+        self.assertEqual(ArchivedMarketTransaction.objects.count(), 1)
+        self.assertFalse(
+            FarmersMarketTransaction.objects.filter(
+                transaction_date__lt=date(2024, 1, 1)
+            ).exists()
+        )
+        self.farmer.refresh_from_db()
+        self.assertEqual(self.farmer.earned_points, 10)
+        self.assertEqual(ledger.annual_points(self.farmer, 2023), 4)
+
+    def test_cascade_reverses_archived_points(self):
+        archive.archive(date(2024, 1, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.market.delete()
+        self.farmer.refresh_from_db()
+        self.assertEqual(self.farmer.earned_points, 0)
+        self.assertEqual(ledger.annual_points(self.farmer, 2023), 0)
+        self.assertFalse(self.farmer.has_market_transaction)
+        self.assertFalse(
+            LeaderboardEntry.objects.filter(farmer=self.farmer, points__gt=0).exists()
+        )
+        self.assertEqual(ledger.reconcile([self.farmer.pk]), (0, 0))
+
+
+class TransactionListingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize", slug="maize")
+        for day in (date(2023, 3, 1), date(2023, 12, 1), date(2024, 2, 1)):
+            cls.sell(day)
+        archive.archive(date(2024, 1, 1))
+        # Pushed late, after its year was archived
+        cls.sell(date(2023, 6, 1))
+
+    @classmethod
+    def sell(cls, day):
+        FarmersMarketTransaction.objects.create(
+            farmer=cls.farmer,
+            market=cls.market,
+            produce=cls.produce,
+            quantity=1,
+            transaction_date=day,
+        )
+
+    def browse(self, data):
+        days, cursor = [], None
+        while True:
+            page = listing.browse(data, cursor=cursor, size=1)
+            days += [sale.transaction_date for sale in page.transactions]
+            if page.next_cursor is None:
+                return days
+            cursor = page.next_cursor
+
+    def test_pages_merge_the_archive_and_late_sales(self):
+        self.assertEqual(
+            self.browse({}),
+            [date(2024, 2, 1), date(2023, 12, 1), date(2023, 6, 1), date(2023, 3, 1)],
+        )
+        self.assertEqual(
+            self.browse({"end_date": "2023-12-31"}),
+            [date(2023, 12, 1), date(2023, 6, 1), date(2023, 3, 1)],
+        )
+        page = listing.browse({})
+        self.assertEqual((page.count, page.estimated), (4, False))
+
+    def test_farmer_filter_matches_archived_sales(self):
+        create_farmer("Musa", "Garba")
+        farmers = FarmerFilter(
+            {"start_date": "2023-03-01", "end_date": "2023-03-31"},
+            queryset=Farmer.objects.all(),
+        ).qs
+        self.assertQuerySetEqual(farmers, [self.farmer])
+
+
+class AssignmentTest(TestCase):
+    def test_farmers_are_placed_at_the_located_market_they_last_sold_at(self):
+        farmer = create_farmer()
+        create_farmer("Hauwa")
+        produce = Produce.objects.create(name="Maize", slug="maize")
+        markets = [
+            create_market(name, f"+23480312345{i:02}")
+            for i, name in enumerate(["Dawanau", "Yankaba", "Sabon"])
+        ]
+        for i, market in enumerate(markets[:2]):
+            Address.objects.filter(market=market).update(
+                latitude=12.0 + i, longitude=8.5 + i
+            )
+        for market, day in zip(
+            markets, [date(2024, 1, 8), date(2024, 2, 5), date(2024, 3, 4)]
+        ):
+            FarmersMarketTransaction.objects.create(
+                farmer=farmer,
+                market=market,
+                produce=produce,
+                quantity=1,
+                transaction_date=day,
+            )
+        self.assertEqual(assignment.farmer_locations(), {farmer.pk: (13.0, 9.5)})
+
+
+class DedupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.record = create_farmer(date_of_birth=date(1985, 3, 14))
+        cls.duplicate = create_farmer("Aminah", date_of_birth=date(1985, 3, 14))
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize", slug="maize")
+
+    def sell(self, farmer, day, quantity):
+        FarmersMarketTransaction.objects.create(
+            farmer=farmer,
+            market=self.market,
+            produce=self.produce,
+            quantity=quantity,
+            transaction_date=day,
+        )
+
+    def test_find_counts_only_new_candidates(self):
+        self.assertEqual(dedup.find(dedup.Kind.FARMER), (1, 1, 0))
+        self.assertEqual(dedup.find(dedup.Kind.FARMER), (1, 0, 0))
+
+    def test_merge_keeps_the_duplicate_anomaly_flags(self):
+        self.sell(self.duplicate, date(2024, 5, 7), 40)
+        anomaly = TransactionAnomaly.objects.create(
+            source=PointsLedgerEntry.Source.MARKET,
+            source_id=str(FarmersMarketTransaction.objects.get().pk),
+            farmer=self.duplicate,
+            market=self.market,
+            week=date(2024, 5, 6),
+            value=40,
+            median=4,
+            mad=1,
+            score=36,
+            status=TransactionAnomaly.Status.CONFIRMED,
+        )
+        dedup.merge_farmers(self.record, self.duplicate)
+        anomaly.refresh_from_db()
+        self.assertEqual(anomaly.farmer, self.record)
+        self.assertEqual(anomaly.status, TransactionAnomaly.Status.CONFIRMED)
+
+    def test_merge_drops_sales_recorded_for_both(self):
+        both, archived, late = date(2023, 5, 2), date(2023, 6, 6), date(2023, 7, 4)
+        for day, quantity in ((both, 4), (date(2024, 5, 7), 6)):
+            self.sell(self.record, day, quantity)
+            self.sell(self.duplicate, day, quantity)
+        self.sell(self.duplicate, archived, 2)
+        self.sell(self.duplicate, late, 3)
+        archive.archive(date(2024, 1, 1))
+        # Recorded for the kept farmer after the year was archived
+        self.sell(self.record, late, 3)
+
+        dedup.merge_farmers(self.record, self.duplicate)
+        self.assertEqual(
+            set(
+                ArchivedMarketTransaction.objects.values_list(
+                    "farmer", "transaction_date"
+                )
+            ),
+            {(self.record.pk, both), (self.record.pk, archived)},
+        )
+        self.assertEqual(
+            FarmersMarketTransaction.objects.filter(farmer=self.record).count(), 2
+        )
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.earned_points, 15)
+
+
+class LeaderboardTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.market = create_market()
+
+    def entry(self, points):
+        return PointsLedgerEntry(
+            source=PointsLedgerEntry.Source.MARKET,
+            source_id="1",
+            farmer_id=self.farmer.pk,
+            market_id=self.market.pk,
+            year=2024,
+            points=points,
+        )
+
+    def test_entries_created_concurrently_are_added_to(self):
+        leaderboards.apply([self.entry(5)])
+        # As if another writer created the entries after they were read
+        with mock.patch.object(
+            LeaderboardEntry.objects,
+            "select_for_update",
+            return_value=LeaderboardEntry.objects.none(),
+        ):
+            leaderboards.apply([self.entry(3)])
+        self.assertEqual(
+            set(LeaderboardEntry.objects.values_list("scope", "points")),
+            {
+                (LeaderboardEntry.Scope.MARKET, 8),
+                (LeaderboardEntry.Scope.LGA, 8),
+                (LeaderboardEntry.Scope.STATE, 8),
+            },
+        )
+        self.assertEqual(
+            leaderboards.rank(
+                self.farmer, LeaderboardEntry.Scope.MARKET, self.market.pk, 2024
+            ),
+            1,
+        )
+
+    def standings(self, *points):
+        farmers = [self.farmer] + [
+            create_farmer("Farmer", str(number)) for number in range(1, len(points))
+        ]
+        leaderboards.apply(
+            [
+                PointsLedgerEntry(
+                    source=PointsLedgerEntry.Source.MARKET,
+                    source_id=str(farmer.pk),
+                    farmer_id=farmer.pk,
+                    market_id=self.market.pk,
+                    year=2024,
+                    points=score,
+                )
+                for farmer, score in zip(farmers, points)
+            ]
+        )
+        return farmers
+
+    def ranks(self, farmers):
+        return [
+            leaderboards.rank(
+                farmer, LeaderboardEntry.Scope.MARKET, self.market.pk, 2024
+            )
+            for farmer in farmers
+        ]
+
+    def test_rank_counts_the_farmers_above(self):
+        farmers = self.standings(300, 17, 17, 16, 1, 5000, 256)
+        # The entry and one read of the bucket counts, however deep the rank
+        with self.assertNumQueries(2 * len(farmers)):
+            self.assertEqual(self.ranks(farmers), [2, 4, 4, 6, 7, 1, 3])
+
+        # A farmer dropping down the board
+        leaderboards.apply([self.entry(-290)])
+        self.assertEqual(self.ranks(farmers), [6, 3, 3, 5, 7, 1, 2])
+        # and off it
+        leaderboards.apply([self.entry(-10)])
+        self.assertEqual(self.ranks(farmers), [None, 3, 3, 5, 6, 1, 2])
+
+        def counts():
+            return set(
+                LeaderboardBucket.objects.filter(farmers__gt=0).values_list(
+                    "scope", "scope_id", "year", "level", "bucket", "farmers"
+                )
+            )
+
+        # The counts kept by the updates are the ones a rebuild arrives at
+        counted = counts()
+        leaderboards.rebuild_buckets()
+        self.assertEqual(counts(), counted)
+        self.assertEqual(self.ranks(farmers), [None, 3, 3, 5, 6, 1, 2])
+
+    def test_deleted_farmer_leaves_the_ranks(self):
+        farmers = self.standings(10, 30, 20)
+        farmers[1].delete()
+        self.assertEqual(self.ranks([farmers[0], farmers[2]]), [2, 1])
+
+
+class TransactionAdminFilterTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmers = [create_farmer(), create_farmer("Musa", "Garba")]
+        market = create_market()
+        produce = Produce.objects.create(name="Maize", slug="maize")
+        cls.sales = [
+            FarmersMarketTransaction.objects.create(
+                farmer=farmer,
+                market=market,
+                produce=produce,
+                quantity=1,
+                transaction_date=date(2024, 5, 2),
+            )
+            for farmer in cls.farmers
+        ]
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "password"
+        )
+
+    def test_filter_by_farmer_loads_only_the_selected_one(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("admin:farmers_farmersmarkettransaction_changelist"),
+            {"farmer__id__exact": self.farmers[0].pk},
+        )
+        self.assertEqual(list(response.context["cl"].result_list), self.sales[:1])
+        self.assertContains(
+            response, f'<option value="{self.farmers[0].pk}" selected>', html=False
+        )
+        # The other farmers are searched for, not listed
+        self.assertNotContains(response, str(self.farmers[1]))
+
+
+class TransactionAnomalyAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize", slug="maize")
+        cls.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "password"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def flag(self, transaction_date):
+        sale = FarmersMarketTransaction.objects.create(
+            farmer=self.farmer,
+            market=self.market,
+            produce=self.produce,
+            quantity=1,
+            transaction_date=transaction_date,
+        )
+        TransactionAnomaly.objects.create(
+            source=PointsLedgerEntry.Source.MARKET,
+            source_id=str(sale.pk),
+            farmer=self.farmer,
+            market=self.market,
+            week=transaction_date,
+            value=1,
+            median=1,
+            mad=0,
+            score=1,
+        )
+        return sale
+
+    def changelist(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("admin:farmers_transactionanomaly_changelist")
+            )
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_links_rows_to_their_table_in_one_query(self):
+        old = self.flag(date(2023, 5, 1))
+        archive.archive(date(2024, 1, 1))
+        _, queries = self.changelist()
+        hot = [self.flag(date(2024, 5, 6)), self.flag(date(2024, 5, 13))]
+        response, more_queries = self.changelist()
+        self.assertEqual(more_queries, queries)
+        self.assertContains(
+            response,
+            reverse(
+                "admin:farmers_archivedmarkettransaction_change", args=[str(old.pk)]
+            ),
+        )
+        for sale in hot:
+            self.assertContains(
+                response,
+                reverse(
+                    "admin:farmers_farmersmarkettransaction_change", args=[sale.pk]
+                ),
+            )
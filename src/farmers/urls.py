@@ -2,4 +2,15 @@ from django.urls import path
 
 from . import views
 
-urlpatterns = []
+urlpatterns = [
+    path("search/", views.farmer_search, name="farmer_search"),
+    path(
+        "transactions/", views.market_transaction_list, name="market_transaction_list"
+    ),
+    path(
+        "api/transactions/",
+        views.market_transaction_api,
+        name="market_transaction_api",
+    ),
+    path("intake/", views.transaction_intake, name="transaction_intake"),
+]
@@ -1,21 +1,139 @@
-# from django.shortcuts import render
+import json
 
-# from farmers.models import FarmersInputTransaction, FarmersMarketTransaction
+from django.contrib.auth.decorators import login_required, permission_required
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.shortcuts import render
+from django.views.decorators.http import require_GET, require_POST
 
-# from .filters import TransactionFilter
+from core.pagination import CURSOR_VAR
 
+from . import intake, listing, search
+from .filters import TransactionFilter
+from .models import Farmer
 
-# def market_transaction_list(request):
-#     transaction_filter = TransactionFilter(
-#         request.GET,
-#         queryset=FarmersMarketTransaction.objects.all().select_related(
-#             "farmer", "market", "produce"
-#         ),
-#     )
-#     context = {
-#         "filter": transaction_filter,
-#     }
-#     return render(request, "farmers/transactions-list.html", context)
+
+@require_GET
+@permission_required("farmers.view_farmersmarkettransaction", raise_exception=True)
+def market_transaction_list(request):
+    """Browse the market transactions matching TransactionFilter, newest first"""
+    try:
+        page = listing.browse(request.GET, cursor=request.GET.get(CURSOR_VAR))
+    except ValidationError:
+        context = {"filter": TransactionFilter(request.GET), "transactions": []}
+        return render(request, "farmers/transactions-list.html", context, status=400)
+    next_url = None
+    if page.next_cursor:
+        params = request.GET.copy()
+        params[CURSOR_VAR] = page.next_cursor
+        next_url = f"?{params.urlencode()}"
+    first_url = None
+    if CURSOR_VAR in request.GET:
+        params = request.GET.copy()
+        del params[CURSOR_VAR]
+        first_url = f"?{params.urlencode()}"
+    context = {
+        "filter": page.filter,
+        "transactions": page.transactions,
+        "count": page.count,
+        "estimated": page.estimated,
+        "next_url": next_url,
+        "first_url": first_url,
+    }
+    return render(request, "farmers/transactions-list.html", context)
+
+
+@require_GET
+@permission_required("farmers.view_farmersmarkettransaction", raise_exception=True)
+def market_transaction_api(request):
+    """
+    The market transactions matching TransactionFilter as JSON, a page at a
+    time: pass the returned cursor as `after` for the next page
+    """
+    try:
+        size = int(request.GET.get("limit", listing.PAGE_SIZE))
+    except ValueError:
+        size = 0
+    if not 0 < size <= listing.MAX_PAGE_SIZE:
+        return HttpResponseBadRequest(
+            f"The limit must be from 1 to {listing.MAX_PAGE_SIZE}"
+        )
+    try:
+        page = listing.browse(
+            request.GET, cursor=request.GET.get(CURSOR_VAR), size=size
+        )
+    except ValidationError as error:
+        return HttpResponseBadRequest("; ".join(error.messages))
+    results = [
+        {
+            "id": txn.pk,
+            "farmer": txn.farmer.slug,
+            "farmer_name": f"{txn.farmer.first_name} {txn.farmer.last_name}",
+            "market": txn.market.slug,
+            "produce": txn.produce.slug,
+            "quantity": txn.quantity,
+            "transaction_date": txn.transaction_date,
+            "points_earned": txn.points_earned,
+        }
+        for txn in page.transactions
+    ]
+    return JsonResponse(
+        {
+            "count": page.count,
+            "count_is_estimate": page.estimated,
+            "next": page.next_cursor,
+            "results": results,
+        }
+    )
+
+
+@login_required
+def farmer_search(request):
+    """Look farmers up by phone number, identification number or name"""
+    farmers = search.search(
+        request.GET.get("q", ""),
+        queryset=Farmer.objects.select_related("lga", "state"),
+    )
+    results = [
+        {
+            "slug": farmer.slug,
+            "first_name": farmer.first_name,
+            "last_name": farmer.last_name,
+            "phone_number": str(farmer.phone_number or ""),
+            "identification_number": farmer.identification_number,
+            "lga": farmer.lga.name,
+            "state": farmer.state.name,
+            "is_verified": farmer.is_verified,
+        }
+        for farmer in farmers
+    ]
+    return JsonResponse({"results": results})
+
+
+# Largest batch one request may submit
+MAX_INTAKE_ITEMS = 1000
+
+
+@require_POST
+@permission_required("farmers.add_farmersmarkettransaction", raise_exception=True)
+def transaction_intake(request):
+    """
+    Record one market transaction, a JSON object, or a batch of them, a JSON
+    list, and return a result for each. The request is CSRF checked like a
+    sync push, see `core.views.sync_push`.
+    """
+    try:
+        items = json.loads(request.body)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid JSON")
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list) or len(items) > MAX_INTAKE_ITEMS:
+        return HttpResponseBadRequest(
+            f"Expected an object or a list of up to {MAX_INTAKE_ITEMS} objects"
+        )
+    results = intake.submit(items)
+    return JsonResponse({"results": results})
 
 
 # Farmers onboarding
@@ -0,0 +1,13 @@
+"""
+Gunicorn settings, read from the working directory when gunicorn starts.
+
+Workers serve requests on several threads so that farmers.intake can write
+the transactions submitted at the same time with one statement.
+"""
+
+import os
+
+wsgi_app = "config.wsgi"
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
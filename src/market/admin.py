@@ -3,9 +3,13 @@ from ast import Add
 from django.contrib import admin
 from unfold.admin import ModelAdmin, TabularInline
 
+from core.filters import AutocompleteFilter, AutocompleteFilterMixin
+from core.pagination import KeysetPaginationMixin
 from market.models import (
     Address,
     ContactPerson,
+    FoodBasket,
+    FoodBasketWeight,
     Market,
     MarketDay,
     PaymentMethod,
@@ -17,7 +21,7 @@ from market.models import (
 
 
 @admin.register(Address)
-class AddressAdmin(ModelAdmin):
+class AddressAdmin(AutocompleteFilterMixin, ModelAdmin):
     list_display = (
         "street",
         "town",
@@ -31,7 +35,10 @@ class AddressAdmin(ModelAdmin):
         "state",
     )
     autocomplete_fields = ("local_govt", "state", "country")
-    list_filter = ("state", "local_govt")
+    list_filter = (
+        ("state", AutocompleteFilter),
+        ("local_govt", AutocompleteFilter),
+    )
     list_select_related = ("state", "local_govt", "country")
 
     def custom_region(self, address: Address):
@@ -71,13 +78,9 @@ class IsMarketDayFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value() == "yes":
-            return queryset.filter(
-                id__in=[market.id for market in queryset if market.is_market_day]
-            )
+            return queryset.market_day_on()
         if self.value() == "no":
-            return queryset.filter(
-                id__in=[market.id for market in queryset if not market.is_market_day]
-            )
+            return queryset.market_day_on(is_market_day=False)
 
 
 @admin.register(Market)
@@ -97,6 +100,19 @@ class MarketAdmin(ModelAdmin):
     list_filter = (IsMarketDayFilter,)
     prepopulated_fields = {"slug": ("name",)}
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_market_days()
+
+    @admin.display(description="Next market day", ordering="next_market_date")
+    def next_market_day(self, obj):
+        return obj.next_market_date
+
+    @admin.display(
+        description="Is market day", boolean=True, ordering="market_day_today"
+    )
+    def is_market_day(self, obj):
+        return obj.market_day_today
+
 
 @admin.register(ContactPerson)
 class ContactPersonAdmin(ModelAdmin):
@@ -124,7 +140,7 @@ class MarketDayAdmin(ModelAdmin):
 
 
 @admin.register(ProducePrice)
-class ProductPriceAdmin(ModelAdmin):
+class ProductPriceAdmin(AutocompleteFilterMixin, KeysetPaginationMixin, ModelAdmin):
     list_display = (
         "produce",
         "produce__category",
@@ -135,10 +151,24 @@ class ProductPriceAdmin(ModelAdmin):
         "produce__unit",
     )
     list_select_related = ("produce", "market_day")
-    list_filter = ("market_day", "price_type")
+    list_filter = (("market_day__market", AutocompleteFilter), "price_type")
 
 
 @admin.register(PaymentMethod)
 class PaymentMethodAdmin(ModelAdmin):
     list_display = ("type",)
     list_filter = ("type",)
+
+
+class FoodBasketWeightInline(TabularInline):
+    model = FoodBasketWeight
+    extra = 1
+
+
+@admin.register(FoodBasket)
+class FoodBasketAdmin(ModelAdmin):
+    list_display = ("name", "price_type", "period", "base_start", "base_end")
+    list_filter = ("price_type", "period")
+    prepopulated_fields = {"slug": ("name",)}
+
+    inlines = [FoodBasketWeightInline]
@@ -0,0 +1,191 @@
+"""
+Food basket price indexes per market and per state.
+
+A `FoodBasket` weights produce categories. Its index at a market or in a
+state for a week or month is 100 times the weighted mean of the categories'
+price relatives against the basket's base period. A category's relative is
+the geometric mean, over its produce priced both in the period and in the
+base period, of the produce's mean price in the period over its mean price
+in the base period. Categories without such produce are left out and the
+other weights rescaled.
+
+A basket's whole history is computed in one pass over NumPy arrays of its
+prices, grouping by sorting instead of looping over markets, produce or
+periods. The values are stored per (basket, market or state, period) as
+`FoodBasketIndex` rows, so reads never touch the prices. `compute()`
+recomputes the latest stored period, which may have been partial, and
+appends the periods after it. Changing a basket or its weights deletes its
+stored values, and the next `compute()` rebuilds them in full.
+"""
+
+import numpy as np
+from django.db import models, transaction
+
+from .models import FoodBasketIndex, Produce, ProducePrice
+from .rollups import period_starts
+
+Scope = FoodBasketIndex.Scope
+
+CATEGORIES = sorted(Produce.ProduceCategory.values)
+# The region id column of each scope
+SCOPE_COLUMNS = {
+    Scope.MARKET: "market_day__market_id",
+    Scope.STATE: "market_day__market__address__state_id",
+}
+
+
+def _load(basket, first=None, last=None):
+    """Return the basket's prices on market days from `first` to `last` as columns"""
+    fields = [
+        "produce_id",
+        "produce__category",
+        "market_day__date",
+        *SCOPE_COLUMNS.values(),
+        "price",
+    ]
+    prices = ProducePrice.objects.filter(price_type=basket.price_type)
+    if first is not None:
+        prices = prices.filter(market_day__date__gte=first)
+    if last is not None:
+        prices = prices.filter(market_day__date__lte=last)
+    rows = list(prices.values_list(*fields))
+    if not rows:
+        return None
+    columns = dict(zip(fields, zip(*rows)))
+    days = np.array(columns["market_day__date"], dtype="datetime64[D]")
+    return {
+        "produce": np.array(columns["produce_id"], dtype=np.int64),
+        "category": np.searchsorted(CATEGORIES, columns["produce__category"]),
+        "period": period_starts(days, basket.period).astype(np.int64),
+        # Markets without an address have no state, NaN
+        **{
+            scope: np.array(columns[column], dtype=float)
+            for scope, column in SCOPE_COLUMNS.items()
+        },
+        "price": np.array(columns["price"], dtype=float),
+    }
+
+
+def _groups(keys):
+    """Return the distinct rows of integer key columns, sorted, and the group of each row"""
+    unique, inverse = np.unique(np.stack(keys), axis=1, return_inverse=True)
+    return unique, inverse.ravel()
+
+
+def _mean(keys, values):
+    unique, group = _groups(keys)
+    return unique, np.bincount(group, weights=values) / np.bincount(group)
+
+
+def _values(base, current, scope, weights):
+    """
+    Return the regions, periods, index values and produce counts of a scope
+    from the base period's and the indexed periods' price columns
+    """
+    base_known = ~np.isnan(base[scope])
+    known = ~np.isnan(current[scope])
+    if not base_known.any() or not known.any():
+        return [], [], [], []
+    (base_region, base_produce), base_price = _mean(
+        [base[scope][base_known].astype(np.int64), base["produce"][base_known]],
+        base["price"][base_known],
+    )
+    # A produce's category is the same in every row, so it does not split groups
+    (region, produce, period, category), price = _mean(
+        [
+            current[scope][known].astype(np.int64),
+            current["produce"][known],
+            current["period"][known],
+            current["category"][known],
+        ],
+        current["price"][known],
+    )
+
+    # The base price of each (region, produce, period): the base keys are sorted
+    base_keys = base_region << 32 | base_produce
+    keys = region << 32 | produce
+    position = np.minimum(np.searchsorted(base_keys, keys), len(base_keys) - 1)
+    priced = (
+        (base_keys[position] == keys)
+        & (base_price[position] > 0)
+        & (price > 0)
+        & (weights[category] > 0)
+    )
+    relatives = np.log(price[priced] / base_price[position[priced]])
+    region, period, category = region[priced], period[priced], category[priced]
+    if not len(region):
+        return [], [], [], []
+    # Each row is now a distinct produce of its (region, period)
+    produce_count = np.bincount(_groups([region, period])[1])
+
+    # Category relatives, the geometric mean of their produce's relatives
+    (region, period, category), mean_relative = _mean(
+        [region, period, category], relatives
+    )
+    weight = weights[category]
+    (region, period), group = _groups([region, period])
+    value = (
+        100
+        * np.bincount(group, weights=weight * np.exp(mean_relative))
+        / np.bincount(group, weights=weight)
+    )
+    return region, period, value, produce_count
+
+
+def compute(basket, full=False):
+    """
+    Compute the basket's index from its latest stored period onward, or for
+    every period with `full`. Returns the number of values written.
+    """
+    weights = np.zeros(len(CATEGORIES))
+    for category, weight in basket.weights.values_list("category", "weight"):
+        weights[CATEGORIES.index(category)] = float(weight)
+    first = None
+    if not full:
+        first = FoodBasketIndex.objects.filter(basket=basket).aggregate(
+            last=models.Max("period_start")
+        )["last"]
+
+    base = _load(basket, basket.base_start, basket.base_end)
+    current = _load(basket, first)
+    values = []
+    if base is not None and current is not None:
+        for scope in Scope:
+            values += [
+                FoodBasketIndex(
+                    basket=basket,
+                    scope=scope,
+                    scope_id=int(region),
+                    period_start=np.datetime64(int(period), "D").item(),
+                    value=value,
+                    produce_count=int(count),
+                )
+                for region, period, value, count in zip(
+                    *_values(base, current, scope, weights)
+                )
+            ]
+
+    with transaction.atomic():
+        stale = FoodBasketIndex.objects.filter(basket=basket)
+        if first is not None:
+            stale = stale.filter(period_start__gte=first)
+        stale.delete()
+        FoodBasketIndex.objects.bulk_create(values, batch_size=1000)
+    return len(values)
+
+
+def invalidate(basket_id):
+    """Delete the stored values of a basket whose definition changed"""
+    FoodBasketIndex.objects.filter(basket_id=basket_id).delete()
+
+
+def read(basket, scope, scope_id, first=None, last=None):
+    """Return the (period start, value) of a basket's index at a market or state"""
+    values = FoodBasketIndex.objects.filter(
+        basket=basket, scope=scope, scope_id=scope_id
+    )
+    if first is not None:
+        values = values.filter(period_start__gte=first)
+    if last is not None:
+        values = values.filter(period_start__lte=last)
+    return values.order_by("period_start").values_list("period_start", "value")
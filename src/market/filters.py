@@ -0,0 +1,31 @@
+import django_filters
+from django import forms
+
+from market.models import Produce, ProducePrice
+
+
+class ProducePriceFilter(django_filters.FilterSet):
+    """The filters of farmers.filters.TransactionFilter, over the market day"""
+
+    start_date = django_filters.DateFilter(
+        field_name="market_day__date",
+        lookup_expr="gte",
+        label="Date From",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+
+    end_date = django_filters.DateFilter(
+        field_name="market_day__date",
+        lookup_expr="lte",
+        label="Date To",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+
+    produce = django_filters.ModelChoiceFilter(
+        queryset=Produce.objects.all(),
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+
+    class Meta:
+        model = ProducePrice
+        fields = ("start_date", "end_date", "produce")
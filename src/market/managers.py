@@ -0,0 +1,105 @@
+from datetime import date
+
+from django.db import NotSupportedError, models
+
+# Day number of 1970-01-01 in SQLite's julianday()
+JULIAN_EPOCH = 2440587.5
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(day):
+    """Return the number of days from 1970-01-01 to `day`"""
+    return (day - EPOCH).days
+
+
+class DayNumber(models.Func):
+    """The number of days from 1970-01-01 to a date, as an integer"""
+
+    output_field = models.IntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"DayNumber is not supported on {connection.vendor}")
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template=f"CAST(julianday(%(expressions)s) - {JULIAN_EPOCH} AS INTEGER)",
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template=f"(%(expressions)s - DATE '{EPOCH.isoformat()}')",
+            **extra_context,
+        )
+
+
+class DayNumberDate(models.Func):
+    """The date a number of days after 1970-01-01"""
+
+    output_field = models.DateField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(
+            f"DayNumberDate is not supported on {connection.vendor}"
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template=f"date(%(expressions)s + {JULIAN_EPOCH})",
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            template=f"(DATE '{EPOCH.isoformat()}' + %(expressions)s)",
+            **extra_context,
+        )
+
+
+def _market_day_offset(day):
+    """Days from the last market day before or on `day` to `day`"""
+    frequency = models.F("market_frequency")
+    days = models.Value(day_number(day)) - DayNumber("last_market_day")
+    # % keeps the sign of the days, so a last market day after `day` is
+    # brought back into [0, frequency)
+    return (days % frequency + frequency) % frequency
+
+
+class MarketQuerySet(models.QuerySet):
+    """
+    Market day arithmetic in the database. Markets meet every
+    `market_frequency` days counted from `last_market_day`.
+    """
+
+    def with_market_days(self, today=None):
+        """
+        Annotate whether `today` is a market day (`market_day_today`), the
+        days until the next market day after it (`days_to_next_market_day`)
+        and its date (`next_market_date`)
+        """
+        today = today or date.today()
+        days_to_next = models.F("market_frequency") - models.F("market_day_offset")
+        return self.alias(market_day_offset=_market_day_offset(today)).annotate(
+            market_day_today=models.ExpressionWrapper(
+                models.Q(market_day_offset=0), output_field=models.BooleanField()
+            ),
+            days_to_next_market_day=days_to_next,
+            next_market_date=DayNumberDate(
+                models.Value(day_number(today)) + days_to_next
+            ),
+        )
+
+    def market_day_on(self, day=None, is_market_day=True):
+        """Restrict to the markets meeting on `day`, or the others"""
+        queryset = self.alias(market_day_offset=_market_day_offset(day or date.today()))
+        if is_market_day:
+            return queryset.filter(market_day_offset=0)
+        return queryset.exclude(market_day_offset=0)
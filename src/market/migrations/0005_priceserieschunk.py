@@ -0,0 +1,64 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("market", "0004_marketschedule"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceSeriesChunk",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "price_type",
+                    models.CharField(
+                        choices=[("W", "Wholesale"), ("R", "Retail")], max_length=1
+                    ),
+                ),
+                ("start", models.DateField()),
+                ("end", models.DateField()),
+                ("count", models.PositiveIntegerField()),
+                ("dates", models.BinaryField()),
+                ("prices", models.BinaryField()),
+                (
+                    "market",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.market",
+                    ),
+                ),
+                (
+                    "produce",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.produce",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("produce", "price_type", "market", "start"),
+                        name="unique_price_series_chunk",
+                    )
+                ],
+            },
+        ),
+    ]
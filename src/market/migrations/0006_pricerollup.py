@@ -0,0 +1,90 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("market", "0005_priceserieschunk"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "price_type",
+                    models.CharField(
+                        choices=[("W", "Wholesale"), ("R", "Retail")], max_length=1
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[("LGA", "Local Government Area"), ("STATE", "State")],
+                        max_length=5,
+                    ),
+                ),
+                ("scope_id", models.PositiveBigIntegerField()),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("W", "Week"), ("M", "Month")], max_length=1
+                    ),
+                ),
+                ("period_start", models.DateField()),
+                ("price_count", models.PositiveIntegerField()),
+                ("market_count", models.PositiveIntegerField()),
+                ("minimum", models.FloatField()),
+                ("maximum", models.FloatField()),
+                ("mean", models.FloatField()),
+                ("median", models.FloatField()),
+                ("dispersion", models.FloatField()),
+                (
+                    "produce",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.produce",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["scope", "scope_id", "period", "period_start"],
+                        name="price_rollup_region_idx",
+                    ),
+                    models.Index(
+                        fields=["period", "period_start"],
+                        name="price_rollup_period_idx",
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "produce",
+                            "price_type",
+                            "period",
+                            "scope",
+                            "scope_id",
+                            "period_start",
+                        ),
+                        name="unique_price_rollup",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,144 @@
+# Generated by Django 5.1.1 on 2026-10-18 16:19
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("market", "0006_pricerollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FoodBasket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("slug", models.SlugField(unique=True)),
+                (
+                    "price_type",
+                    models.CharField(
+                        choices=[("W", "Wholesale"), ("R", "Retail")],
+                        default="R",
+                        max_length=1,
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("W", "Week"), ("M", "Month")],
+                        default="M",
+                        max_length=1,
+                    ),
+                ),
+                ("base_start", models.DateField()),
+                ("base_end", models.DateField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="FoodBasketIndex",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "scope",
+                    models.CharField(
+                        choices=[("MKT", "Market"), ("STATE", "State")], max_length=5
+                    ),
+                ),
+                ("scope_id", models.PositiveBigIntegerField()),
+                ("period_start", models.DateField()),
+                ("value", models.FloatField()),
+                ("produce_count", models.PositiveIntegerField()),
+                (
+                    "basket",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="market.foodbasket",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "food basket indexes",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("basket", "scope", "scope_id", "period_start"),
+                        name="unique_food_basket_index",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="FoodBasketWeight",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("PN", "Pulse and Nuts"),
+                            ("CT", "Cereals and Tubers"),
+                            ("OF", "Oil and Fats"),
+                            ("MFE", "Meat, Fish and Eggs"),
+                            ("MD", "Milk and Dairy"),
+                            ("VF", "Vegetable and Fruits"),
+                            ("NF", "Non Food"),
+                            ("MS", "Miscellaneous Food"),
+                        ],
+                        max_length=3,
+                    ),
+                ),
+                (
+                    "weight",
+                    models.DecimalField(
+                        decimal_places=4,
+                        max_digits=7,
+                        validators=[django.core.validators.MinValueValidator(0)],
+                    ),
+                ),
+                (
+                    "basket",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="weights",
+                        to="market.foodbasket",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("basket", "category"), name="unique_food_basket_weight"
+                    )
+                ],
+            },
+        ),
+    ]
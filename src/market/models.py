@@ -11,6 +11,8 @@ from django.utils.functional import cached_property
 from django.utils.text import slugify
 from phonenumber_field.modelfields import PhoneNumberField
 
+from .managers import MarketQuerySet
+
 
 class PaymentMethod(models.Model):
     class PaymentMethodChoice(models.TextChoices):
@@ -140,6 +142,7 @@ class Market(models.Model):
     payment_methods = models.ManyToManyField(PaymentMethod)
     produce_items = models.ManyToManyField(Produce)
     slug = models.SlugField(unique=True)  # slug
+    objects = MarketQuerySet.as_manager()
 
     class Meta:
         constraints = [
@@ -206,6 +209,26 @@ class MarketDay(models.Model):
         return f"{self.date}"
 
 
+class MarketSchedule(models.Model):
+    """A day a market meets, kept for the days ahead by market.schedule"""
+
+    market = models.ForeignKey(
+        Market, on_delete=models.CASCADE, related_name="schedule"
+    )
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            # Also the index that answers date range queries on its own
+            models.UniqueConstraint(
+                fields=["date", "market"], name="unique_market_schedule_day"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.market_id} {self.date}"
+
+
 class ProducePrice(models.Model):
 
     class PriceType(models.TextChoices):
@@ -243,6 +266,178 @@ class ProducePrice(models.Model):
         return "Deleted Market"
 
 
+class PriceSeriesChunk(models.Model):
+    """Consecutive prices of a produce at a market, packed by market.timeseries"""
+
+    # Served by the unique constraint's index
+    produce = models.ForeignKey(
+        Produce, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, related_name="+")
+    price_type = models.CharField(max_length=1, choices=ProducePrice.PriceType.choices)
+    start = models.DateField()
+    end = models.DateField()
+    count = models.PositiveIntegerField()
+    # Days since 1970-01-01 as little-endian int32, and float64 prices
+    dates = models.BinaryField()
+    prices = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["produce", "price_type", "market", "start"],
+                name="unique_price_series_chunk",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.produce_id} {self.market_id} {self.price_type} {self.start}"
+
+
+class PriceRollup(models.Model):
+    """Price statistics of a produce across a state's or LGA's markets in a period"""
+
+    class Scope(models.TextChoices):
+        LGA = "LGA", "Local Government Area"
+        STATE = "STATE", "State"
+
+    class Period(models.TextChoices):
+        WEEK = "W", "Week"
+        MONTH = "M", "Month"
+
+    # Served by the unique constraint's index
+    produce = models.ForeignKey(
+        Produce, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    price_type = models.CharField(max_length=1, choices=ProducePrice.PriceType.choices)
+    scope = models.CharField(max_length=5, choices=Scope.choices)
+    # The id of the SubRegion or Region the statistics cover
+    scope_id = models.PositiveBigIntegerField()
+    period = models.CharField(max_length=1, choices=Period.choices)
+    # The Monday of the week or the first day of the month
+    period_start = models.DateField()
+    price_count = models.PositiveIntegerField()
+    market_count = models.PositiveIntegerField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+    mean = models.FloatField()
+    median = models.FloatField()
+    # Coefficient of variation, the standard deviation over the mean
+    dispersion = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "produce",
+                    "price_type",
+                    "period",
+                    "scope",
+                    "scope_id",
+                    "period_start",
+                ],
+                name="unique_price_rollup",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["scope", "scope_id", "period", "period_start"],
+                name="price_rollup_region_idx",
+            ),
+            models.Index(
+                fields=["period", "period_start"], name="price_rollup_period_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.produce_id}-{self.price_type} {self.scope}-{self.scope_id} "
+            f"{self.period}{self.period_start}"
+        )
+
+
+class FoodBasket(models.Model):
+    """A weighting of produce categories whose price index market.baskets computes"""
+
+    name = models.CharField(max_length=100, unique=True)
+    slug = models.SlugField(unique=True)
+    price_type = models.CharField(
+        max_length=1,
+        choices=ProducePrice.PriceType.choices,
+        default=ProducePrice.PriceType.RETAIL,
+    )
+    period = models.CharField(
+        max_length=1,
+        choices=PriceRollup.Period.choices,
+        default=PriceRollup.Period.MONTH,
+    )
+    # The index is 100 over the prices of the base period
+    base_start = models.DateField()
+    base_end = models.DateField()
+
+    def clean(self):
+        super().clean()
+        if self.base_start and self.base_end and self.base_end < self.base_start:
+            raise ValidationError("The base period cannot end before it starts.")
+
+    def __str__(self):
+        return self.name
+
+
+class FoodBasketWeight(models.Model):
+    """The weight of a produce category in a food basket"""
+
+    basket = models.ForeignKey(
+        FoodBasket, on_delete=models.CASCADE, related_name="weights"
+    )
+    category = models.CharField(max_length=3, choices=Produce.ProduceCategory.choices)
+    weight = models.DecimalField(
+        max_digits=7, decimal_places=4, validators=[MinValueValidator(0)]
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["basket", "category"], name="unique_food_basket_weight"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.basket_id}-{self.category}: {self.weight}"
+
+
+class FoodBasketIndex(models.Model):
+    """The value of a food basket's price index at a market or in a state"""
+
+    class Scope(models.TextChoices):
+        MARKET = "MKT", "Market"
+        STATE = "STATE", "State"
+
+    basket = models.ForeignKey(
+        FoodBasket, on_delete=models.CASCADE, related_name="+", db_index=False
+    )
+    scope = models.CharField(max_length=5, choices=Scope.choices)
+    # The id of the Market or Region the index is computed for
+    scope_id = models.PositiveBigIntegerField()
+    # The Monday of the week or the first day of the month
+    period_start = models.DateField()
+    value = models.FloatField()
+    # The number of produce priced in both the period and the base period
+    produce_count = models.PositiveIntegerField()
+
+    class Meta:
+        verbose_name_plural = "food basket indexes"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["basket", "scope", "scope_id", "period_start"],
+                name="unique_food_basket_index",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.basket_id} {self.scope}-{self.scope_id} {self.period_start}"
+
+
 class Address(models.Model):
     street = models.CharField(max_length=255, null=True, blank=True)
     town = models.CharField(max_length=255, blank=True, null=True)
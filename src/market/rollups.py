@@ -0,0 +1,203 @@
+"""
+Weekly and monthly produce price statistics per state and LGA.
+
+`PriceRollup` holds, for every produce, price type, week or month and state
+or LGA, the minimum, maximum, mean and median price recorded at the area's
+markets and their dispersion, the coefficient of variation. Wholesale and
+retail prices are rolled up separately.
+
+Prices are read a window of periods at a time into NumPy arrays, and the
+statistics of every group in the window are computed together from one sort,
+without a Python loop over groups or prices. A `ProcessingCheckpoint`
+records the last market day date processed: `refresh()` recomputes the
+periods from the ones containing it onward. Prices recorded for earlier
+periods are rolled up by `rebuild()` from a start date.
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+from django.db import models, transaction
+
+from core.models import ProcessingCheckpoint
+
+from .models import MarketDay, PriceRollup, ProducePrice
+
+CHECKPOINT = "price_rollups"
+Period = PriceRollup.Period
+Scope = PriceRollup.Scope
+
+# Periods computed per batch
+WINDOW = {Period.WEEK: 13, Period.MONTH: 3}
+# The region id column of each scope
+SCOPE_COLUMNS = {
+    Scope.STATE: "market_day__market__address__state_id",
+    Scope.LGA: "market_day__market__address__local_govt_id",
+}
+
+
+def period_starts(days, period):
+    """Return the start of the period of each datetime64[D] day"""
+    if period == Period.WEEK:
+        # 1970-01-01 was a Thursday
+        return days - (days.astype(int) + 3) % 7
+    return days.astype("datetime64[M]").astype("datetime64[D]")
+
+
+def period_start(day, period):
+    """Return the first day of the week or month containing `day`"""
+    return period_starts(np.array([day], dtype="datetime64[D]"), period)[0].item()
+
+
+def _advance(start, period, count):
+    """Return the start of the period `count` periods after `start`"""
+    if period == Period.WEEK:
+        return start + timedelta(weeks=count)
+    month = start.month - 1 + count
+    return date(start.year + month // 12, month % 12 + 1, 1)
+
+
+def _load(first, end):
+    """Return the prices of market days in [first, end) at markets with an address"""
+    fields = [
+        "produce_id",
+        "price_type",
+        "market_day__date",
+        "market_day__market_id",
+        *SCOPE_COLUMNS.values(),
+        "price",
+    ]
+    rows = list(
+        ProducePrice.objects.filter(
+            market_day__date__gte=first,
+            market_day__date__lt=end,
+            market_day__market__address__isnull=False,
+        ).values_list(*fields)
+    )
+    if not rows:
+        return None
+    columns = dict(zip(fields, zip(*rows)))
+    return {
+        "produce": np.array(columns["produce_id"]),
+        "price_type": np.array(columns["price_type"]),
+        "day": np.array(columns["market_day__date"], dtype="datetime64[D]"),
+        "market": np.array(columns["market_day__market_id"]),
+        **{scope: np.array(columns[column]) for scope, column in SCOPE_COLUMNS.items()},
+        "price": np.array(columns["price"], dtype=float),
+    }
+
+
+def statistics(keys, values, markets):
+    """
+    Return the keys and statistics of every group of values with the same
+    keys, and the number of distinct markets in each
+    """
+    order = np.lexsort((values, *reversed(keys)))
+    keys = [key[order] for key in keys]
+    values = values[order]
+    changed = np.zeros(len(values), dtype=bool)
+    changed[0] = True
+    for key in keys:
+        changed[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(changed)
+    counts = np.diff(np.append(starts, len(values)))
+    group = np.repeat(np.arange(len(starts)), counts)
+
+    mean = np.add.reduceat(values, starts) / counts
+    variance = np.add.reduceat((values - mean[group]) ** 2, starts) / counts
+    # Markets of each group, counted once each
+    pairs = np.unique(np.stack([group, markets[order]]), axis=1)
+    return {
+        "keys": [key[starts] for key in keys],
+        "price_count": counts,
+        "market_count": np.bincount(pairs[0], minlength=len(starts)),
+        # Values are sorted within each group
+        "minimum": values[starts],
+        "maximum": values[starts + counts - 1],
+        "mean": mean,
+        "median": (values[starts + (counts - 1) // 2] + values[starts + counts // 2])
+        / 2,
+        "dispersion": np.divide(
+            np.sqrt(variance), mean, out=np.zeros(len(starts)), where=mean > 0
+        ),
+    }
+
+
+def _write(period, first, end):
+    """Recompute the rollups of the periods starting in [first, end)"""
+    columns = _load(first, end)
+    rollups = []
+    if columns is not None:
+        starts = period_starts(columns["day"], period).astype(np.int64)
+        for scope in Scope:
+            keys = [columns["produce"], columns["price_type"], columns[scope], starts]
+            stats = statistics(keys, columns["price"], columns["market"])
+            produce, price_type, region, start = stats["keys"]
+            for i in range(len(start)):
+                rollups.append(
+                    PriceRollup(
+                        produce_id=int(produce[i]),
+                        price_type=str(price_type[i]),
+                        scope=scope,
+                        scope_id=int(region[i]),
+                        period=period,
+                        period_start=np.datetime64(int(start[i]), "D").item(),
+                        price_count=int(stats["price_count"][i]),
+                        market_count=int(stats["market_count"][i]),
+                        minimum=stats["minimum"][i],
+                        maximum=stats["maximum"][i],
+                        mean=stats["mean"][i],
+                        median=stats["median"][i],
+                        dispersion=stats["dispersion"][i],
+                    )
+                )
+    with transaction.atomic():
+        PriceRollup.objects.filter(
+            period=period, period_start__gte=first, period_start__lt=end
+        ).delete()
+        PriceRollup.objects.bulk_create(rollups, batch_size=1000)
+    return len(rollups)
+
+
+def last_processed():
+    """Return the last market day date rolled up, or None"""
+    return (
+        ProcessingCheckpoint.objects.filter(name=CHECKPOINT)
+        .values_list("position", flat=True)
+        .first()
+    )
+
+
+def rebuild(start=None):
+    """
+    Recompute the rollups of the periods from the ones containing `start`,
+    or of every period. Returns the number of rollups written.
+    """
+    dates = MarketDay.objects.aggregate(
+        first=models.Min("date"), last=models.Max("date")
+    )
+    if dates["last"] is None:
+        return 0
+    start = max(start or dates["first"], dates["first"])
+
+    written = 0
+    for period in Period:
+        first = period_start(start, period)
+        if start == dates["first"]:
+            # Periods before the first market day have no prices left
+            PriceRollup.objects.filter(period=period, period_start__lt=first).delete()
+        while first <= dates["last"]:
+            end = _advance(first, period, WINDOW[period])
+            written += _write(period, first, end)
+            first = end
+        # Nor have periods after the last one
+        PriceRollup.objects.filter(period=period, period_start__gte=first).delete()
+    ProcessingCheckpoint.objects.update_or_create(
+        name=CHECKPOINT, defaults={"position": dates["last"]}
+    )
+    return written
+
+
+def refresh():
+    """Recompute the periods from the last market day date rolled up onward"""
+    return rebuild(last_processed() or date.min)
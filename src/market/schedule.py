@@ -0,0 +1,104 @@
+"""
+The days each active market meets over the next `HORIZON_DAYS` days.
+
+`MarketSchedule` holds a (date, market) row per meeting, so "which markets
+meet between two dates" is a range scan of its unique (date, market) index.
+A `ProcessingCheckpoint` records the day the schedule is built up to.
+
+`extend()`, run daily by the refresh_market_schedule command, drops the days
+that have passed and adds the days that have come within the horizon. A
+market whose last market day, frequency or active flag changes has its
+upcoming days rebuilt by `regenerate()`, from the market's save signal.
+"""
+
+from datetime import date, timedelta
+
+from django.db import transaction
+
+from core.models import ProcessingCheckpoint
+
+from .models import Market, MarketSchedule
+
+CHECKPOINT = "market_schedule"
+HORIZON_DAYS = 90
+# The market fields the days a market meets follow from
+FIELDS = ("last_market_day", "market_frequency", "is_active")
+
+
+def market_days(last_market_day, frequency, start, end):
+    """Return the days in [start, end) of a market meeting every `frequency` days"""
+    first = start + timedelta(days=(last_market_day - start).days % frequency)
+    return [
+        first + timedelta(days=offset)
+        for offset in range(0, (end - first).days, frequency)
+    ]
+
+
+def built_until():
+    """Return the day the schedule is built up to, exclusive, or None"""
+    return (
+        ProcessingCheckpoint.objects.filter(name=CHECKPOINT)
+        .values_list("position", flat=True)
+        .first()
+    )
+
+
+def _create(markets, start, end):
+    rows = [
+        MarketSchedule(market_id=market.pk, date=day)
+        for market in markets
+        if market.is_active
+        for day in market_days(
+            market.last_market_day, market.market_frequency, start, end
+        )
+    ]
+    return len(
+        MarketSchedule.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    )
+
+
+def regenerate(markets, today=None):
+    """Rebuild the upcoming days of markets whose meeting days changed"""
+    today = today or date.today()
+    end = built_until()
+    if end is None or end <= today:
+        end = today + timedelta(days=HORIZON_DAYS)
+    with transaction.atomic():
+        MarketSchedule.objects.filter(
+            market__in=[market.pk for market in markets], date__gte=today
+        ).delete()
+        _create(markets, today, end)
+
+
+def extend(today=None, rebuild=False):
+    """
+    Drop the days before `today` and add the days up to the horizon not in the
+    schedule yet, or every day with `rebuild`. Returns the number of rows
+    deleted and added.
+    """
+    today = today or date.today()
+    end = today + timedelta(days=HORIZON_DAYS)
+    start = today if rebuild else max(built_until() or today, today)
+    markets = Market.objects.filter(is_active=True).only("pk", *FIELDS)
+    with transaction.atomic():
+        stale = MarketSchedule.objects.all()
+        if not rebuild:
+            stale = stale.filter(date__lt=today)
+        deleted, _ = stale.delete()
+        added = _create(markets.iterator(), start, end)
+        ProcessingCheckpoint.objects.update_or_create(
+            name=CHECKPOINT, defaults={"position": end}
+        )
+    return deleted, added
+
+
+def between(first, last):
+    """
+    Return the (date, market id) of every meeting from `first` to `last`, by
+    date. Days outside the schedule's horizon have no rows.
+    """
+    return (
+        MarketSchedule.objects.filter(date__range=(first, last))
+        .order_by("date", "market")
+        .values_list("date", "market_id")
+    )
@@ -0,0 +1 @@
+from . import handlers  # noqa: F401
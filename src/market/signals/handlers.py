@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from market.models import ProducePrice
+from market import baskets, schedule, timeseries
+from market.models import (
+    FoodBasket,
+    FoodBasketWeight,
+    Market,
+    MarketDay,
+    ProducePrice,
+)
 
 
 @receiver(post_save, sender=ProducePrice)
@@ -12,8 +19,90 @@ def update_last_market_day(sender, instance, created, **kwargs):
 
         if market_day.date > market.last_market_day:
             market.last_market_day = market_day.date
-            market.save()
+            market.save(update_fields=["last_market_day", "last_update"])
 
             # Invalidate the cached_property for the market
-            if hasattr(market, "_next_market_day_cache"):
-                del market._next_market_day_cache
+            market.__dict__.pop("next_market_day", None)
+
+
+@receiver(pre_save, sender=Market)
+def remember_schedule_state(sender, instance, **kwargs):
+    instance._schedule_previous = (
+        None
+        if instance._state.adding
+        else Market.objects.filter(pk=instance.pk).values_list(*schedule.FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=Market)
+def update_market_schedule(sender, instance, **kwargs):
+    current = tuple(getattr(instance, field) for field in schedule.FIELDS)
+    if current != instance._schedule_previous:
+        schedule.regenerate([instance])
+    instance._schedule_previous = current
+
+
+@receiver(pre_save, sender=ProducePrice)
+def remember_series_point(sender, instance, **kwargs):
+    instance._series_previous = (
+        None if instance._state.adding else timeseries.point_of(instance)
+    )
+
+
+@receiver(post_save, sender=ProducePrice)
+def update_price_series(sender, instance, **kwargs):
+    point = timeseries.point_of(instance)
+    if instance._series_previous not in (None, point):
+        timeseries.remove(instance._series_previous)
+    timeseries.add(point, instance.price)
+    instance._series_previous = point
+
+
+@receiver(pre_delete, sender=ProducePrice)
+def remember_deleted_series_point(sender, instance, **kwargs):
+    instance._series_previous = timeseries.point_of(instance)
+
+
+@receiver(post_delete, sender=ProducePrice)
+def remove_from_price_series(sender, instance, **kwargs):
+    if instance._series_previous is not None:
+        timeseries.remove(instance._series_previous)
+
+
+@receiver(pre_save, sender=MarketDay)
+def remember_market_day_state(sender, instance, **kwargs):
+    instance._series_previous = (
+        None
+        if instance._state.adding
+        else MarketDay.objects.filter(pk=instance.pk)
+        .values_list("market_id", "date")
+        .first()
+    )
+
+
+@receiver(post_save, sender=MarketDay)
+def move_market_day_prices(sender, instance, **kwargs):
+    previous = instance._series_previous
+    if previous is not None and previous != (instance.market_id, instance.date):
+        # The market day's prices belong to other series, or other dates
+        for price in instance.produce_price.all():
+            timeseries.remove(
+                timeseries.Point(
+                    timeseries.Key(price.produce_id, previous[0], price.price_type),
+                    previous[1],
+                )
+            )
+            timeseries.add(timeseries.point_of(price), price.price)
+    instance._series_previous = (instance.market_id, instance.date)
+
+
+@receiver(post_save, sender=FoodBasket)
+def invalidate_food_basket_index(sender, instance, created, **kwargs):
+    if not created:
+        baskets.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=FoodBasketWeight)
+@receiver(post_delete, sender=FoodBasketWeight)
+def invalidate_food_basket_weights(sender, instance, **kwargs):
+    baskets.invalidate(instance.basket_id)
@@ -1,3 +1,298 @@
+from datetime import date, timedelta
+from unittest import mock
+
 from django.test import TestCase
 
-# Create your tests here.
+from core.testing import create_market
+from market import baskets, rollups, schedule, timeseries
+from market.models import (
+    FoodBasket,
+    FoodBasketIndex,
+    Market,
+    MarketDay,
+    PriceRollup,
+    PriceSeriesChunk,
+    Produce,
+    ProducePrice,
+)
+
+
+@mock.patch.object(timeseries, "CHUNK_SIZE", 4)
+class PriceSeriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize")
+        cls.key = timeseries.Key(
+            cls.produce.pk, cls.market.pk, ProducePrice.PriceType.WHOLESALE
+        )
+
+    def add(self, *days, price=100):
+        for day in days:
+            timeseries.add(
+                timeseries.Point(self.key, date(2024, 1, 1) + timedelta(days=day)),
+                price + day,
+            )
+
+    def remove(self, day):
+        timeseries.remove(
+            timeseries.Point(self.key, date(2024, 1, 1) + timedelta(days=day))
+        )
+
+    def assertChunks(self, *chunks):
+        self.assertQuerySetEqual(
+            PriceSeriesChunk.objects.order_by("start").values_list("count", flat=True),
+            [len(days) for days in chunks],
+        )
+        days, prices = timeseries.read(self.produce.pk, self.key.price_type)[
+            self.market.pk
+        ]
+        expected = [day for chunk in chunks for day in chunk]
+        self.assertEqual(
+            list((days - days[0]).astype(int)), [day - expected[0] for day in expected]
+        )
+        self.assertEqual(list(prices), [100.0 + day for day in expected])
+
+    def test_append_past_a_full_chunk_starts_a_new_one(self):
+        self.add(0, 1, 2, 3, 4)
+        self.assertChunks([0, 1, 2, 3], [4])
+
+    def test_insert_into_a_full_chunk_splits_it(self):
+        self.add(0, 2, 4, 6, 1)
+        self.assertChunks([0, 1], [2, 4, 6])
+        # A date before the series goes into its first chunk
+        self.add(10, 12, -1)
+        self.assertChunks([-1, 0, 1], [2, 4, 6, 10], [12])
+
+    def test_same_date_replaces_the_price(self):
+        self.add(0, 1)
+        self.add(1, price=249)
+        self.assertQuerySetEqual(
+            PriceSeriesChunk.objects.values_list("count", flat=True), [2]
+        )
+        self.assertEqual(
+            list(
+                timeseries.read(self.produce.pk, self.key.price_type)[self.market.pk][1]
+            ),
+            [100.0, 250.0],
+        )
+
+    def test_remove(self):
+        self.add(0, 1, 2, 3, 4)
+        self.remove(2)
+        self.remove(7)
+        self.assertChunks([0, 1, 3], [4])
+        self.remove(4)
+        self.assertChunks([0, 1, 3])
+
+
+class FoodBasketTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.market = create_market()
+        cls.produce = Produce.objects.create(name="Maize")
+        cls.basket = FoodBasket.objects.create(
+            name="Staples",
+            slug="staples",
+            period=FoodBasket._meta.get_field("period").default,
+            base_start=date(2024, 1, 1),
+            base_end=date(2024, 1, 31),
+        )
+        cls.basket.weights.create(category=cls.produce.category, weight=1)
+
+    def price(self, day, price):
+        market_day, _ = MarketDay.objects.get_or_create(market=self.market, date=day)
+        ProducePrice.objects.create(
+            produce=self.produce,
+            market_day=market_day,
+            price_type=self.basket.price_type,
+            price=price,
+        )
+
+    def read(self, scope=FoodBasketIndex.Scope.MARKET, scope_id=None):
+        return [
+            (period, round(value, 6))
+            for period, value in baskets.read(
+                self.basket, scope, scope_id or self.market.pk
+            )
+        ]
+
+    def test_full_and_incremental_compute(self):
+        self.price(date(2024, 1, 8), 100)
+        self.price(date(2024, 2, 5), 120)
+        # Two months, at the market and in its state
+        self.assertEqual(baskets.compute(self.basket, full=True), 4)
+        self.assertEqual(
+            self.read(), [(date(2024, 1, 1), 100.0), (date(2024, 2, 1), 120.0)]
+        )
+        self.assertEqual(
+            self.read(FoodBasketIndex.Scope.STATE, self.market.address.state_id),
+            self.read(),
+        )
+
+        # The latest stored month is recomputed and later ones appended,
+        # earlier months are kept as stored
+        FoodBasketIndex.objects.filter(period_start=date(2024, 1, 1)).update(value=1)
+        self.price(date(2024, 2, 19), 140)
+        self.price(date(2024, 3, 4), 90)
+        self.assertEqual(baskets.compute(self.basket), 4)
+        self.assertEqual(
+            self.read(),
+            [
+                (date(2024, 1, 1), 1.0),
+                (date(2024, 2, 1), 130.0),
+                (date(2024, 3, 1), 90.0),
+            ],
+        )
+
+        self.assertEqual(baskets.compute(self.basket, full=True), 6)
+        self.assertEqual(self.read()[0], (date(2024, 1, 1), 100.0))
+
+    def test_changed_weights_clear_the_stored_index(self):
+        self.price(date(2024, 1, 8), 100)
+        baskets.compute(self.basket)
+        self.assertTrue(FoodBasketIndex.objects.exists())
+        self.basket.weights.update_or_create(
+            category=self.produce.category, defaults={"weight": 2}
+        )
+        self.assertFalse(FoodBasketIndex.objects.exists())
+
+
+class MarketDaysTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i, (frequency, last_market_day) in enumerate(
+            [(1, date(2024, 1, 1)), (4, date(2024, 2, 27)), (7, date(2024, 3, 10))]
+        ):
+            create_market(
+                f"Market {i}",
+                f"+23480312345{i:02}",
+                market_frequency=frequency,
+                last_market_day=last_market_day,
+            )
+
+    def test_database_market_days_match_the_model(self):
+        markets = Market.objects.all()
+        for day in (date(2024, 2, 20) + timedelta(days=n) for n in range(30)):
+            with self.subTest(day=day):
+                offsets = {
+                    market.pk: (day - market.last_market_day).days
+                    % market.market_frequency
+                    for market in markets
+                }
+                self.assertEqual(
+                    set(markets.market_day_on(day).values_list("pk", flat=True)),
+                    {pk for pk, offset in offsets.items() if offset == 0},
+                )
+                for market in markets.with_market_days(day):
+                    self.assertEqual(market.market_day_today, not offsets[market.pk])
+                    self.assertEqual(
+                        market.next_market_date,
+                        day
+                        + timedelta(days=market.market_frequency - offsets[market.pk]),
+                    )
+        self.assertEqual(
+            set(markets.market_day_on().values_list("pk", flat=True)),
+            {market.pk for market in markets if market.is_market_day},
+        )
+
+
+class MarketScheduleTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = date.today()
+        cls.market = create_market(last_market_day=cls.today, market_frequency=4)
+
+    def days(self, first=None, last=None):
+        first = first or self.today
+        last = last or first + timedelta(days=schedule.HORIZON_DAYS - 1)
+        return [
+            (day - self.today).days
+            for day, market_id in schedule.between(first, last)
+            if market_id == self.market.pk
+        ]
+
+    def test_schedule_follows_the_market(self):
+        self.assertEqual(self.days(), list(range(0, schedule.HORIZON_DAYS, 4)))
+
+        self.market.market_frequency = 7
+        self.market.save()
+        self.assertEqual(self.days(), list(range(0, schedule.HORIZON_DAYS, 7)))
+
+        self.market.is_active = False
+        self.market.save()
+        self.assertEqual(self.days(), [])
+
+    def test_extend_moves_the_horizon(self):
+        schedule.extend(self.today)
+        later = self.today + timedelta(days=10)
+        schedule.extend(later)
+        self.assertEqual(
+            schedule.built_until(), later + timedelta(days=schedule.HORIZON_DAYS)
+        )
+        self.assertEqual(self.days(self.today, later - timedelta(days=1)), [])
+        self.assertEqual(
+            self.days(later), list(range(12, 10 + schedule.HORIZON_DAYS, 4))
+        )
+
+
+class PriceRollupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.markets = [create_market(), create_market("Yankaba", "+2348031234568")]
+        cls.produce = Produce.objects.create(name="Maize")
+
+    def price(self, market, day, price):
+        market_day, _ = MarketDay.objects.get_or_create(market=market, date=day)
+        ProducePrice.objects.create(
+            produce=self.produce,
+            market_day=market_day,
+            price_type=ProducePrice.PriceType.WHOLESALE,
+            price=price,
+        )
+
+    def rollup(self, period, period_start):
+        return PriceRollup.objects.values_list(
+            "price_count",
+            "market_count",
+            "minimum",
+            "maximum",
+            "mean",
+            "median",
+            "dispersion",
+        ).get(
+            scope=PriceRollup.Scope.LGA,
+            period=period,
+            period_start=period_start,
+        )
+
+    def test_statistics_per_week_and_month(self):
+        self.price(self.markets[0], date(2024, 5, 6), 100)
+        self.price(self.markets[0], date(2024, 5, 8), 120)
+        self.price(self.markets[1], date(2024, 5, 7), 200)
+        self.price(self.markets[0], date(2024, 6, 3), 50)
+        # Two weeks and two months, at the state and LGA
+        self.assertEqual(rollups.rebuild(), 8)
+
+        count, markets, minimum, maximum, mean, median, dispersion = self.rollup(
+            PriceRollup.Period.WEEK, date(2024, 5, 6)
+        )
+        self.assertEqual((count, markets, minimum, maximum), (3, 2, 100, 200))
+        self.assertEqual((mean, median), (140, 120))
+        self.assertAlmostEqual(dispersion, (5600 / 3) ** 0.5 / 140)
+        self.assertEqual(
+            self.rollup(PriceRollup.Period.MONTH, date(2024, 5, 1)),
+            (count, markets, minimum, maximum, mean, median, dispersion),
+        )
+        self.assertEqual(
+            self.rollup(PriceRollup.Period.MONTH, date(2024, 6, 1)),
+            (1, 1, 50, 50, 50, 50, 0),
+        )
+
+        # Later prices are picked up from the last market day processed
+        self.price(self.markets[1], date(2024, 6, 5), 70)
+        rollups.refresh()
+        self.assertEqual(
+            self.rollup(PriceRollup.Period.WEEK, date(2024, 6, 3)),
+            (2, 2, 50, 70, 60, 60, 1 / 6),
+        )
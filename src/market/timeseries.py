@@ -0,0 +1,210 @@
+"""
+Produce price histories kept as packed arrays.
+
+Reading a price history from `ProducePrice` joins `MarketDay` and gets slower
+as the tables grow. `PriceSeriesChunk` keeps every (produce, market, price
+type) series instead as chunks of up to `CHUNK_SIZE` prices sorted by date,
+each a BLOB of int32 day numbers and a BLOB of float64 prices. A range read
+fetches the few chunks overlapping the range through the unique (produce,
+price_type, market, start) index and slices them by binary search, so its
+cost follows the length of the range rather than the size of the tables.
+
+The ProducePrice and MarketDay signals keep the chunks up to date a price at
+a time, which for a new price is usually an append to the series' last chunk.
+`rebuild()` writes whole series from the tables, for history.
+"""
+
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+
+from .managers import EPOCH, day_number
+from .models import PriceSeriesChunk, ProducePrice
+
+CHUNK_SIZE = 512
+
+Key = namedtuple("Key", ["produce_id", "market_id", "price_type"])
+Point = namedtuple("Point", ["key", "date"])
+
+
+def point_of(price):
+    """Return the series and date of a saved ProducePrice, or None"""
+    row = (
+        ProducePrice.objects.filter(pk=price.pk)
+        .values_list(
+            "produce_id", "market_day__market_id", "price_type", "market_day__date"
+        )
+        .first()
+    )
+    return row and Point(Key(*row[:3]), row[3])
+
+
+def _unpack(chunk):
+    """Return writable copies of a chunk's day numbers and prices"""
+    return (
+        np.frombuffer(chunk.dates, dtype="<i4").copy(),
+        np.frombuffer(chunk.prices, dtype="<f8").copy(),
+    )
+
+
+def _chunk(key, days, prices, chunk=None):
+    """Fill a chunk, new unless given, with sorted days and prices"""
+    chunk = chunk or PriceSeriesChunk(**key._asdict())
+    chunk.start = EPOCH + timedelta(days=int(days[0]))
+    chunk.end = EPOCH + timedelta(days=int(days[-1]))
+    chunk.count = len(days)
+    chunk.dates = days.astype("<i4").tobytes()
+    chunk.prices = prices.astype("<f8").tobytes()
+    return chunk
+
+
+def _chunks(key, days, prices):
+    """Return new chunks holding a whole series"""
+    return [
+        _chunk(key, days[i : i + CHUNK_SIZE], prices[i : i + CHUNK_SIZE])
+        for i in range(0, len(days), CHUNK_SIZE)
+    ]
+
+
+def _locked_chunk(key, day):
+    """
+    Return the chunk a price dated `day` belongs in, locked: the last chunk
+    starting on or before it, else the series' first chunk, else None
+    """
+    chunks = PriceSeriesChunk.objects.select_for_update().filter(**key._asdict())
+    return (
+        chunks.filter(start__lte=day).order_by("-start").first()
+        or chunks.order_by("start").first()
+    )
+
+
+def add(point, price):
+    """Add a price to its series, or replace the one on the same date"""
+    day = day_number(point.date)
+    with transaction.atomic():
+        chunk = _locked_chunk(point.key, point.date)
+        if chunk is None:
+            _chunk(point.key, np.array([day]), np.array([float(price)])).save()
+            return
+        days, prices = _unpack(chunk)
+        i = np.searchsorted(days, day)
+        if i < len(days) and days[i] == day:
+            prices[i] = float(price)
+        else:
+            days = np.insert(days, i, day)
+            prices = np.insert(prices, i, float(price))
+        if len(days) > CHUNK_SIZE:
+            # An append starts a new chunk; an insert splits the full one
+            split = CHUNK_SIZE if i == CHUNK_SIZE else len(days) // 2
+            _chunk(point.key, days[split:], prices[split:]).save()
+            days, prices = days[:split], prices[:split]
+        _chunk(point.key, days, prices, chunk).save()
+
+
+def remove(point):
+    """Remove the price of a date from its series"""
+    day = day_number(point.date)
+    with transaction.atomic():
+        chunk = (
+            PriceSeriesChunk.objects.select_for_update()
+            .filter(**point.key._asdict(), start__lte=point.date, end__gte=point.date)
+            .first()
+        )
+        if chunk is None:
+            return
+        days, prices = _unpack(chunk)
+        i = np.searchsorted(days, day)
+        if i == len(days) or days[i] != day:
+            return
+        if len(days) == 1:
+            chunk.delete()
+        else:
+            _chunk(point.key, np.delete(days, i), np.delete(prices, i), chunk).save()
+
+
+def rebuild(produce_ids=None):
+    """
+    Rewrite the series of the given produce, or of all produce, from
+    ProducePrice a produce at a time. Returns the number of prices written.
+    """
+    prices = ProducePrice.objects.all()
+    if produce_ids is not None:
+        prices = prices.filter(produce_id__in=produce_ids)
+    written = 0
+    for produce_id in prices.order_by().values_list("produce_id", flat=True).distinct():
+        rows = list(
+            ProducePrice.objects.filter(produce_id=produce_id).values_list(
+                "market_day__market_id", "price_type", "market_day__date", "price"
+            )
+        )
+        markets = np.array([row[0] for row in rows])
+        types = np.array([row[1] for row in rows])
+        days = np.array([row[2] for row in rows], dtype="datetime64[D]").astype(int)
+        values = np.array([row[3] for row in rows], dtype=float)
+        order = np.lexsort((days, types, markets))
+        markets, types, days, values = (
+            markets[order],
+            types[order],
+            days[order],
+            values[order],
+        )
+        changed = np.flatnonzero(
+            (markets[1:] != markets[:-1]) | (types[1:] != types[:-1])
+        )
+        starts = np.concatenate(([0], changed + 1))
+        ends = np.append(starts[1:], len(rows))
+        chunks = []
+        for start, end in zip(starts, ends):
+            key = Key(produce_id, int(markets[start]), str(types[start]))
+            chunks += _chunks(key, days[start:end], values[start:end])
+        with transaction.atomic():
+            PriceSeriesChunk.objects.filter(produce_id=produce_id).delete()
+            PriceSeriesChunk.objects.bulk_create(chunks, batch_size=100)
+        written += len(rows)
+    # Series whose produce has no prices left
+    stale = PriceSeriesChunk.objects.exclude(produce_id__in=prices.values("produce_id"))
+    if produce_ids is not None:
+        stale = stale.filter(produce_id__in=produce_ids)
+    stale.delete()
+    return written
+
+
+def read(produce_id, price_type, market_ids=None, first=None, last=None):
+    """
+    Return the dates, as datetime64[D], and prices of a produce's series from
+    `first` to `last`, by market id
+    """
+    chunks = PriceSeriesChunk.objects.filter(
+        produce_id=produce_id, price_type=price_type
+    )
+    if market_ids is not None:
+        chunks = chunks.filter(market_id__in=market_ids)
+    if first is not None:
+        chunks = chunks.filter(end__gte=first)
+    if last is not None:
+        chunks = chunks.filter(start__lte=last)
+
+    parts = {}
+    for market_id, dates, prices in chunks.order_by("market_id", "start").values_list(
+        "market_id", "dates", "prices"
+    ):
+        days = np.frombuffer(dates, dtype="<i4")
+        lo = 0 if first is None else np.searchsorted(days, day_number(first))
+        hi = (
+            len(days)
+            if last is None
+            else np.searchsorted(days, day_number(last), side="right")
+        )
+        if lo < hi:
+            parts.setdefault(market_id, []).append(
+                (days[lo:hi], np.frombuffer(prices, dtype="<f8")[lo:hi])
+            )
+    return {
+        market_id: (
+            np.concatenate([days for days, _ in pieces]).astype("datetime64[D]"),
+            np.concatenate([prices for _, prices in pieces]),
+        )
+        for market_id, pieces in parts.items()
+    }
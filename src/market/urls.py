@@ -2,4 +2,6 @@ from django.urls import path
 
 from . import views
 
-urlpatterns = []
+urlpatterns = [
+    path("prices/<slug:slug>/", views.price_series, name="price_series"),
+]
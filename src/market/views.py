@@ -0,0 +1,57 @@
+from datetime import date
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from . import timeseries
+from .models import Market, Produce, ProducePrice
+
+
+@require_GET
+@login_required
+def price_series(request, slug):
+    """
+    The price history of a produce at each market, or at the markets given,
+    from the packed price series
+    """
+    produce = get_object_or_404(Produce, slug=slug)
+    price_type = request.GET.get("price_type", ProducePrice.PriceType.WHOLESALE)
+    if price_type not in ProducePrice.PriceType.values:
+        return HttpResponseBadRequest(
+            f"The price type must be one of {', '.join(ProducePrice.PriceType.values)}"
+        )
+    try:
+        first, last = (
+            date.fromisoformat(request.GET[name]) if request.GET.get(name) else None
+            for name in ("start_date", "end_date")
+        )
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be YYYY-MM-DD")
+    markets = None
+    if request.GET.getlist("market"):
+        markets = dict(
+            Market.objects.filter(slug__in=request.GET.getlist("market")).values_list(
+                "pk", "slug"
+            )
+        )
+    series = timeseries.read(produce.pk, price_type, markets, first, last)
+    if markets is None:
+        markets = dict(
+            Market.objects.filter(pk__in=list(series)).values_list("pk", "slug")
+        )
+    return JsonResponse(
+        {
+            "produce": produce.slug,
+            "price_type": price_type,
+            "markets": [
+                {
+                    "market": markets[market_id],
+                    "dates": dates.astype(str).tolist(),
+                    "prices": prices.tolist(),
+                }
+                for market_id, (dates, prices) in sorted(series.items())
+            ],
+        }
+    )
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from unfold.admin import ModelAdmin, TabularInline
 
+from core.filters import AutocompleteFilter, AutocompleteFilterMixin
+
 from .models import (
     AgriculturalInput,
     InputCollection,
@@ -36,6 +38,7 @@ class SubsidyProgramAdmin(ModelAdmin):
         "current_num_of_beneficiaries",
     )
     list_filter = ("level",)
+    search_fields = ("title__istartswith",)
     list_select_related = ("state", "country")
     autocomplete_fields = ("state",)
     prepopulated_fields = {"slug": ("title", "state", "program_sponsor")}
@@ -50,9 +53,13 @@ class FarmInputAdmin(ModelAdmin):
 
 
 @admin.register(SubsidyApplication)
-class SubsidyApplicationAdmin(ModelAdmin):
+class SubsidyApplicationAdmin(AutocompleteFilterMixin, ModelAdmin):
     list_display = ("farmer", "subsidy", "application_date", "approval_status")
-    list_filter = ("approval_status", "subsidy", "application_date")
+    list_filter = (
+        "approval_status",
+        ("subsidy", AutocompleteFilter),
+        "application_date",
+    )
     list_select_related = ("farmer", "subsidy")
 
 
@@ -72,10 +79,11 @@ class SubsidyDisbursementAdmin(ModelAdmin):
 class SubsidyCategoryAdmin(ModelAdmin):
     list_display = ("name",)
     list_filter = ("name",)
+    search_fields = ("name__istartswith",)
 
 
 @admin.register(SubsidyInstance)
-class SubsidyInstanceAdmin(ModelAdmin):
+class SubsidyInstanceAdmin(AutocompleteFilterMixin, ModelAdmin):
     list_display = (
         "id",
         "subsidy",
@@ -83,5 +91,5 @@ class SubsidyInstanceAdmin(ModelAdmin):
         "quantity",
         "instance_rate",
     )
-    list_filter = ("subsidy", "category")
+    list_filter = (("subsidy", AutocompleteFilter), ("category", AutocompleteFilter))
     list_select_related = ("subsidy", "category")